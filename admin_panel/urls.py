@@ -1,7 +1,7 @@
 from django.urls import path
 from .views import (
     admin_login_view,
-    admin_dashboard_stats_view,
+    admin_dashboard_stats_view, admin_rule_engine_metrics_view,
     admin_user_list_view, admin_user_toggle_view, admin_user_delete_view,
     admin_list_view, admin_create_view, admin_manage_view,
     admin_rule_list_create_view, admin_rule_detail_view,
@@ -13,6 +13,7 @@ urlpatterns = [
     path('auth/login/', admin_login_view, name='admin-login'),
     # Dashboard
     path('dashboard/stats/', admin_dashboard_stats_view, name='admin-dashboard-stats'),
+    path('metrics/rule-engine/', admin_rule_engine_metrics_view, name='admin-rule-engine-metrics'),
     # User management
     path('users/', admin_user_list_view, name='admin-user-list'),
     path('users/<int:user_id>/toggle/', admin_user_toggle_view, name='admin-user-toggle'),
@@ -106,6 +106,30 @@ def admin_dashboard_stats_view(request):
     return Response(stats)
 
 
+@api_view(['GET'])
+@authentication_classes([])
+@permission_classes([IsAdminAuthenticated])
+def admin_rule_engine_metrics_view(request):
+    """
+    GET /api/admin/metrics/rule-engine/
+    Rule engine counters and histograms from this process (rules/instrumentation.py).
+    ?output=prometheus returns the Prometheus text format instead of JSON.
+    """
+    from django.http import HttpResponse
+    from rules.instrumentation import HistogramSink, get_sink
+
+    sink = get_sink(HistogramSink)
+    if sink is None:
+        return Response(
+            {'error': 'Rule engine metrics are disabled. Add rules.instrumentation.HistogramSink '
+                      'to RULE_ENGINE_METRICS_SINKS.'},
+            status=status.HTTP_404_NOT_FOUND,
+        )
+    if request.query_params.get('output') == 'prometheus':
+        return HttpResponse(sink.prometheus(), content_type='text/plain; version=0.0.4')
+    return Response(sink.snapshot())
+
+
 @api_view(['GET'])
 @authentication_classes([])
 @permission_classes([IsAdminAuthenticated])
@@ -188,3 +188,34 @@ SIMPLE_JWT = {
 CORS_ALLOW_ALL_ORIGINS = True
 CORS_ALLOW_CREDENTIALS = True
 
+
+# Background trade imports (tradelog/importers/jobs.py)
+IMPORT_WORKER_THREADS = int(os.environ.get('IMPORT_WORKER_THREADS', 2))
+IMPORT_JOB_STALE_SECONDS = 15 * 60  # running jobs without progress this long are failed
+
+# Multi-file / .zip imports (tradelog/importers/multi.py)
+IMPORT_PARSE_PROCESSES = int(os.environ.get('IMPORT_PARSE_PROCESSES', 0)) or None  # None → one per CPU
+IMPORT_ARCHIVE_MAX_FILES = 20
+IMPORT_ARCHIVE_MAX_BYTES = 100 * 1024 * 1024  # total uncompressed size
+
+# Delta sync feed (tradelog/sync.py): rows changed within the last N seconds
+# are held back until writes that were still in flight have committed.
+SYNC_SETTLE_SECONDS = 5
+
+# Idempotency-Key replays for trade / import / batch POSTs (tradelog/idempotency.py)
+IDEMPOTENCY_KEY_TTL_HOURS = 24
+IDEMPOTENCY_IN_FLIGHT_SECONDS = 10 * 60  # an unfinished first request blocks retries this long
+
+# Compiled rule plans (rules/plan.py), kept in the default cache. With several
+# workers, point CACHES at a shared backend so rule edits reach all of them.
+RULE_PLAN_CACHE_SECONDS = 300
+
+# Rule engine instrumentation (rules/instrumentation.py). Empty = disabled.
+#   'rules.instrumentation.LogSink'        one log line per evaluation
+#   'rules.instrumentation.HistogramSink'  GET /api/admin/metrics/rule-engine/
+RULE_ENGINE_METRICS_SINKS = []
+
+# Deferred rule evaluation (rules/dispatch.py): single trade saves queue the
+# rule engine on commit instead of running it in the request.
+RULE_EVALUATION_ASYNC = os.environ.get('RULE_EVALUATION_ASYNC', '').lower() in ('1', 'true', 'yes')
+RULE_EVALUATION_WORKER_THREADS = int(os.environ.get('RULE_EVALUATION_WORKER_THREADS', 2))  # 0 → run on commit, inline
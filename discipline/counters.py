@@ -0,0 +1,348 @@
+"""
+Running Session Counters — BitsOfTrade
+======================================
+Every DisciplineSession keeps counters over its day's live trades, so the
+rule engine reads them off the session row instead of scanning trades:
+
+  trade_count        trades on the day
+  cycle_trade_count  trades created since lock_cycle_started_at
+  realized_pnl       sum of total_pnl
+  max_position       largest entry_price × quantity
+  loss_streak        losing trades in a row, counted back from the day's last
+                     closed trade — into earlier sessions when every closed
+                     trade of the day is a loss (0 on days without closed
+                     trades, which the chain skips)
+  last_closed_time   sort time of that last closed trade (where the next
+                     loss extends the streak)
+
+A single trade save moves them in place from the post_save signal
+(record_trade_change): counts and P&L by F() increments, the streak by
+appending when the trade becomes the day's last closed trade. Only changes
+that can't be applied as a difference — the largest position shrinking, a
+closed trade landing before the last one, a win turning into a loss — re-read
+that one day's trades. Batched writes refresh each touched session once
+(refresh_session_counters), and rebuild_session_counters() recomputes all of
+them from the trades table for the repair command and the migration.
+
+Trades without a trade_time sort after the timed trades of their day; ties
+are broken by created_at.
+"""
+from collections import defaultdict
+from datetime import time
+from decimal import Decimal
+
+from django.db.models import F, Max, Value
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+COUNTER_FIELDS = [
+    'trade_count',
+    'cycle_trade_count',
+    'realized_pnl',
+    'max_position',
+    'loss_streak',
+    'last_closed_time',
+]
+
+# Trade fields the counters depend on — compared between load and save
+TRADE_COUNTER_FIELDS = (
+    'trade_date', 'trade_time', 'total_pnl', 'entry_price', 'quantity', 'created_at', 'deleted_at',
+)
+
+_ROW_FIELDS = ('trade_time', 'total_pnl', 'entry_price', 'quantity', 'created_at')
+_UNTIMED = time.max
+
+
+def trade_counter_state(trade):
+    """What the counters know about a trade: its TRADE_COUNTER_FIELDS."""
+    return {name: getattr(trade, name) for name in TRADE_COUNTER_FIELDS}
+
+
+def loaded_counter_state(trade):
+    """
+    The trade's TRADE_COUNTER_FIELDS as last saved or loaded, or None for a
+    trade that wasn't fully loaded (Trade.from_db keeps the raw row; it is
+    only read here, when the trade is saved).
+    """
+    state = trade.__dict__.get('_counter_state')
+    if state is not None:
+        return state
+    values = trade.__dict__.get('_loaded_values')
+    if values is None:
+        return None
+    positions = {field.attname: i for i, field in enumerate(trade._meta.concrete_fields)}
+    return {name: values[positions[name]] for name in TRADE_COUNTER_FIELDS}
+
+
+def _sort_time(row):
+    return row['trade_time'] if row['trade_time'] is not None else _UNTIMED
+
+
+def _notional(row):
+    return (row['entry_price'] or 0) * (row['quantity'] or 0)
+
+
+def _is_loss(row):
+    return row['total_pnl'] < 0
+
+
+def _streak_for_day(closed_rows, previous_streak):
+    """
+    (loss_streak, last_closed_time) for one day's closed trades.
+    `previous_streak()` is only called when every closed trade is a loss.
+    """
+    if not closed_rows:
+        return 0, None
+    closed = sorted(closed_rows, key=lambda row: (_sort_time(row), row['created_at']))
+    streak = 0
+    for row in reversed(closed):
+        if not _is_loss(row):
+            break
+        streak += 1
+    else:
+        streak += previous_streak()
+    return streak, _sort_time(closed[-1])
+
+
+def _counters_for_day(rows, cycle_start, previous_streak):
+    """All counters for one day's live trade rows (dicts of _ROW_FIELDS)."""
+    closed = [row for row in rows if row['total_pnl'] is not None]
+    streak, last_closed_time = _streak_for_day(closed, previous_streak)
+    return {
+        'trade_count': len(rows),
+        'cycle_trade_count': sum(1 for row in rows if cycle_start is None or row['created_at'] >= cycle_start),
+        'realized_pnl': sum((row['total_pnl'] for row in closed), Decimal('0')),
+        'max_position': max((_notional(row) for row in rows), default=Decimal('0')),
+        'loss_streak': streak,
+        'last_closed_time': last_closed_time,
+    }
+
+
+# ─── Live Trades ──────────────────────────────────────────────────────────────
+
+def _day_trades(session):
+    from tradelog.models import Trade
+
+    return Trade.objects.filter(
+        user_id=session.user_id, trade_date=session.session_date, deleted_at__isnull=True,
+    )
+
+
+def _previous_streak(session):
+    """Streak of the closest earlier session that has closed trades."""
+    from discipline.models import DisciplineSession
+
+    streak = DisciplineSession.objects.filter(
+        user_id=session.user_id, session_date__lt=session.session_date, last_closed_time__isnull=False,
+    ).order_by('-session_date').values_list('loss_streak', flat=True).first()
+    return streak or 0
+
+
+def _chain_streak(session, streak, last_closed_time):
+    """The streak the next session continues from: this one's, or the one before it without closed trades."""
+    return streak if last_closed_time is not None else _previous_streak(session)
+
+
+def _cascade_loss_streak(session, old, new):
+    """
+    `session`'s streak (old/new: session.loss_streak and last_closed_time
+    before and after the change) moved, so later sessions whose streak
+    reaches back into it follow. Stops at the first later session that
+    doesn't change — every session after it depends on it, not on this one.
+    """
+    from discipline.models import DisciplineSession
+
+    if session.session_date >= timezone.localdate():
+        return  # no later sessions outside future-dated trades
+    streak = _chain_streak(session, *new)
+    if streak == _chain_streak(session, *old):
+        return
+    later_sessions = DisciplineSession.objects.filter(
+        user_id=session.user_id, session_date__gt=session.session_date, last_closed_time__isnull=False,
+    ).order_by('session_date')
+    for later in later_sessions:
+        closed = _day_trades(later).filter(total_pnl__isnull=False).values(*_ROW_FIELDS)
+        later_streak, _ = _streak_for_day(list(closed), lambda: streak)
+        if later_streak == later.loss_streak:
+            return
+        DisciplineSession.objects.filter(pk=later.pk).update(
+            loss_streak=later_streak, updated_at=timezone.now()
+        )
+        streak = later_streak
+
+
+def refresh_session_counters(session):
+    """Recompute one session's counters from its day's trades (batched writes)."""
+    from discipline.models import DisciplineSession
+
+    rows = list(_day_trades(session).values(*_ROW_FIELDS))
+    counters = _counters_for_day(rows, session.lock_cycle_started_at, lambda: _previous_streak(session))
+    old = (session.loss_streak, session.last_closed_time)
+    new = (counters['loss_streak'], counters['last_closed_time'])
+    DisciplineSession.objects.filter(pk=session.pk).update(**counters, updated_at=timezone.now())
+    for field, value in counters.items():
+        setattr(session, field, value)
+    if new != old:
+        _cascade_loss_streak(session, old, new)
+
+
+def _streak_changes(session, before, after, created):
+    """
+    Counter updates for the loss streak when one trade goes from `before` to
+    `after`, plus the streak value they lead to (None when unchanged).
+    """
+    old = before if before is not None and before['total_pnl'] is not None else None
+    new = after if after is not None and after['total_pnl'] is not None else None
+    if old is None and new is None:
+        return {}, None
+    if old is not None and new is not None and _sort_time(old) == _sort_time(new) and _is_loss(old) == _is_loss(new):
+        return {}, None  # same place in the day, same outcome
+
+    last = session.last_closed_time
+    # A new trade also goes after closed trades with the same time (created_at breaks ties)
+    if old is None and (last is None or _sort_time(new) > last or (created and _sort_time(new) == last)):
+        # Appended after the day's last closed trade
+        if not _is_loss(new):
+            changes = {'loss_streak': 0}
+            streak = 0
+        elif last is None:
+            streak = _previous_streak(session) + 1
+            changes = {'loss_streak': streak}
+        else:
+            changes = {'loss_streak': F('loss_streak') + 1}
+            streak = session.loss_streak + 1
+        changes['last_closed_time'] = _sort_time(new)
+        return changes, streak
+
+    closed = _day_trades(session).filter(total_pnl__isnull=False).values(*_ROW_FIELDS)
+    streak, last_closed_time = _streak_for_day(list(closed), lambda: _previous_streak(session))
+    return {'loss_streak': streak, 'last_closed_time': last_closed_time}, streak
+
+
+def _apply_trade_change(session, before, after, created=False):
+    """Move `session`'s counters by one live trade state change (None = not on this day)."""
+    from discipline.models import DisciplineSession
+
+    if before is None and after is None:
+        return
+    cycle_start = session.lock_cycle_started_at
+
+    def in_cycle(state):
+        return state is not None and (cycle_start is None or state['created_at'] >= cycle_start)
+
+    def pnl(state):
+        return (state['total_pnl'] or Decimal('0')) if state is not None else Decimal('0')
+
+    changes = {}
+    count_delta = (after is not None) - (before is not None)
+    if count_delta:
+        changes['trade_count'] = F('trade_count') + count_delta
+    cycle_delta = in_cycle(after) - in_cycle(before)
+    if cycle_delta:
+        changes['cycle_trade_count'] = F('cycle_trade_count') + cycle_delta
+    pnl_delta = pnl(after) - pnl(before)
+    if pnl_delta:
+        changes['realized_pnl'] = F('realized_pnl') + pnl_delta
+
+    old_position = _notional(before) if before is not None else None
+    new_position = _notional(after) if after is not None else None
+    if old_position != new_position:
+        if old_position is not None and old_position >= session.max_position and (
+            new_position is None or new_position < old_position
+        ):
+            # The largest position shrank or left the day — find the new largest
+            changes['max_position'] = _day_trades(session).aggregate(
+                top=Max(F('entry_price') * F('quantity'))
+            )['top'] or Decimal('0')
+        elif new_position is not None:
+            changes['max_position'] = Greatest(F('max_position'), Value(Decimal(new_position)))
+
+    streak_changes, streak = _streak_changes(session, before, after, created)
+    changes.update(streak_changes)
+    if not changes:
+        return
+
+    DisciplineSession.objects.filter(pk=session.pk).update(**changes, updated_at=timezone.now())
+    if streak_changes:
+        _cascade_loss_streak(
+            session,
+            (session.loss_streak, session.last_closed_time),
+            (streak, streak_changes['last_closed_time']),
+        )
+
+
+def record_trade_change(session, trade, created):
+    """
+    Apply one saved trade to the running counters (called from post_save).
+
+    `session` is the session of the trade's current date. The trade's state
+    when it was loaded (or last saved) is compared with its saved state; a
+    trade saved without that snapshot refreshes the session from scratch.
+    """
+    from discipline.models import DisciplineSession
+
+    before = None if created else loaded_counter_state(trade)
+    after = trade_counter_state(trade)
+    trade._counter_state = after
+    if before is None and not created:
+        refresh_session_counters(session)
+        return
+
+    if before is not None and before['deleted_at'] is not None:
+        before = None
+    if after['deleted_at'] is not None:
+        after = None
+
+    if before is not None and before['trade_date'] != session.session_date:
+        # The trade moved to another day: it leaves the old session
+        old_session = DisciplineSession.objects.filter(
+            user_id=session.user_id, session_date=before['trade_date'],
+        ).first()
+        if old_session is not None:
+            _apply_trade_change(old_session, before, None)
+        before = None
+    _apply_trade_change(session, before, after, created)
+
+
+# ─── Rebuild ──────────────────────────────────────────────────────────────────
+
+def rebuild_session_counters(sessions=None, trades=None, dry_run=False):
+    """
+    Recompute the counters of `sessions` from `trades` (default: every
+    session, Trade.objects) and write the ones that are out of step. Pass all
+    of a user's sessions — each streak continues from the session before it.
+
+    Returns [(session, {field: (stored, recomputed)})] for the sessions that
+    differed; with dry_run=True nothing is written.
+    """
+    if sessions is None:
+        from discipline.models import DisciplineSession
+        sessions = DisciplineSession.objects.all()
+    if trades is None:
+        from tradelog.models import Trade
+        trades = Trade.objects.all()
+
+    drifted = []
+    user_id, carried, rows_by_date = None, 0, {}
+    for session in sessions.order_by('user_id', 'session_date').iterator():
+        if session.user_id != user_id:
+            user_id, carried = session.user_id, 0
+            rows_by_date = defaultdict(list)
+            user_trades = trades.filter(user_id=user_id, deleted_at__isnull=True).values('trade_date', *_ROW_FIELDS)
+            for row in user_trades.iterator():
+                rows_by_date[row['trade_date']].append(row)
+
+        counters = _counters_for_day(
+            rows_by_date.get(session.session_date, []), session.lock_cycle_started_at, lambda: carried,
+        )
+        if counters['last_closed_time'] is not None:
+            carried = counters['loss_streak']
+        diff = {
+            field: (getattr(session, field), value)
+            for field, value in counters.items() if getattr(session, field) != value
+        }
+        if diff:
+            drifted.append((session, diff))
+            if not dry_run:
+                sessions.model.objects.filter(pk=session.pk).update(**counters, updated_at=timezone.now())
+    return drifted
@@ -0,0 +1,43 @@
+"""
+Management command to verify or repair the running session counters.
+
+Recomputes trade_count, cycle_trade_count, realized_pnl, max_position and
+loss_streak of every DisciplineSession from the trades table (see
+discipline/counters.py) and writes the ones that are out of step. Run it
+after changing trades outside the app (raw SQL, queryset updates).
+
+Usage:
+    python manage.py rebuild_session_counters
+    python manage.py rebuild_session_counters --user 42
+    python manage.py rebuild_session_counters --check     # report only, exit 1 on drift
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from discipline.counters import rebuild_session_counters
+from discipline.models import DisciplineSession
+
+
+class Command(BaseCommand):
+    help = "Recompute DisciplineSession running counters from trades."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", type=int, default=None, help="Only this user's sessions (user id)")
+        parser.add_argument("--check", action="store_true",
+                            help="Only report sessions whose counters differ; write nothing")
+
+    def handle(self, *args, **options):
+        sessions = DisciplineSession.objects.all()
+        if options["user"] is not None:
+            sessions = sessions.filter(user_id=options["user"])
+
+        drifted = rebuild_session_counters(sessions, dry_run=options["check"])
+        for session, diff in drifted:
+            changes = ", ".join(f"{field} {stored} → {actual}" for field, (stored, actual) in diff.items())
+            self.stdout.write(f"user={session.user_id} date={session.session_date}: {changes}")
+
+        if options["check"]:
+            if drifted:
+                raise CommandError(f"{len(drifted)} session(s) have out-of-step counters.")
+            self.stdout.write(self.style.SUCCESS("All session counters match their trades."))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Rebuilt counters for {len(drifted)} session(s)."))
@@ -0,0 +1,35 @@
+"""
+Management command to run deferred rule evaluations.
+
+With RULE_EVALUATION_ASYNC, web processes evaluate in their own thread pool
+after each trade save commits (rules/dispatch.py); this command runs any
+evaluation still pending (e.g. after a restart dropped the queued jobs).
+The next lock check for the session would run it as well.
+
+Usage:
+    python manage.py run_pending_evaluations
+    python manage.py run_pending_evaluations --watch --interval 5
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from rules.dispatch import run_pending_evaluations
+
+
+class Command(BaseCommand):
+    help = "Run pending (deferred) rule evaluations."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--limit", type=int, default=None, help="Run at most this many evaluations per pass")
+        parser.add_argument("--watch", action="store_true", help="Keep polling for pending evaluations")
+        parser.add_argument("--interval", type=float, default=5.0, help="Seconds between polls with --watch")
+
+    def handle(self, *args, **options):
+        while True:
+            evaluated = run_pending_evaluations(limit=options["limit"])
+            if evaluated:
+                self.stdout.write(self.style.SUCCESS(f"Ran {evaluated} pending evaluation(s)."))
+            if not options["watch"]:
+                break
+            time.sleep(options["interval"])
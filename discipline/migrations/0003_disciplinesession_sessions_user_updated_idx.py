@@ -0,0 +1,19 @@
+# Generated by Django 5.0.14 on 2026-10-17 00:35
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('discipline', '0002_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='disciplinesession',
+            index=models.Index(fields=['user', 'updated_at', 'id'], name='sessions_user_updated_idx'),
+        ),
+    ]
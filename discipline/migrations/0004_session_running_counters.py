@@ -0,0 +1,108 @@
+# Generated by Django 5.0.14 on 2026-10-17 00:47
+
+from collections import defaultdict
+from datetime import time
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.utils import timezone
+
+# Frozen copy of discipline.counters as of this migration: the backfill must
+# keep computing these counters even after the live module changes.
+_ROW_FIELDS = ('trade_time', 'total_pnl', 'entry_price', 'quantity', 'created_at')
+_UNTIMED = time.max
+
+
+def _sort_time(row):
+    return row['trade_time'] if row['trade_time'] is not None else _UNTIMED
+
+
+def _counters_for_day(rows, cycle_start, previous_streak):
+    closed = sorted(
+        (row for row in rows if row['total_pnl'] is not None),
+        key=lambda row: (_sort_time(row), row['created_at']),
+    )
+    streak = 0
+    for row in reversed(closed):
+        if row['total_pnl'] >= 0:
+            break
+        streak += 1
+    else:
+        streak += previous_streak if closed else 0
+    return {
+        'trade_count': len(rows),
+        'cycle_trade_count': sum(1 for row in rows if cycle_start is None or row['created_at'] >= cycle_start),
+        'realized_pnl': sum((row['total_pnl'] for row in closed), Decimal('0')),
+        'max_position': max(
+            ((row['entry_price'] or 0) * (row['quantity'] or 0) for row in rows), default=Decimal('0'),
+        ),
+        'loss_streak': streak,
+        'last_closed_time': _sort_time(closed[-1]) if closed else None,
+    }
+
+
+def backfill_session_counters(apps, schema_editor):
+    # Existing sessions start with their counters computed from their trades.
+    # Each streak continues from the user's closest earlier session with
+    # closed trades, so sessions are walked per user in date order.
+    DisciplineSession = apps.get_model('discipline', 'DisciplineSession')
+    Trade = apps.get_model('tradelog', 'Trade')
+
+    now = timezone.now()
+    user_id, carried, rows_by_date = None, 0, {}
+    for session in DisciplineSession.objects.order_by('user_id', 'session_date').iterator():
+        if session.user_id != user_id:
+            user_id, carried = session.user_id, 0
+            rows_by_date = defaultdict(list)
+            trades = Trade.objects.filter(user_id=user_id, deleted_at__isnull=True).values('trade_date', *_ROW_FIELDS)
+            for row in trades.iterator():
+                rows_by_date[row['trade_date']].append(row)
+
+        counters = _counters_for_day(
+            rows_by_date.get(session.session_date, []), session.lock_cycle_started_at, carried,
+        )
+        if counters['last_closed_time'] is not None:
+            carried = counters['loss_streak']
+        DisciplineSession.objects.filter(pk=session.pk).update(**counters, updated_at=now)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('discipline', '0003_disciplinesession_sessions_user_updated_idx'),
+        ('tradelog', '0011_trade_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='disciplinesession',
+            name='cycle_trade_count',
+            field=models.IntegerField(default=0, help_text='Trades created since lock_cycle_started_at'),
+        ),
+        migrations.AddField(
+            model_name='disciplinesession',
+            name='last_closed_time',
+            field=models.TimeField(blank=True, help_text='Time of the last closed trade — the streak append point', null=True),
+        ),
+        migrations.AddField(
+            model_name='disciplinesession',
+            name='loss_streak',
+            field=models.IntegerField(default=0, help_text='Losing trades in a row up to the last closed trade of this day'),
+        ),
+        migrations.AddField(
+            model_name='disciplinesession',
+            name='max_position',
+            field=models.DecimalField(decimal_places=8, default=0, help_text='Largest entry_price × quantity', max_digits=30),
+        ),
+        migrations.AddField(
+            model_name='disciplinesession',
+            name='realized_pnl',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=15),
+        ),
+        migrations.AddField(
+            model_name='disciplinesession',
+            name='trade_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_session_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.14 on 2026-10-17 00:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('discipline', '0004_session_running_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='disciplinesession',
+            name='evaluation_pending_since',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -43,6 +43,30 @@ class DisciplineSession(models.Model):
     # created AFTER this point, giving a fresh quota each cycle.
     lock_cycle_started_at = models.DateTimeField(null=True, blank=True)
 
+    # Running counters over the day's live trades, kept up to date by every
+    # trade write (discipline/counters.py) so the rule engine never has to
+    # scan trades. `manage.py rebuild_session_counters` recomputes them.
+    trade_count = models.IntegerField(default=0)
+    cycle_trade_count = models.IntegerField(
+        default=0, help_text='Trades created since lock_cycle_started_at'
+    )
+    realized_pnl = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    max_position = models.DecimalField(
+        max_digits=30, decimal_places=8, default=0, help_text='Largest entry_price × quantity'
+    )
+    loss_streak = models.IntegerField(
+        default=0, help_text='Losing trades in a row up to the last closed trade of this day'
+    )
+    last_closed_time = models.TimeField(
+        null=True, blank=True, help_text='Time of the last closed trade — the streak append point'
+    )
+
+    # Set by trade writes whose rule evaluation was queued instead of run
+    # in the request (RULE_EVALUATION_ASYNC, rules/dispatch.py): the
+    # updated_at of the oldest trade not yet evaluated. Cleared once the
+    # evaluation commits; the lock check runs it first if it is still set.
+    evaluation_pending_since = models.DateTimeField(null=True, blank=True)
+
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -50,6 +74,9 @@ class DisciplineSession(models.Model):
         db_table = 'discipline_sessions'
         unique_together = ('user', 'session_date')
         ordering = ['-session_date']
+        indexes = [
+            models.Index(fields=['user', 'updated_at', 'id'], name='sessions_user_updated_idx'),  # delta sync
+        ]
 
     def __str__(self):
         return f"Session {self.user.username} {self.session_date} [{self.session_state.upper()}]"
@@ -32,14 +32,22 @@ def run_rule_evaluation(sender, instance, created, **kwargs):
 
     trade = instance
     user = trade.user
+    trade_created = created
 
     # Get or create the DisciplineSession for this trade's date
     # Always fetch fresh from DB — never use a stale in-memory session object.
-    session, created = DisciplineSession.objects.get_or_create(
-        user=user,
-        session_date=trade.trade_date,
-        defaults={'session_state': 'green'},
-    )
+    # Exception: a session already loaded onto the trade for its date (the
+    # tradelog write path attaches it before saving) is reused, since
+    # evaluate_rules_for_user reloads it from the DB before evaluating.
+    cached = trade.session if Trade.session.is_cached(trade) else None
+    if cached is not None and cached.session_date == trade.trade_date:
+        session, created = cached, False
+    else:
+        session, created = DisciplineSession.objects.get_or_create(
+            user=user,
+            session_date=trade.trade_date,
+            defaults={'session_state': 'green'},
+        )
 
     # Ensure lock_cycle_started_at is set — it drives the per-cycle quota.
     # Use the start of the session day (midnight) so that ALL trades saved on
@@ -51,13 +59,23 @@ def run_rule_evaluation(sender, instance, created, **kwargs):
             datetime.combine(session.session_date, dtime.min)
         )
         session.lock_cycle_started_at = day_start
-        session.save(update_fields=['lock_cycle_started_at'])
+        session.save(update_fields=['lock_cycle_started_at', 'updated_at'])
 
     # Attach trade to session if not already linked
     if trade.session_id is None:
-        Trade.objects.filter(pk=trade.pk).update(session=session)
+        Trade.objects.filter(pk=trade.pk).update(session=session, updated_at=timezone.now())
         trade.session = session
 
+    # Move the session's running counters by this save before the engine reads them
+    from discipline.counters import record_trade_change
+    record_trade_change(session, trade, trade_created)
+
+    # RULE_EVALUATION_ASYNC: evaluate after commit, off the request (rules/dispatch.py)
+    from rules.dispatch import defer_evaluation, evaluation_is_async
+    if evaluation_is_async():
+        defer_evaluation(session, trade)
+        return
+
     # Delegate to the central engine. Passing `trade` enables per_trade scope.
     from rules.engine import evaluate_rules_for_user
     evaluate_rules_for_user(user=user, session=session, trade=trade)
@@ -71,5 +89,9 @@ def run_rule_evaluation(sender, instance, created, **kwargs):
         violation_type='hard',
         lock_cycle=current_cycle,
     ).exists()
-    Trade.objects.filter(pk=trade.pk).update(is_disciplined=not has_hard_violation)
+    # Trades are saved with is_disciplined=True, so usually nothing changes.
+    # A partial save may have left the stored flag out of step — always write then.
+    if trade.is_disciplined == has_hard_violation or (update_fields and 'is_disciplined' not in update_fields):
+        Trade.objects.filter(pk=trade.pk).update(is_disciplined=not has_hard_violation, updated_at=timezone.now())
+        trade.is_disciplined = not has_hard_violation
 
@@ -28,7 +28,7 @@ def current_session_view(request):
             datetime.combine(today, dtime.min)
         )
         session.lock_cycle_started_at = day_start
-        session.save(update_fields=['lock_cycle_started_at'])
+        session.save(update_fields=['lock_cycle_started_at', 'updated_at'])
     serializer = DisciplineSessionSerializer(session)
     return Response(serializer.data)
 
@@ -93,6 +93,7 @@ def unlock_session_view(request):
             session.save(update_fields=[
                 'journal_completed',
                 'trade_review_completed',
+                'updated_at',
             ])
             return Response({
                 'message': f'Cooldown active. {remaining_minutes} minute(s) remaining.',
@@ -115,6 +116,7 @@ def unlock_session_view(request):
         # Record when this new cycle started so the rule engine counts only
         # trades created from this point forward (fresh quota per cycle).
         session.lock_cycle_started_at = timezone.now()
+        session.cycle_trade_count = 0
 
         # ── FIX: Clear cooldown_ends_at on unlock so that stale timestamps
         # from this cycle can never accidentally pass the cooldown guard in
@@ -133,7 +135,16 @@ def unlock_session_view(request):
         session.journal_completed = False
         session.trade_review_completed = False
 
-    session.save()
+    # Only the unlock fields: the running trade counters (discipline/counters.py)
+    # are moved by F() updates that this instance doesn't see.
+    update_fields = ['journal_completed', 'trade_review_completed', 'updated_at']
+    if can_unlock:
+        update_fields += [
+            'session_state', 'required_actions_completed', 'unlocked_at', 'lock_cycle',
+            'lock_cycle_started_at', 'cycle_trade_count', 'cooldown_ends_at',
+            'rules_violated', 'violations_count', 'hard_violations', 'soft_violations',
+        ]
+    session.save(update_fields=update_fields)
     return Response({
         'message': 'Session unlocked.' if can_unlock else 'Action recorded. Complete required steps to unlock.',
         'session': DisciplineSessionSerializer(session).data,
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class JournalConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'journal'
+
+    def ready(self):
+        import journal.signals  # noqa: F401 — records sync tombstones for deleted journals
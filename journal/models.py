@@ -32,6 +32,9 @@ class DailyJournal(models.Model):
         db_table = 'daily_journals'
         unique_together = ('user', 'journal_date') # Enforces 1 session per user per day
         ordering = ['-journal_date']
+        indexes = [
+            models.Index(fields=['user', 'updated_at', 'id'], name='journals_user_updated_idx'),  # delta sync
+        ]
 
     def __str__(self):
         return f"Journal: {self.user.email} - {self.journal_date}"
@@ -0,0 +1,17 @@
+"""
+Delta sync tombstones — journal entries are hard-deleted, so each deletion
+is recorded for the sync feed (tradelog/sync.py) to report to clients.
+"""
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+
+@receiver(post_delete, sender='journal.DailyJournal')
+def record_journal_tombstone(sender, instance, origin=None, **kwargs):
+    from tradelog.models import SyncTombstone
+
+    # Only deletions of journal entries themselves — not the cascade from
+    # deleting the whole user, whose tombstones would be deleted with it.
+    if not isinstance(origin, sender) and getattr(origin, 'model', None) is not sender:
+        return
+    SyncTombstone.objects.create(user_id=instance.user_id, collection='journals', object_id=instance.pk)
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class RulesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'rules'
+
+    def ready(self):
+        import rules.signals  # noqa: F401 — invalidates cached rule plans on rule changes
@@ -0,0 +1,147 @@
+"""
+Deferred Rule Evaluation — BitsOfTrade
+======================================
+With RULE_EVALUATION_ASYNC = True a single trade save no longer runs the rule
+engine inside the request. The post_save signal still moves the session
+counters, then only marks the session (evaluation_pending_since) and, once
+the transaction commits, queues an evaluation of that (user, session_date)
+on a small in-process thread pool. Saves that land while one is queued are
+coalesced into it: the job reads every trade written since the mark.
+
+Lock consistency: the pre-trade lock check (rules.engine.is_session_locked)
+runs a still-pending evaluation itself before answering, under the session's
+row lock. A job already running holds that lock, so the check waits for it;
+the next trade write therefore always sees a RED/YELLOW state its
+predecessors earned, even when the job was queued in another process.
+An evaluation that fails rolls back and leaves the mark, so the next lock
+check retries it.
+
+Batched writes (imports, trade batches) keep evaluating in the request —
+they already run the engine once per session and check locks between
+sessions. `manage.py run_pending_evaluations` drains evaluations lost to a
+restart.
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import F, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+# (user_id, session_date) keys with a job submitted but not started yet
+_queued = set()
+_queued_lock = threading.Lock()
+
+
+def evaluation_is_async():
+    return getattr(settings, 'RULE_EVALUATION_ASYNC', False)
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'RULE_EVALUATION_WORKER_THREADS', 2),
+                thread_name_prefix='rule-eval',
+            )
+        return _executor
+
+
+# ─── Queueing ─────────────────────────────────────────────────────────────────
+
+def defer_evaluation(session, trade):
+    """Mark `session` as owing an evaluation for `trade` and queue it on commit."""
+    from discipline.models import DisciplineSession
+
+    DisciplineSession.objects.filter(pk=session.pk).update(
+        evaluation_pending_since=Coalesce(F('evaluation_pending_since'), Value(trade.updated_at)),
+        updated_at=timezone.now(),
+    )
+    key = (session.user_id, session.session_date)
+    transaction.on_commit(lambda: _enqueue(key))
+
+
+def _enqueue(key):
+    if not getattr(settings, 'RULE_EVALUATION_WORKER_THREADS', 2):
+        # No pool (tests, debugging): evaluate right after the commit
+        run_pending_evaluation(*key)
+        return
+    with _queued_lock:
+        if key in _queued:
+            return  # the queued job will pick this write up too
+        _queued.add(key)
+    _get_executor().submit(_run_in_thread, key)
+
+
+def _run_in_thread(key):
+    with _queued_lock:
+        # Writes committed from here on queue a new job
+        _queued.discard(key)
+    close_old_connections()
+    try:
+        run_pending_evaluation(*key)
+    except Exception:
+        logger.exception(f"Deferred rule evaluation failed for user {key[0]} on {key[1]}")
+    finally:
+        # Worker threads own their DB connection — release it when done
+        connection.close()
+
+
+# ─── Evaluation ───────────────────────────────────────────────────────────────
+
+def run_pending_evaluation(user_id, session_date):
+    """
+    Evaluate the session's pending trades if it still owes an evaluation.
+    Returns True if this call ran it, False if there was nothing to do or the
+    evaluation failed — then the session stays pending and the next lock
+    check (or run_pending_evaluations) retries it.
+    """
+    from discipline.models import DisciplineSession
+    from rules.engine import RuleEvaluationError, evaluate_rules_for_user, update_discipline_flags
+    from tradelog.models import Trade
+
+    try:
+        with transaction.atomic():
+            # Serializes with other evaluations of the session, and makes the lock
+            # check wait for an evaluation that is already running
+            session = DisciplineSession.objects.select_for_update().filter(
+                user_id=user_id, session_date=session_date,
+            ).first()
+            if session is None or session.evaluation_pending_since is None:
+                return False
+
+            trades = list(Trade.objects.filter(
+                user_id=user_id,
+                trade_date=session_date,
+                deleted_at__isnull=True,
+                updated_at__gte=session.evaluation_pending_since,
+            ).order_by('updated_at', 'created_at'))
+            evaluate_rules_for_user(user=session.user, session=session, trades=trades, raise_errors=True)
+            update_discipline_flags(session, trades)
+            DisciplineSession.objects.filter(pk=session.pk).update(
+                evaluation_pending_since=None, updated_at=timezone.now(),
+            )
+    except RuleEvaluationError:
+        return False  # logged by the engine; rolled back with the session still pending
+    return True
+
+
+def run_pending_evaluations(limit=None):
+    """Run every pending evaluation (oldest first). Returns how many ran."""
+    from discipline.models import DisciplineSession
+
+    pending = DisciplineSession.objects.filter(
+        evaluation_pending_since__isnull=False,
+    ).order_by('evaluation_pending_since').values_list('user_id', 'session_date')
+    if limit:
+        pending = pending[:limit]
+    return sum(run_pending_evaluation(user_id, session_date) for user_id, session_date in pending)
@@ -0,0 +1,248 @@
+"""
+Rule Engine Instrumentation — BitsOfTrade
+=========================================
+Every evaluate_rules_for_user() call runs inside an evaluation span that
+records:
+
+  duration_ms        wall time of the evaluation
+  queries            SQL statements it ran
+  rules_evaluated    compiled rules checked
+  rules_triggered    rules whose condition held
+  violations_logged  new ViolationsLog rows (triggered, not yet logged this cycle)
+  state_before/after session_state going in and coming out
+  failed             the evaluation raised (and was logged)
+
+Finished spans are handed to the sinks listed in RULE_ENGINE_METRICS_SINKS
+(dotted paths):
+
+  rules.instrumentation.LogSink        one `rule_evaluation ...` INFO line per span
+  rules.instrumentation.HistogramSink  in-process counters and histograms, served by
+                                       GET /api/admin/metrics/rule-engine/
+
+With no sinks configured (the default) evaluation_span() hands out a shared
+no-op span — no clock reads, no query counting.
+
+HistogramSink keeps numbers per process; with several workers each reports
+its own share.
+"""
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import connection
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+
+# ─── Spans ────────────────────────────────────────────────────────────────────
+
+class EvaluationSpan:
+    """What one rule evaluation did. The engine fills it in as it goes."""
+
+    def __init__(self, user_id, session_date, state_before):
+        self.user_id = user_id
+        self.session_date = session_date
+        self.state_before = state_before
+        self.state_after = state_before
+        self.duration_ms = 0.0
+        self.queries = 0
+        self.rules_evaluated = 0
+        self.rules_triggered = 0
+        self.violations_logged = 0
+        self.failed = False
+
+    def update(self, **fields):
+        for name, value in fields.items():
+            setattr(self, name, value)
+
+    @property
+    def transition(self):
+        """'green→yellow' when the session state changed, else None."""
+        if self.state_after == self.state_before:
+            return None
+        return f"{self.state_before}→{self.state_after}"
+
+
+class _NullSpan:
+    """Stands in for EvaluationSpan when no sink is configured."""
+
+    __slots__ = ()
+
+    def update(self, **fields):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+# ─── Sinks ────────────────────────────────────────────────────────────────────
+
+class LogSink:
+    """One structured log line per evaluation (logger `rules.instrumentation`)."""
+
+    def record(self, span):
+        logger.info(
+            "rule_evaluation user=%s date=%s duration_ms=%.2f queries=%d rules=%d "
+            "triggered=%d violations=%d state=%s→%s failed=%s",
+            span.user_id, span.session_date, span.duration_ms, span.queries, span.rules_evaluated,
+            span.rules_triggered, span.violations_logged, span.state_before, span.state_after, span.failed,
+        )
+
+
+class _Histogram:
+    """Cumulative fixed-bucket histogram (Prometheus layout)."""
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.buckets = [0] * len(bounds)
+        self.count = 0
+        self.sum = 0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.bounds):
+            if value <= bound:
+                self.buckets[i] += 1
+
+    def snapshot(self):
+        return {
+            'count': self.count,
+            'sum': round(self.sum, 3),
+            'buckets': {str(bound): n for bound, n in zip(self.bounds, self.buckets)},
+        }
+
+
+class HistogramSink:
+    """In-process totals and duration / query-count histograms for the metrics endpoint."""
+
+    DURATION_BOUNDS_MS = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000)
+    QUERY_BOUNDS = (2, 4, 6, 8, 10, 15, 20, 30, 50)
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.evaluations = 0
+            self.failures = 0
+            self.rules_evaluated = 0
+            self.rules_triggered = 0
+            self.violations_logged = 0
+            self.transitions = {}
+            self.duration_ms = _Histogram(self.DURATION_BOUNDS_MS)
+            self.queries = _Histogram(self.QUERY_BOUNDS)
+
+    def record(self, span):
+        with self._lock:
+            self.evaluations += 1
+            self.failures += span.failed
+            self.rules_evaluated += span.rules_evaluated
+            self.rules_triggered += span.rules_triggered
+            self.violations_logged += span.violations_logged
+            if span.transition:
+                self.transitions[span.transition] = self.transitions.get(span.transition, 0) + 1
+            self.duration_ms.observe(span.duration_ms)
+            self.queries.observe(span.queries)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'evaluations': self.evaluations,
+                'failures': self.failures,
+                'rules_evaluated': self.rules_evaluated,
+                'rules_triggered': self.rules_triggered,
+                'violations_logged': self.violations_logged,
+                'state_transitions': dict(self.transitions),
+                'duration_ms': self.duration_ms.snapshot(),
+                'queries': self.queries.snapshot(),
+            }
+
+    def prometheus(self):
+        """The snapshot in Prometheus text exposition format."""
+        data = self.snapshot()
+        lines = []
+        for name in ('evaluations', 'failures', 'rules_evaluated', 'rules_triggered', 'violations_logged'):
+            lines += [f"# TYPE rule_engine_{name}_total counter", f"rule_engine_{name}_total {data[name]}"]
+        lines.append("# TYPE rule_engine_state_transitions_total counter")
+        for transition, n in sorted(data['state_transitions'].items()):
+            before, after = transition.split('→')
+            lines.append(f'rule_engine_state_transitions_total{{from="{before}",to="{after}"}} {n}')
+        for name in ('duration_ms', 'queries'):
+            histogram = data[name]
+            lines.append(f"# TYPE rule_engine_{name} histogram")
+            for bound, n in histogram['buckets'].items():
+                lines.append(f'rule_engine_{name}_bucket{{le="{bound}"}} {n}')
+            lines.append(f'rule_engine_{name}_bucket{{le="+Inf"}} {histogram["count"]}')
+            lines.append(f"rule_engine_{name}_sum {histogram['sum']}")
+            lines.append(f"rule_engine_{name}_count {histogram['count']}")
+        return "\n".join(lines) + "\n"
+
+
+# ─── Sink Registry ────────────────────────────────────────────────────────────
+
+_sinks = None
+_sinks_lock = threading.Lock()
+
+
+def get_sinks():
+    """Configured sink instances, created once per process."""
+    global _sinks
+    if _sinks is None:
+        with _sinks_lock:
+            if _sinks is None:
+                _sinks = [import_string(path)() for path in getattr(settings, 'RULE_ENGINE_METRICS_SINKS', [])]
+    return _sinks
+
+
+def get_sink(sink_class):
+    """The configured sink of `sink_class`, or None."""
+    return next((sink for sink in get_sinks() if isinstance(sink, sink_class)), None)
+
+
+@receiver(setting_changed)
+def _reset_sinks(setting, **kwargs):
+    global _sinks
+    if setting == 'RULE_ENGINE_METRICS_SINKS':
+        _sinks = None
+
+
+# ─── Entry Point ──────────────────────────────────────────────────────────────
+
+@contextmanager
+def evaluation_span(user, session):
+    """
+    Time and count one rule evaluation, then pass it to every sink:
+
+        with evaluation_span(user, session) as span:
+            ...
+            span.update(rules_evaluated=5, state_after=session.session_state)
+    """
+    sinks = get_sinks()
+    if not sinks:
+        yield _NULL_SPAN
+        return
+
+    span = EvaluationSpan(user.pk, session.session_date, session.session_state)
+
+    def count_query(execute, sql, params, many, context):
+        span.queries += 1
+        return execute(sql, params, many, context)
+
+    started = time.perf_counter()
+    try:
+        with connection.execute_wrapper(count_query):
+            yield span
+    finally:
+        span.duration_ms = (time.perf_counter() - started) * 1000
+        for sink in sinks:
+            try:
+                sink.record(span)
+            except Exception:
+                logger.exception(f"Rule engine metrics sink {type(sink).__name__} failed")
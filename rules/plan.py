@@ -0,0 +1,244 @@
+"""
+Compiled Rule Plans — BitsOfTrade
+=================================
+A user's active rules (their own + admin-defined) compiled once into a list
+of CompiledRule objects: each trigger_condition is turned into a typed
+predicate with its thresholds already parsed to Decimal/int, so evaluating a
+trade is attribute reads and comparisons — no rules query, no JSON lookups.
+
+Plans are kept in the Django cache per user and dropped when a Rule is saved
+or deleted (rules/signals.py). Admin rules belong to every plan, so changing
+one invalidates all plans at once through a shared generation token instead
+of deleting each user's entry. The drop happens on commit; until then the
+transaction that changed the rule compiles its plans without caching them,
+so uncommitted (or rolled back) rules never reach the cache.
+
+Plans are stored for RULE_PLAN_CACHE_SECONDS. With the default per-process
+local-memory cache an invalidation only reaches the process that made it;
+deployments with several workers should point CACHES at a shared backend
+(Redis, Memcached, database) so rule edits apply everywhere at once.
+"""
+import logging
+import uuid
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+
+logger = logging.getLogger(__name__)
+
+_PLAN_KEY = 'rules:plan:{user_id}'
+_USER_GENERATION_KEY = 'rules:generation:user:{user_id}'
+_ADMIN_GENERATION_KEY = 'rules:generation:admin'
+
+
+# ─── Predicates ───────────────────────────────────────────────────────────────
+
+class RulePredicate:
+    """One trigger_condition, parsed. `per_day` reads the session's day facts."""
+
+    def per_day(self, user, facts):
+        return False
+
+    def per_trade(self, user, trade):
+        # Conditions without a single-trade form are checked on the day
+        return None
+
+
+class NeverPredicate(RulePredicate):
+    """Unknown or malformed condition — never triggers."""
+
+
+class DailyLossPredicate(RulePredicate):
+    """{"maxLoss": 5000, "maxDailyPercent": 3} — absolute loss or % of capital."""
+
+    def __init__(self, max_loss, max_percent):
+        self.max_loss = max_loss
+        self.max_percent = max_percent
+
+    def _exceeded(self, user, pnl):
+        if pnl >= 0:
+            return False
+        loss = abs(pnl)
+        if self.max_loss is not None and loss >= self.max_loss:
+            return True
+        if self.max_percent is not None and user.trading_capital:
+            return loss / user.trading_capital * 100 >= self.max_percent
+        return False
+
+    def per_day(self, user, facts):
+        return self._exceeded(user, facts['daily_pnl'])
+
+    def per_trade(self, user, trade):
+        return self._exceeded(user, trade.total_pnl or Decimal('0'))
+
+
+class PositionSizePredicate(RulePredicate):
+    """{"maxPositionPercent": 10} — a position above X% of capital."""
+
+    def __init__(self, max_percent):
+        self.max_percent = max_percent
+
+    def _exceeded(self, user, position_value):
+        if not self.max_percent or not user.trading_capital:
+            return False
+        return position_value / user.trading_capital * 100 > self.max_percent
+
+    def per_day(self, user, facts):
+        return self._exceeded(user, facts['max_position'])
+
+    def per_trade(self, user, trade):
+        return self._exceeded(user, (trade.entry_price or 0) * (trade.quantity or 0))
+
+
+class MaxTradesPredicate(RulePredicate):
+    """
+    {"maxTrades": 5} — trades in the current lock cycle. Counting every trade
+    on the day would hit the limit after one trade following an unlock.
+    """
+
+    def __init__(self, max_trades):
+        self.max_trades = max_trades
+
+    def per_day(self, user, facts):
+        logger.debug("[RuleEngine]   maxTrades: count=%d max=%s", facts['cycle_trade_count'], self.max_trades)
+        return self.max_trades is not None and facts['cycle_trade_count'] >= self.max_trades
+
+
+class LossStreakPredicate(RulePredicate):
+    """{"consecutiveLosses": 3} — the latest N closed trades are all losses."""
+
+    def __init__(self, limit):
+        self.limit = limit
+
+    def per_day(self, user, facts):
+        return self.limit is not None and facts['loss_streak'] >= self.limit
+
+
+def _decimal(value):
+    return Decimal(str(value)) if value is not None else None
+
+
+def _int(value):
+    return int(value) if value is not None else None
+
+
+def compile_condition(cond):
+    """trigger_condition dict → RulePredicate. Raises on malformed values."""
+    cond = cond or {}
+    if 'maxLoss' in cond or 'maxDailyPercent' in cond:
+        return DailyLossPredicate(_decimal(cond.get('maxLoss')), _decimal(cond.get('maxDailyPercent')))
+    if 'maxPositionPercent' in cond:
+        max_percent = cond.get('maxPositionPercent')
+        return PositionSizePredicate(_decimal(max_percent) if max_percent else None)
+    if 'maxTrades' in cond:
+        return MaxTradesPredicate(_int(cond.get('maxTrades')))
+    if 'consecutiveLosses' in cond:
+        return LossStreakPredicate(_int(cond.get('consecutiveLosses')))
+    return NeverPredicate()
+
+
+class CompiledRule:
+    """A Rule with its compiled predicate."""
+
+    def __init__(self, rule):
+        self.rule = rule
+        try:
+            self.predicate = compile_condition(rule.trigger_condition)
+        except (InvalidOperation, TypeError, ValueError) as e:
+            logger.warning(f"Could not compile rule {rule.id} ({rule.rule_name}): {str(e)}")
+            self.predicate = NeverPredicate()
+
+    def evaluate(self, user, facts, trade=None):
+        """
+        Respects rule.trigger_scope:
+          - 'per_day'       → the day's aggregates (facts)
+          - 'per_trade'     → only the triggering trade, for conditions that
+                              have a single-trade form (loss, position size)
+          - 'post_trigger'  → evaluated like per_day; the caller decides context
+        """
+        try:
+            if self.rule.trigger_scope == 'per_trade' and trade is not None:
+                triggered = self.predicate.per_trade(user, trade)
+                if triggered is not None:
+                    return triggered
+            return self.predicate.per_day(user, facts)
+        except Exception as e:
+            logger.warning(f"Could not evaluate rule {self.rule.id} ({self.rule.rule_name}): {str(e)}")
+            return False
+
+
+# ─── Plan Cache ───────────────────────────────────────────────────────────────
+
+def _generations(user_id, cached):
+    """Current (user, admin) generation tokens, creating missing ones."""
+    tokens = []
+    for key in (_USER_GENERATION_KEY.format(user_id=user_id), _ADMIN_GENERATION_KEY):
+        token = cached.get(key)
+        if token is None:
+            # A lost token must not revive a plan stored under an older one
+            cache.add(key, uuid.uuid4().hex, timeout=None)
+            token = cache.get(key)
+        tokens.append(token)
+    return tuple(tokens)
+
+
+class _Invalidation:
+    """on_commit callback that moves one generation token."""
+
+    def __init__(self, key):
+        self.key = key
+
+    def __call__(self):
+        cache.set(self.key, uuid.uuid4().hex, timeout=None)
+
+
+def _pending_keys():
+    """Generation keys still waiting on this transaction's commit (rolled back savepoints drop theirs)."""
+    return {
+        func.key for _, func, *_ in transaction.get_connection().run_on_commit
+        if isinstance(func, _Invalidation)
+    }
+
+
+def get_rule_plan(user):
+    """The user's active rules as CompiledRules, newest first (cached)."""
+    from rules.models import Rule
+
+    user_key = _USER_GENERATION_KEY.format(user_id=user.pk)
+    rules = Rule.objects.filter(
+        deleted_at__isnull=True,
+        is_active=True,
+    ).filter(
+        Q(is_admin_defined=True) | Q(user=user)
+    )
+    if _pending_keys() & {user_key, _ADMIN_GENERATION_KEY}:
+        # This transaction changed one of the rules — other requests can't see it yet
+        return [CompiledRule(rule) for rule in rules]
+
+    plan_key = _PLAN_KEY.format(user_id=user.pk)
+    cached = cache.get_many([plan_key, user_key, _ADMIN_GENERATION_KEY])
+    generations = _generations(user.pk, cached)
+    entry = cached.get(plan_key)
+    if entry is not None and entry[0] == generations:
+        return entry[1]
+
+    # Generations are read before the rules, so an edit that lands while this
+    # plan is compiled invalidates it rather than being lost.
+    plan = [CompiledRule(rule) for rule in rules]
+    cache.set(plan_key, (generations, plan), timeout=getattr(settings, 'RULE_PLAN_CACHE_SECONDS', 300))
+    return plan
+
+
+def invalidate_rule_plans(rule):
+    """
+    Drop the plans that include `rule` — its owner's, or every plan for an
+    admin rule — once the current transaction commits.
+    """
+    if rule.is_admin_defined or rule.user_id is None:
+        key = _ADMIN_GENERATION_KEY
+    else:
+        key = _USER_GENERATION_KEY.format(user_id=rule.user_id)
+    transaction.on_commit(_Invalidation(key))
@@ -0,0 +1,14 @@
+"""
+Drop cached rule plans (rules/plan.py) whenever a Rule changes — user rule
+edits from the rules API, admin rule edits from the admin panel, soft
+deletes (a save) and hard deletes alike.
+"""
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+
+@receiver(post_save, sender='rules.Rule')
+@receiver(post_delete, sender='rules.Rule')
+def invalidate_rule_plan_cache(sender, instance, **kwargs):
+    from rules.plan import invalidate_rule_plans
+    invalidate_rule_plans(instance)
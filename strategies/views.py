@@ -32,54 +32,27 @@ def _annotate_strategy_metrics(strategy, user_filter=None):
         if user_filter:
             qs = qs.filter(user=user_filter)
 
-        total_trades = qs.count()
-        if total_trades == 0:
-            return default_metrics
-
         # ── Only consider closed trades (exit_price set) for PnL metrics ──
-        closed_qs = qs.filter(exit_price__isnull=False)
-
-        # Recalculate pnl in Python for trades where total_pnl is null
-        # but also ensure DB-stored total_pnl is used when available.
-        # We fetch only what we need to avoid loading full objects unnecessarily.
-        closed_trades = closed_qs.values(
-            'total_pnl', 'direction', 'entry_price', 'exit_price',
-            'quantity', 'fees', 'leverage'
+        # total_pnl is always stored (see `manage.py recalculate_pnl`), so
+        # everything comes from one aggregate query.
+        closed = Q(exit_price__isnull=False)
+        stats = qs.aggregate(
+            total_trades=Count('id'),
+            closed_trades=Count('id', filter=closed),
+            wins=Count('id', filter=closed & Q(total_pnl__gt=0)),
+            net_pnl=Sum('total_pnl', filter=closed),
+            gross_profit=Sum('total_pnl', filter=closed & Q(total_pnl__gt=0)),
+            gross_loss=Sum('total_pnl', filter=closed & Q(total_pnl__lt=0)),
         )
+        total_trades = stats['total_trades']
+        if total_trades == 0:
+            return default_metrics
 
-        gross_profit = Decimal('0')
-        gross_loss = Decimal('0')
-        total_pnl = Decimal('0')
-        wins = 0
-
-        for t in closed_trades:
-            pnl = t['total_pnl']
-
-            # If total_pnl not stored, calculate on the fly
-            if pnl is None:
-                qty = t['quantity'] or Decimal('0')
-                entry = t['entry_price'] or Decimal('0')
-                exit_p = t['exit_price'] or Decimal('0')
-                fees = t['fees'] or Decimal('0')
-                leverage = t['leverage'] or Decimal('1')
-
-                if t['direction'] == 'long':
-                    raw = (exit_p - entry) * qty * leverage
-                else:
-                    raw = (entry - exit_p) * qty * leverage
-                pnl = raw - fees
-
-            pnl = Decimal(str(pnl))
-            total_pnl += pnl
-
-            if pnl > 0:
-                wins += 1
-                gross_profit += pnl
-            elif pnl < 0:
-                gross_loss += abs(pnl)
-
-        closed_count = closed_qs.count()
-        win_rate = round((wins / closed_count * 100), 2) if closed_count else 0
+        closed_count = stats['closed_trades']
+        total_pnl = stats['net_pnl'] or Decimal('0')
+        gross_profit = stats['gross_profit'] or Decimal('0')
+        gross_loss = abs(stats['gross_loss'] or Decimal('0'))
+        win_rate = round((stats['wins'] / closed_count * 100), 2) if closed_count else 0
         profit_factor = round(float(gross_profit / gross_loss), 2) if gross_loss else 0
 
         threshold = getattr(strategy, 'sample_size_threshold', 0)
@@ -231,18 +204,7 @@ def assign_trades_view(request, pk):
             status=status.HTTP_400_BAD_REQUEST
         )
 
-    count = qs.update(strategy=strategy)
-
-    # Also trigger calculate_pnl() for any closed trades missing total_pnl
-    trades_missing_pnl = Trade.objects.filter(
-        strategy=strategy,
-        deleted_at__isnull=True,
-        exit_price__isnull=False,
-        total_pnl__isnull=True,
-    )
-    for trade in trades_missing_pnl:
-        trade.calculate_pnl()
-        trade.save(update_fields=['total_pnl'])
+    count = qs.update(strategy=strategy, updated_at=timezone.now())
 
     # Recalculate maturity
     total = Trade.objects.filter(strategy=strategy, deleted_at__isnull=True).count()
@@ -0,0 +1,231 @@
+"""
+Batch trade writes — POST /api/tradelog/trades/batch/.
+
+A batch is a list of create / update / delete operations applied in one
+transaction. Every item is validated first; if any item is invalid nothing
+is written. Valid batches are written with bulk_create / bulk_update (no
+post_save per trade), then each affected session's running counters are
+refreshed and the rule engine runs once per affected session date, and
+strategy maturity is refreshed once per affected strategy.
+
+An update or delete may carry the `version` the client last read (the
+batch counterpart of If-Match): if the trade has moved on, the whole batch
+is rejected.
+"""
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Count, F, Q
+from django.utils import timezone
+
+from tradelog.models import Trade
+from tradelog.serializers import TradeManagementSerializer
+
+# Upper bound on operations per request
+TRADE_BATCH_MAX_ITEMS = 500
+
+BATCH_OPERATIONS = ('create', 'update', 'delete')
+
+# Always written for created/updated trades, on top of the edited fields
+_DERIVED_FIELDS = ['total_pnl', 'is_tagged_complete', 'session', 'version', 'updated_at']
+
+_VERSION_CONFLICT = 'The trade was modified by another request. Reload it and retry.'
+
+
+class TradeBatchError(Exception):
+    """The batch was rejected; `results` holds one entry per item."""
+
+    def __init__(self, message, results=None):
+        super().__init__(message)
+        self.results = results or []
+
+
+def apply_trade_batch(user, operations, context=None):
+    """
+    Validate and apply `operations` for `user`. Returns the per-item results.
+    Raises TradeBatchError (nothing written) if the batch or any item is invalid.
+    """
+    if not isinstance(operations, list) or not operations:
+        raise TradeBatchError('operations must be a non-empty list.')
+    if len(operations) > TRADE_BATCH_MAX_ITEMS:
+        raise TradeBatchError(f'A batch can hold at most {TRADE_BATCH_MAX_ITEMS} operations.')
+
+    planned, results = _validate(user, operations, context)
+    if any(r['status'] == 'error' for r in results):
+        raise TradeBatchError('Batch rejected — no changes were saved.', results)
+
+    with transaction.atomic():
+        _check_versions(planned, results)
+        _write(user, planned)
+
+    # One read for the final state (P&L, session, discipline flag)
+    saved = Trade.objects.in_bulk([item['trade'].pk for item in planned if item['op'] != 'delete'])
+    for item, result in zip(planned, results):
+        result['id'] = str(item['trade'].pk)
+        if item['op'] != 'delete':
+            result['trade'] = TradeManagementSerializer(saved[item['trade'].pk], context=context).data
+    return results
+
+
+def _validate(user, operations, context):
+    ids = [op.get('id') for op in operations if isinstance(op, dict) and op.get('op') in ('update', 'delete')]
+    existing = {
+        str(t.pk): t for t in Trade.objects.filter(user=user, deleted_at__isnull=True, pk__in=_valid_uuids(ids))
+    }
+
+    planned, results, seen_ids = [], [], set()
+    for index, op in enumerate(operations):
+        result = {'index': index, 'op': op.get('op') if isinstance(op, dict) else None}
+        results.append(result)
+        errors = None
+
+        if not isinstance(op, dict) or op.get('op') not in BATCH_OPERATIONS:
+            errors = {'op': [f"Must be one of: {', '.join(BATCH_OPERATIONS)}."]}
+        elif op['op'] == 'create':
+            serializer = TradeManagementSerializer(data=op.get('data') or {}, context=context)
+            if serializer.is_valid():
+                planned.append({'op': 'create', 'trade': Trade(user=user, **serializer.validated_data)})
+            else:
+                errors = serializer.errors
+        else:
+            trade_id = str(op.get('id') or '')
+            trade = existing.get(trade_id)
+            if trade is None:
+                errors = {'id': ['Trade not found.']}
+            elif trade_id in seen_ids:
+                errors = {'id': ['Trade appears more than once in this batch.']}
+            elif 'version' in op and str(op['version']) != str(trade.version):
+                errors = {'version': [_VERSION_CONFLICT]}
+            elif op['op'] == 'delete':
+                seen_ids.add(trade_id)
+                planned.append({'op': 'delete', 'trade': trade, 'version': op.get('version')})
+            else:
+                seen_ids.add(trade_id)
+                serializer = TradeManagementSerializer(trade, data=op.get('data') or {}, partial=True, context=context)
+                if serializer.is_valid():
+                    before = {'trade_date': trade.trade_date, 'strategy_id': trade.strategy_id}
+                    for attr, value in serializer.validated_data.items():
+                        setattr(trade, attr, value)
+                    planned.append({
+                        'op': 'update', 'trade': trade, 'before': before, 'version': op.get('version'),
+                        'fields': [Trade._meta.get_field(name).name for name in serializer.validated_data],
+                    })
+                else:
+                    errors = serializer.errors
+
+        if errors is None:
+            result['status'] = {'create': 'created', 'update': 'updated', 'delete': 'deleted'}[op['op']]
+        else:
+            result['status'] = 'error'
+            result['errors'] = errors
+    return planned, results
+
+
+def _check_versions(planned, results):
+    """
+    Re-check the expected versions with the rows locked, so an edit that
+    landed after validation still rejects the batch. Called inside the write
+    transaction; `planned` and `results` line up once validation passed.
+    """
+    expected = {item['trade'].pk: item['version'] for item in planned if item.get('version') is not None}
+    if not expected:
+        return
+    current = dict(
+        Trade.objects.select_for_update()
+        .filter(pk__in=expected, deleted_at__isnull=True)
+        .values_list('pk', 'version')
+    )
+    conflict = False
+    for item, result in zip(planned, results):
+        pk = item['trade'].pk
+        if pk in expected and str(current.get(pk)) != str(expected[pk]):
+            result['status'] = 'error'
+            result['errors'] = {'version': [_VERSION_CONFLICT]}
+            conflict = True
+    if conflict:
+        raise TradeBatchError('Batch rejected — no changes were saved.', results)
+
+
+def _valid_uuids(values):
+    import uuid
+    valid = []
+    for value in values:
+        try:
+            valid.append(uuid.UUID(str(value)))
+        except ValueError:
+            continue
+    return valid
+
+
+def _write(user, planned):
+    from discipline.counters import refresh_session_counters
+    from rules.engine import evaluate_rules_for_user, update_discipline_flags
+    from tradelog.importers.writer import get_session_for_date
+
+    now = timezone.now()
+    creates = [item['trade'] for item in planned if item['op'] == 'create']
+    updates = [item['trade'] for item in planned if item['op'] == 'update']
+    deletes = [item['trade'] for item in planned if item['op'] == 'delete']
+
+    sessions = {}
+    trades_by_date = defaultdict(list)   # date → created/updated trades to evaluate
+    touched_dates = set()                # every date whose trades changed
+    strategy_ids = set()
+
+    for trade in creates + updates:
+        trade.calculate_pnl()
+        trade.update_tagging_status()
+        if trade.trade_date not in sessions:
+            sessions[trade.trade_date] = get_session_for_date(user, trade.trade_date)
+        trade.session = sessions[trade.trade_date]
+        trade.updated_at = now
+        trades_by_date[trade.trade_date].append(trade)
+        touched_dates.add(trade.trade_date)
+        strategy_ids.add(trade.strategy_id)
+
+    for trade in updates:
+        # Bumped in SQL: a concurrent write may have moved the stored version
+        trade.version = F('version') + 1
+
+    update_fields = set(_DERIVED_FIELDS)
+    for item in planned:
+        if item['op'] == 'update':
+            update_fields.update(item['fields'])
+            touched_dates.add(item['before']['trade_date'])
+            strategy_ids.add(item['before']['strategy_id'])
+
+    for trade in deletes:
+        touched_dates.add(trade.trade_date)
+        strategy_ids.add(trade.strategy_id)
+
+    if creates:
+        Trade.objects.bulk_create(creates)
+    if updates:
+        Trade.objects.bulk_update(updates, sorted(update_fields))
+    if deletes:
+        Trade.objects.filter(pk__in=[t.pk for t in deletes]).update(
+            deleted_at=now, updated_at=now, version=F('version') + 1
+        )
+
+    for trade_date in sorted(touched_dates):
+        if trade_date not in sessions:
+            sessions[trade_date] = get_session_for_date(user, trade_date)
+        session = sessions[trade_date]
+        refresh_session_counters(session)
+        evaluated = trades_by_date.get(trade_date, [])
+        evaluate_rules_for_user(user=user, session=session, trades=evaluated)
+        update_discipline_flags(session, evaluated)
+
+    _refresh_strategy_maturity(strategy_ids - {None})
+
+
+def _refresh_strategy_maturity(strategy_ids):
+    from strategies.models import Strategy
+
+    if not strategy_ids:
+        return
+    strategies = Strategy.objects.filter(pk__in=strategy_ids).annotate(
+        live_trades=Count('trades', filter=Q(trades__deleted_at__isnull=True))
+    )
+    for strategy in strategies:
+        strategy.update_maturity(strategy.live_trades)
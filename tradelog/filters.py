@@ -0,0 +1,143 @@
+"""
+Trade list filters — shared by the trade list and anything else that returns
+a user's trades (e.g. exports), so one set of query parameters selects the
+same trades everywhere.
+
+    ?filter=wins|losses|disciplined|violations|all
+    ?symbol=INFY,TCS            ?strategy=<uuid>,none
+    ?market=indian_stocks       ?broker=zerodha
+    ?direction=long             ?emotional_state=calm,fomo
+    ?import_source=csv_import   ?tagged=true|false
+    ?from=YYYY-MM-DD&to=YYYY-MM-DD
+    ?min_pnl=-500&max_pnl=1000
+
+List parameters take comma-separated values; empty parameters are ignored.
+`filter`, `market` and `broker` accept `all` (no filter) like the reports API. Symbol, strategy and market filters
+are served by the partial (user, <column>, trade_date, trade_time, id)
+indexes on Trade, so filtered pages walk an index in list order.
+"""
+from django.db.models import Q
+from rest_framework import serializers
+
+from tradelog.models import Trade
+
+TRADE_QUICK_FILTERS = ('wins', 'losses', 'disciplined', 'violations')
+
+# Value of ?strategy= that selects trades without a strategy
+_NO_STRATEGY = 'none'
+
+
+class _CommaSeparatedField(serializers.Field):
+    """A comma-separated query parameter, each item validated by `child`."""
+
+    def __init__(self, child, **kwargs):
+        self.child = child
+        super().__init__(**kwargs)
+
+    def to_internal_value(self, data):
+        values = [v.strip() for v in str(data).split(',') if v.strip()]
+        if not values:
+            raise serializers.ValidationError('Provide at least one value.')
+        return [self.child.run_validation(v) for v in values]
+
+
+class TradeFilterSerializer(serializers.Serializer):
+    filter = serializers.ChoiceField(choices=TRADE_QUICK_FILTERS + ('all',), required=False)
+    symbol = _CommaSeparatedField(serializers.CharField(), required=False)
+    strategy = _CommaSeparatedField(serializers.CharField(), required=False)
+    market = serializers.CharField(required=False)
+    broker = serializers.CharField(required=False)
+    direction = serializers.ChoiceField(choices=Trade.DIRECTION_CHOICES, required=False)
+    emotional_state = _CommaSeparatedField(
+        serializers.ChoiceField(choices=Trade.EMOTIONAL_STATE_CHOICES), required=False
+    )
+    import_source = serializers.ChoiceField(choices=Trade.IMPORT_SOURCE_CHOICES, required=False)
+    tagged = serializers.BooleanField(required=False)
+    # `from` is a keyword, so the date range parameters are renamed in to_internal_value()
+    from_date = serializers.DateField(required=False)
+    to_date = serializers.DateField(required=False)
+    min_pnl = serializers.DecimalField(max_digits=15, decimal_places=2, required=False)
+    max_pnl = serializers.DecimalField(max_digits=15, decimal_places=2, required=False)
+
+    def to_internal_value(self, data):
+        data = {k: v for k, v in data.items() if v != '' and (k in self.fields or k in ('from', 'to'))}
+        if 'from' in data:
+            data['from_date'] = data.pop('from')
+        if 'to' in data:
+            data['to_date'] = data.pop('to')
+        return super().to_internal_value(data)
+
+    def validate_market(self, value):
+        if value != 'all' and value not in dict(Trade.MARKET_CHOICES):
+            raise serializers.ValidationError(f'"{value}" is not a valid choice.')
+        return value
+
+    def validate_strategy(self, values):
+        import uuid
+        ids = []
+        for value in values:
+            if value == _NO_STRATEGY:
+                ids.append(None)
+                continue
+            try:
+                ids.append(uuid.UUID(value))
+            except ValueError:
+                raise serializers.ValidationError(f'"{value}" is not a valid strategy id.')
+        return ids
+
+    def validate(self, attrs):
+        if attrs.get('from_date') and attrs.get('to_date') and attrs['from_date'] > attrs['to_date']:
+            raise serializers.ValidationError({'from': ['Must not be after `to`.']})
+        if (attrs.get('min_pnl') is not None and attrs.get('max_pnl') is not None
+                and attrs['min_pnl'] > attrs['max_pnl']):
+            raise serializers.ValidationError({'min_pnl': ['Must not be greater than `max_pnl`.']})
+        return attrs
+
+
+def filter_trades(qs, params):
+    """
+    Apply the trade list query parameters to `qs`.
+    Raises rest_framework ValidationError (→ 400) on malformed values.
+    """
+    serializer = TradeFilterSerializer(data=params)
+    serializer.is_valid(raise_exception=True)
+    f = serializer.validated_data
+
+    quick = f.get('filter')
+    if quick == 'wins':
+        qs = qs.filter(total_pnl__gt=0)
+    elif quick == 'losses':
+        qs = qs.filter(total_pnl__lt=0)
+    elif quick == 'disciplined':
+        qs = qs.filter(is_disciplined=True)
+    elif quick == 'violations':
+        qs = qs.filter(is_disciplined=False)
+
+    if f.get('symbol'):
+        qs = qs.filter(symbol__in=f['symbol'])
+    if f.get('strategy'):
+        condition = Q(strategy_id__in=[i for i in f['strategy'] if i is not None])
+        if None in f['strategy']:
+            condition |= Q(strategy__isnull=True)
+        qs = qs.filter(condition)
+    if f.get('market') and f['market'] != 'all':
+        qs = qs.filter(market_type=f['market'])
+    if f.get('broker') and f['broker'] != 'all':
+        qs = qs.filter(broker_name__iexact=f['broker'])
+    if f.get('direction'):
+        qs = qs.filter(direction=f['direction'])
+    if f.get('emotional_state'):
+        qs = qs.filter(emotional_state__in=f['emotional_state'])
+    if f.get('import_source'):
+        qs = qs.filter(import_source=f['import_source'])
+    if 'tagged' in f:
+        qs = qs.filter(is_tagged_complete=f['tagged'])
+    if f.get('from_date'):
+        qs = qs.filter(trade_date__gte=f['from_date'])
+    if f.get('to_date'):
+        qs = qs.filter(trade_date__lte=f['to_date'])
+    if f.get('min_pnl') is not None:
+        qs = qs.filter(total_pnl__gte=f['min_pnl'])
+    if f.get('max_pnl') is not None:
+        qs = qs.filter(total_pnl__lte=f['max_pnl'])
+    return qs
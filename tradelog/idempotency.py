@@ -0,0 +1,138 @@
+"""
+Idempotency-Key support for write endpoints.
+
+A client sends `Idempotency-Key: <unique string>` with a POST. The first
+request claims the key (an IdempotencyKey row with no response yet), runs,
+and stores its response if it succeeded. A retry with the same key replays
+the stored response — the write path and the rule engine do not run again.
+
+  same key, different request body   → 422
+  same key, first request still busy → 409
+  first request failed (non-2xx)     → key released, retry runs normally
+
+A key whose first request never finished (the process died before it could
+release the key) counts as busy for IDEMPOTENCY_IN_FLIGHT_SECONDS only; the
+next retry after that takes it over. Keys expire after IDEMPOTENCY_KEY_TTL_HOURS; `manage.py purge_idempotency_keys`
+deletes expired rows.
+"""
+import functools
+import hashlib
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from tradelog.models import IdempotencyKey
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+REPLAY_HEADER = 'Idempotent-Replayed'
+MAX_KEY_LENGTH = 255
+
+
+def idempotency_ttl():
+    return timedelta(hours=getattr(settings, 'IDEMPOTENCY_KEY_TTL_HOURS', 24))
+
+
+def in_flight_timeout():
+    return timedelta(seconds=getattr(settings, 'IDEMPOTENCY_IN_FLIGHT_SECONDS', 10 * 60))
+
+
+def _file_digest(f):
+    digest = hashlib.sha256()
+    for chunk in f.chunks():
+        digest.update(chunk)
+    f.seek(0)
+    return f'file:{f.name}:{digest.hexdigest()}'
+
+
+def request_fingerprint(request):
+    """SHA-256 of method, path and body (uploaded files by content)."""
+    data = request.data
+    if hasattr(data, 'lists'):  # QueryDict (form / multipart, files included)
+        body = sorted(
+            (key, [_file_digest(v) if isinstance(v, UploadedFile) else v for v in values])
+            for key, values in data.lists()
+        )
+    else:
+        body = data
+    payload = json.dumps([request.method, request.path, body], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _claim(user, key, endpoint, fingerprint):
+    """Create the key row, or return the existing live one."""
+    for _ in range(2):
+        try:
+            with transaction.atomic():
+                return IdempotencyKey.objects.create(
+                    user=user, key=key, endpoint=endpoint, request_hash=fingerprint,
+                ), True
+        except IntegrityError:
+            existing = IdempotencyKey.objects.filter(user=user, key=key).first()
+            if existing is None:
+                continue  # released between our insert and read
+            now = timezone.now()
+            if existing.created_at < now - idempotency_ttl():
+                existing.delete()
+                continue
+            if existing.status_code is None and existing.created_at < now - in_flight_timeout():
+                # Abandoned mid-request; conditional so only one retry takes it over
+                IdempotencyKey.objects.filter(pk=existing.pk, status_code__isnull=True).delete()
+                continue
+            return existing, False
+    raise IntegrityError('Could not claim idempotency key.')
+
+
+def idempotent(handler):
+    """Decorator for APIView post/create methods — see module docstring."""
+
+    @functools.wraps(handler)
+    def wrapper(self, request, *args, **kwargs):
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if not key:
+            return handler(self, request, *args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return Response(
+                {'error': f'{IDEMPOTENCY_HEADER} must be at most {MAX_KEY_LENGTH} characters.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        endpoint = f'{request.method} {request.path}'
+        fingerprint = request_fingerprint(request)
+        record, created = _claim(request.user, key, endpoint, fingerprint)
+
+        if not created:
+            if record.request_hash != fingerprint:
+                return Response(
+                    {'error': f'{IDEMPOTENCY_HEADER} was already used for a different request.'},
+                    status=status.HTTP_422_UNPROCESSABLE_ENTITY
+                )
+            if record.status_code is None:
+                return Response(
+                    {'error': f'A request with this {IDEMPOTENCY_HEADER} is still being processed.'},
+                    status=status.HTTP_409_CONFLICT
+                )
+            response = Response(record.response_body, status=record.status_code)
+            response[REPLAY_HEADER] = 'true'
+            return response
+
+        response = None
+        try:
+            response = handler(self, request, *args, **kwargs)
+        finally:
+            if response is None or not 200 <= response.status_code < 300:
+                # Not stored: a retry (e.g. after a session unlock or a crash) runs for real
+                record.delete()
+
+        if 200 <= response.status_code < 300:
+            record.status_code = response.status_code
+            record.response_body = response.data
+            record.save(update_fields=['status_code', 'response_body'])
+        return response
+
+    return wrapper
@@ -0,0 +1,138 @@
+"""
+Shared execution-leg aggregation for the broker normalizers.
+
+Broker modules only map their columns onto Leg tuples; aggregate_legs()
+folds the legs into one normalized trade row per group in a single pass.
+Each group keeps running buy/sell quantity and quantity×price sums instead
+of lists of legs, so memory stays proportional to the number of groups.
+"""
+from collections import namedtuple
+from decimal import Decimal, ROUND_HALF_UP
+
+MARKET_TYPE_BY_SEGMENT = {
+    'FO':  'options',
+    'EQ':  'indian_stocks',
+    'CDS': 'forex',
+    'COM': 'indian_stocks',
+    'MF':  'indian_stocks',
+}
+
+_ZERO = Decimal('0')
+_PRICE_QUANTUM = Decimal('0.0001')
+
+# One execution leg as mapped by a broker module.
+#   key       → grouping key (e.g. (symbol, trade_date))
+#   side      → 'buy' / 'sell'; any other value still registers the group and
+#               its segment/exchange but is not counted
+#   date      → ISO trade date of the leg (the group uses the earliest)
+#   time      → parsed execution datetime or None
+#   time_str  → raw time text, used only when no leg of the group has `time`
+Leg = namedtuple('Leg', 'key symbol side qty price date time time_str segment exchange')
+
+
+class _Group:
+    __slots__ = (
+        'symbol', 'segment', 'exchange', 'date', 'time',
+        'buy_legs', 'buy_qty', 'buy_value', 'buy_time_str',
+        'sell_legs', 'sell_qty', 'sell_value', 'sell_time_str',
+    )
+
+    def __init__(self, symbol):
+        self.symbol = symbol
+        self.segment = ''
+        self.exchange = ''
+        self.date = ''
+        self.time = None
+        self.buy_legs = self.sell_legs = 0
+        self.buy_qty = self.buy_value = self.sell_qty = self.sell_value = _ZERO
+        self.buy_time_str = self.sell_time_str = ''
+
+
+def _vwap(qty, value):
+    """(VWAP, total quantity) — (0, 0) for an empty side, like the old per-broker vwap()."""
+    if qty == 0:
+        return _ZERO, _ZERO
+    return (value / qty).quantize(_PRICE_QUANTUM, rounding=ROUND_HALF_UP), qty
+
+
+def aggregate_legs(legs, time_format='%H:%M'):
+    """
+    Fold execution legs into normalized trade rows, one per group key, in
+    first-seen order.
+
+    Direction is long when bought quantity ≥ sold quantity; the entry price
+    is the VWAP of that side and the exit price the VWAP of the other side
+    (blank when it has no legs). The trade time is the earliest execution
+    time formatted with `time_format`.
+    """
+    groups = {}
+
+    for leg in legs:
+        group = groups.get(leg.key)
+        if group is None:
+            group = groups[leg.key] = _Group(leg.symbol)
+        group.segment = leg.segment
+        group.exchange = leg.exchange
+
+        if leg.side == 'buy':
+            group.buy_legs += 1
+            group.buy_qty += leg.qty
+            group.buy_value += leg.qty * leg.price
+            if not group.buy_time_str:
+                group.buy_time_str = leg.time_str
+        elif leg.side == 'sell':
+            group.sell_legs += 1
+            group.sell_qty += leg.qty
+            group.sell_value += leg.qty * leg.price
+            if not group.sell_time_str:
+                group.sell_time_str = leg.time_str
+        else:
+            continue
+
+        if leg.date and (not group.date or leg.date < group.date):
+            group.date = leg.date
+        if leg.time is not None and (group.time is None or leg.time < group.time):
+            group.time = leg.time
+
+    normalized = []
+
+    for group in groups.values():
+        if not group.buy_legs and not group.sell_legs:
+            continue
+        if not group.date:
+            continue
+
+        buy_vwap, total_buy_qty = _vwap(group.buy_qty, group.buy_value)
+        sell_vwap, total_sell_qty = _vwap(group.sell_qty, group.sell_value)
+
+        direction = 'long' if total_buy_qty >= total_sell_qty else 'short'
+
+        if direction == 'long':
+            entry_price = buy_vwap
+            exit_price = sell_vwap if group.sell_legs else None
+            quantity = total_buy_qty
+        else:
+            entry_price = sell_vwap
+            exit_price = buy_vwap if group.buy_legs else None
+            quantity = total_sell_qty
+
+        if group.time is not None:
+            trade_time_str = group.time.strftime(time_format)
+        else:
+            trade_time_str = group.buy_time_str or group.sell_time_str
+
+        normalized.append({
+            'symbol': group.symbol,
+            'trade_date': group.date,
+            'time': trade_time_str,
+            'direction': direction,
+            'quantity': str(quantity),
+            'entry_price': str(entry_price),
+            'exit_price': str(exit_price) if exit_price is not None else '',
+            'fees': '0',
+            'market_type': MARKET_TYPE_BY_SEGMENT.get(group.segment, 'indian_stocks'),
+            'exchange': group.exchange,
+            'segment': group.segment,
+        })
+
+    return normalized
@@ -0,0 +1,166 @@
+"""
+Per-file date/time format sniffing for broker imports.
+
+A broker export uses one date format per column, so instead of trying every
+candidate format with strptime on every row, a DateTimeSniffer detects the
+column's format and compiles it into a regex-based parser. Later rows go
+through that fast parser; only a row that does not match falls back to
+trying the candidate formats again.
+
+Some values fit several candidates — 03/04/2025 is valid day-first and
+month-first. The sniffer keeps every candidate that fits all values seen so
+far and only settles on a format once a value rules the others out (e.g.
+25/03/2025). Until then, values are parsed with the first remaining
+candidate in priority order. Rows are parsed as they stream in, so rows read
+before the deciding value keep that reading; a file whose dates are all
+ambiguous is read with the preferred format throughout.
+"""
+import re
+from datetime import datetime
+
+# strptime directive → (regex group, datetime component)
+_DIRECTIVES = {
+    'Y': (r'(\d{4})', 'year'),
+    'y': (r'(\d{2})', 'year2'),
+    'm': (r'(\d{1,2})', 'month'),
+    'd': (r'(\d{1,2})', 'day'),
+    'H': (r'(\d{1,2})', 'hour'),
+    'I': (r'(\d{1,2})', 'hour12'),
+    'M': (r'(\d{1,2})', 'minute'),
+    'S': (r'(\d{1,2})', 'second'),
+    'p': (r'([AaPp][Mm])', 'ampm'),
+}
+
+
+def compile_format(fmt):
+    """
+    Compile a strptime format into a fast parser: value → datetime or None.
+    Formats with directives outside _DIRECTIVES fall back to strptime with
+    that single format.
+    """
+    pattern = []
+    components = []
+    i = 0
+    while i < len(fmt):
+        ch = fmt[i]
+        if ch == '%' and i + 1 < len(fmt):
+            directive = fmt[i + 1]
+            if directive not in _DIRECTIVES:
+                return _strptime_parser(fmt)
+            group, component = _DIRECTIVES[directive]
+            pattern.append(group)
+            components.append(component)
+            i += 2
+        else:
+            pattern.append(re.escape(ch))
+            i += 1
+
+    match = re.compile(''.join(pattern)).fullmatch
+
+    def parse(value):
+        m = match(value)
+        if m is None:
+            return None
+        parts = {'year': 1900, 'month': 1, 'day': 1, 'hour': 0, 'minute': 0, 'second': 0}
+        ampm = None
+        for component, raw in zip(components, m.groups()):
+            if component == 'ampm':
+                ampm = raw.upper()
+            elif component == 'year2':
+                # Same pivot as strptime: 69–99 → 1900s, 00–68 → 2000s
+                year = int(raw)
+                parts['year'] = year + (1900 if year >= 69 else 2000)
+            elif component == 'hour12':
+                hour = int(raw)
+                if not 1 <= hour <= 12:
+                    return None
+                parts['hour'] = hour % 12
+            else:
+                parts[component] = int(raw)
+        if ampm == 'PM':
+            parts['hour'] += 12
+        try:
+            return datetime(**parts)
+        except ValueError:
+            return None
+
+    return parse
+
+
+def _strptime_parser(fmt):
+    def parse(value):
+        try:
+            return datetime.strptime(value, fmt)
+        except ValueError:
+            return None
+    return parse
+
+
+class DateTimeSniffer:
+    """
+    Parse one column of date/time strings whose format is unknown up front.
+
+    Args:
+        formats: Candidate strptime formats, in priority order.
+        name:    Column label used when reporting the detected format.
+        report:  Optional dict; the detected format is stored under `name`
+                 so import responses can show it.
+    """
+
+    def __init__(self, formats, name='', report=None):
+        self.formats = tuple(formats)
+        self.name = name
+        self.report = report
+        self.format = None    # format in use: the settled one, or the preferred candidate
+        self.mismatches = 0   # rows that needed the per-row fallback
+        self.ambiguous = 0    # rows parsed while several candidates still fitted
+        self._candidates = [(fmt, compile_format(fmt)) for fmt in self.formats]
+        self._fast = None
+
+    def parse(self, value):
+        """Return a datetime, or None if no candidate format matches."""
+        if not value:
+            return None
+
+        if self._fast is not None:
+            parsed = self._fast(value)
+            if parsed is not None:
+                return parsed
+            self.mismatches += 1
+            return self._fallback(value)
+
+        matches = [(fmt, parser, parser(value)) for fmt, parser in self._candidates]
+        matches = [match for match in matches if match[2] is not None]
+        if not matches:
+            if self.format is None:
+                return None
+            # Fits none of the remaining candidates, only a ruled-out one
+            self.mismatches += 1
+            return self._fallback(value)
+
+        self._candidates = [(fmt, parser) for fmt, parser, _ in matches]
+        if len(matches) == 1:
+            self._fast = matches[0][1]
+        else:
+            self.ambiguous += 1
+        self._use(matches[0][0])
+        return matches[0][2]
+
+    def _fallback(self, value):
+        # The remaining candidates were just tried; only ruled-out formats are left
+        tried = {fmt for fmt, _ in self._candidates}
+        for fmt in self.formats:
+            if fmt in tried:
+                continue
+            try:
+                return datetime.strptime(value, fmt)
+            except ValueError:
+                continue
+        return None
+
+    def _use(self, fmt):
+        if fmt == self.format:
+            return
+        self.format = fmt
+        if self.report is not None and self.name:
+            self.report[self.name] = fmt
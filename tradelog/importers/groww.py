@@ -1,12 +1,23 @@
-from collections import defaultdict
-from datetime import datetime
 from decimal import Decimal, ROUND_HALF_UP
 
-def normalize_groww(raw_rows):
-    """
-    Groww order history CSV/Excel — one row per executed order leg.
-    """
-    groups = defaultdict(lambda: {'buys': [], 'sells': [], 'exchange': ''})
+from .aggregate import Leg, aggregate_legs
+from .dates import DateTimeSniffer
+
+EXECUTION_DATETIME_FORMATS = (
+    '%d-%m-%Y %I:%M %p',
+    '%d-%m-%Y %H:%M',
+    '%Y-%m-%d %H:%M:%S',
+    '%d/%m/%Y %I:%M %p',
+    '%d/%m/%Y %H:%M',
+)
+# Used on the date part alone when the full value matches none of the above
+EXECUTION_DATE_FORMATS = ('%d-%m-%Y', '%Y-%m-%d', '%d/%m/%Y')
+
+
+def iter_groww_legs(raw_rows, formats=None):
+    """Map executed Groww order rows onto execution legs grouped by symbol."""
+    datetime_parser = DateTimeSniffer(EXECUTION_DATETIME_FORMATS, name='execution_date_and_time', report=formats)
+    date_parser = DateTimeSniffer(EXECUTION_DATE_FORMATS, name='execution_date', report=formats)
 
     for row in raw_rows:
         order_status = row.get('order_status', '').strip().lower()
@@ -18,35 +29,14 @@ def normalize_groww(raw_rows):
             continue
 
         exec_datetime_raw = row.get('execution_date_and_time', '').strip()
-        trade_date_raw = ''
         exec_time = None
-
         if exec_datetime_raw:
-            for fmt in (
-                '%d-%m-%Y %I:%M %p',
-                '%d-%m-%Y %H:%M',
-                '%Y-%m-%d %H:%M:%S',
-                '%d/%m/%Y %I:%M %p',
-                '%d/%m/%Y %H:%M',
-            ):
-                try:
-                    exec_time = datetime.strptime(exec_datetime_raw, fmt)
-                    trade_date_raw = exec_time.strftime('%Y-%m-%d')
-                    break
-                except ValueError:
-                    continue
-
-            if not trade_date_raw:
+            exec_time = datetime_parser.parse(exec_datetime_raw)
+            if exec_time is None:
                 date_token = exec_datetime_raw.split()[0] if exec_datetime_raw.split() else ''
-                for dfmt in ('%d-%m-%Y', '%Y-%m-%d', '%d/%m/%Y'):
-                    try:
-                        exec_time = datetime.strptime(date_token, dfmt)
-                        trade_date_raw = exec_time.strftime('%Y-%m-%d')
-                        break
-                    except ValueError:
-                        continue
+                exec_time = date_parser.parse(date_token)
 
-        if not trade_date_raw:
+        if exec_time is None:
             continue
 
         trade_type = row.get('type', '').strip().lower()
@@ -58,68 +48,27 @@ def normalize_groww(raw_rows):
         except Exception:
             continue
 
-        key = symbol
-        groups[key]['exchange'] = row.get('exchange', 'NSE').strip().upper()
-
-        entry = {'qty': qty, 'price': price, 'time': exec_time, 'date': trade_date_raw}
-
-        if trade_type == 'buy':
-            groups[key]['buys'].append(entry)
-        elif trade_type == 'sell':
-            groups[key]['sells'].append(entry)
-
-    normalized = []
-
-    for symbol, data in groups.items():
-        buys = data['buys']
-        sells = data['sells']
-        exchange = data['exchange']
-
-        if not buys and not sells:
-            continue
-
-        def vwap(legs):
-            total_qty = sum(l['qty'] for l in legs)
-            if total_qty == 0:
-                return Decimal('0'), Decimal('0')
-            total_value = sum(l['qty'] * l['price'] for l in legs)
-            return (total_value / total_qty).quantize(Decimal('0.0001'), rounding=ROUND_HALF_UP), total_qty
-
-        buy_vwap, total_buy_qty = vwap(buys)
-        sell_vwap, total_sell_qty = vwap(sells)
-
-        direction = 'long' if total_buy_qty >= total_sell_qty else 'short'
-
-        if direction == 'long':
-            entry_price = buy_vwap
-            exit_price = sell_vwap if sells else None
-            quantity = total_buy_qty
-        else:
-            entry_price = sell_vwap
-            exit_price = buy_vwap if buys else None
-            quantity = total_sell_qty
-
-        all_legs = buys + sells
-        all_dates = [l['date'] for l in all_legs if l.get('date')]
-        trade_date_raw = min(all_dates) if all_dates else ''
-        if not trade_date_raw:
-            continue
-
-        all_times = [l['time'] for l in all_legs if l.get('time') is not None]
-        trade_time_str = min(all_times).strftime('%H:%M') if all_times else ''
-
-        normalized.append({
-            'symbol': symbol,
-            'trade_date': trade_date_raw,
-            'time': trade_time_str,
-            'direction': direction,
-            'quantity': str(quantity),
-            'entry_price': str(entry_price),
-            'exit_price': str(exit_price) if exit_price is not None else '',
-            'fees': '0',
-            'market_type': 'indian_stocks',
-            'exchange': exchange,
-            'segment': 'EQ',
-        })
-
-    return normalized
\ No newline at end of file
+        yield Leg(
+            key=symbol,
+            symbol=symbol,
+            side=trade_type,
+            qty=qty,
+            price=price,
+            date=exec_time.strftime('%Y-%m-%d'),
+            time=exec_time,
+            time_str='',
+            segment='EQ',
+            exchange=row.get('exchange', 'NSE').strip().upper(),
+        )
+
+
+def normalize_groww(raw_rows, formats=None, lots=None):
+    """
+    Groww order history CSV/Excel — one row per executed order leg.
+    The detected execution date/time format is recorded in `formats` if given.
+    With a LotMatcher as `lots`, legs are matched into round trips instead (see lots.py).
+    """
+    legs = iter_groww_legs(raw_rows, formats)
+    if lots is not None:
+        return lots.match(legs, broker='groww', time_format='%H:%M')
+    return aggregate_legs(legs, time_format='%H:%M')
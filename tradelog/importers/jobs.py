@@ -0,0 +1,203 @@
+"""
+Background import worker.
+
+ImportJob rows form a DB-backed queue; no external broker is needed.
+Web processes hand new jobs to a small in-process thread pool once the
+creating transaction commits. A worker claims a job with a conditional
+UPDATE (queued → running), so the same job is never processed twice even
+when `manage.py process_import_jobs` drains the queue from another process
+(e.g. after a restart left jobs queued).
+
+A running job refreshes updated_at with every progress report. When a
+worker dies mid-job nothing else would ever finish it, so run_queued_jobs
+first fails running jobs that have gone IMPORT_JOB_STALE_SECONDS without
+progress; the user can upload the file again (already imported rows are
+skipped by fingerprint).
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.utils import timezone
+
+from tradelog.models import ImportJob
+from .lots import LotMatcher
+from .parser import iter_upload_rows, detect_and_normalize
+from .writer import run_import
+
+logger = logging.getLogger(__name__)
+
+# Cap on the stored per-row error report so a fully broken file cannot
+# bloat the job row.
+MAX_JOB_ERRORS = 5000
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'IMPORT_WORKER_THREADS', 2),
+                thread_name_prefix='import-job',
+            )
+        return _executor
+
+
+def enqueue_import_job(job):
+    """Schedule `job` on the local worker pool after the current transaction commits."""
+    job_id = job.pk
+    transaction.on_commit(lambda: _get_executor().submit(_run_in_thread, job_id))
+
+
+def _run_in_thread(job_id):
+    close_old_connections()
+    try:
+        run_import_job(job_id)
+    finally:
+        # Worker threads own their DB connection — release it when done
+        connection.close()
+
+
+class JobAbandoned(Exception):
+    """The job stopped being 'running' under its worker (fail_stale_jobs gave up on it)."""
+
+
+def claim_job(job_id):
+    """Atomically move a job from queued to running. Returns True if this caller won."""
+    return ImportJob.objects.filter(pk=job_id, status='queued').update(
+        status='running', started_at=timezone.now(), updated_at=timezone.now(),
+    ) == 1
+
+
+# Written when the job finishes
+_FINAL_FIELDS = (
+    'detected_broker', 'detected_formats', 'rows_parsed', 'rows_inserted', 'rows_failed', 'rows_blocked',
+    'rows_skipped', 'rows_updated', 'errors', 'error_message', 'status',
+)
+
+
+def _apply_stats(job, stats):
+    job.rows_parsed = stats.parsed
+    job.rows_inserted = stats.imported
+    job.rows_failed = stats.failed
+    job.rows_blocked = stats.blocked
+    job.rows_skipped = stats.skipped
+    job.rows_updated = stats.updated
+
+
+def run_import_job(job_id):
+    """
+    Process one queued job end to end. Returns False without doing anything
+    if another worker already claimed it.
+
+    Every write to the job row is conditional on it still being 'running':
+    when fail_stale_jobs gave up on a slow worker, the next progress report
+    stops the import (rows already committed stay), the job keeps the
+    'failed' status its client was shown, and this returns False.
+    """
+    if not claim_job(job_id):
+        return False
+
+    job = ImportJob.objects.select_related('user').get(pk=job_id)
+    running = ImportJob.objects.filter(pk=job_id, status='running')
+
+    def save_progress(stats):
+        # Keep the instance in step so the final save never rolls counters back
+        _apply_stats(job, stats)
+        if not running.update(
+            rows_parsed=job.rows_parsed,
+            rows_inserted=job.rows_inserted,
+            rows_failed=job.rows_failed,
+            rows_blocked=job.rows_blocked,
+            rows_skipped=job.rows_skipped,
+            rows_updated=job.rows_updated,
+            updated_at=timezone.now(),
+        ):
+            raise JobAbandoned()
+
+    abandoned = False
+    try:
+        with job.file.open('rb') as f:
+            raw_rows = iter_upload_rows(f, job.original_filename)
+            lots = LotMatcher(job.lot_matching, user=job.user) if job.lot_matching else None
+            job.detected_broker, rows = detect_and_normalize(
+                raw_rows, job.broker_name, formats=job.detected_formats, lots=lots,
+            )
+            running.update(detected_broker=job.detected_broker)
+
+            stats = run_import(
+                rows, job.user, job.detected_broker or job.broker_name,
+                mode=job.mode, on_duplicate=job.on_duplicate, max_errors=MAX_JOB_ERRORS, progress=save_progress,
+                detected_formats=job.detected_formats,
+            )
+
+        _apply_stats(job, stats)
+        job.errors = stats.errors
+        job.status = 'completed'
+    except JobAbandoned:
+        abandoned = True
+    except Exception as e:
+        logger.exception(f"Import job {job.pk} failed")
+        job.status = 'failed'
+        job.error_message = str(e)
+
+    finished = not abandoned and running.update(
+        **{field: getattr(job, field) for field in _FINAL_FIELDS},
+        finished_at=timezone.now(), updated_at=timezone.now(),
+    )
+    if not finished:
+        logger.warning(f"Import job {job.pk} was abandoned while running; its result is discarded")
+
+    # The upload is only needed while the job runs
+    if job.file:
+        job.file.delete(save=False)
+        ImportJob.objects.filter(pk=job.pk).update(file='')
+    return bool(finished)
+
+
+def fail_stale_jobs():
+    """
+    Fail running jobs with no progress for IMPORT_JOB_STALE_SECONDS (their
+    worker is gone). Returns how many were failed.
+    """
+    now = timezone.now()
+    cutoff = now - timedelta(seconds=getattr(settings, 'IMPORT_JOB_STALE_SECONDS', 15 * 60))
+    stale = ImportJob.objects.filter(status='running', updated_at__lt=cutoff)
+
+    failed = 0
+    for job in stale.only('pk', 'file'):
+        # Conditional, so a worker that reported progress meanwhile keeps its job
+        if not stale.filter(pk=job.pk).update(
+            status='failed', finished_at=now, updated_at=now,
+            error_message='The import stopped responding and was abandoned. Upload the file again.',
+        ):
+            continue
+        logger.warning(f"Import job {job.pk} failed: no progress since {cutoff.isoformat()}")
+        failed += 1
+        if job.file:
+            job.file.delete(save=False)
+            ImportJob.objects.filter(pk=job.pk).update(file='')
+    return failed
+
+
+def run_queued_jobs(limit=None):
+    """
+    Fail stale running jobs, then process queued jobs oldest first in the
+    calling thread. Returns how many ran.
+    """
+    fail_stale_jobs()
+    job_ids = ImportJob.objects.filter(status='queued').order_by('created_at').values_list('pk', flat=True)
+    if limit:
+        job_ids = job_ids[:limit]
+
+    processed = 0
+    for job_id in list(job_ids):
+        if run_import_job(job_id):
+            processed += 1
+    return processed
@@ -0,0 +1,331 @@
+"""
+Execution-level lot matching for broker imports.
+
+The default normalizers fold legs into one VWAP trade per (symbol, date) or
+per symbol, which splits or collapses positions held across days. With lot
+matching the legs of the whole file are replayed in execution order instead:
+each symbol keeps a deque of open lots, closing legs consume lots FIFO (from
+the left) or LIFO (from the right), and a round-trip trade is emitted every
+time the position returns to flat. Whatever is still open at the end of the
+file is emitted as an open trade (no exit price).
+
+Open imported trades already stored for the user seed the lots of their
+symbol when they predate the file's first leg for it. Stored open trades
+dated inside the file's range for the symbol came from an earlier upload of
+the same executions (an overlapping re-upload), so the file's rows supersede
+them — unless the file produces that same open trade again (same
+fingerprint), in which case the import skips it as a duplicate. Rows of a
+symbol carry a `replaces` list of both kinds; the writer soft-deletes those
+stored trades once a replacing row is saved, so no position is counted twice.
+
+Every lot-matched row also records the execution legs it was built from
+(`lot_legs`: [leg key, quantity] pairs). Quantity of a file leg that a stored
+closed lot-matched trade already consumed is dropped before the replay, so
+re-uploading executions that closed a position (alone or with new ones)
+does not open it again the other way.
+"""
+import hashlib
+from collections import Counter, defaultdict, deque
+from datetime import datetime, time as dtime
+from decimal import Decimal, ROUND_HALF_UP
+
+from tradelog.models import Trade
+from .aggregate import MARKET_TYPE_BY_SEGMENT
+
+LOT_METHODS = ('fifo', 'lifo')
+
+_PRICE_QUANTUM = Decimal('0.0001')
+
+
+def leg_key(leg):
+    """Stable identity of one execution leg (identical executions share it)."""
+    at = leg.time.isoformat() if leg.time else leg.time_str
+    parts = [leg.symbol, leg.side, leg.date, at, f'{leg.qty.normalize():f}', f'{leg.price.normalize():f}']
+    return hashlib.sha256('|'.join(str(p) for p in parts).encode()).hexdigest()[:32]
+
+
+class OpenLot:
+    __slots__ = ('qty', 'price', 'date', 'time', 'time_str', 'trade_id', 'side', 'legs')
+
+    def __init__(self, qty, price, date, time=None, time_str='', trade_id=None, side=None, legs=None):
+        self.qty = qty
+        self.price = price
+        self.date = date          # ISO date string
+        self.time = time          # datetime or None
+        self.time_str = time_str
+        self.trade_id = trade_id  # stored open trade this lot was seeded from
+        self.side = side          # only set on seeded lots
+        self.legs = legs or []    # [leg key, quantity] pairs still open in this lot
+
+    def sort_key(self):
+        return self.date, self.time.time() if self.time else dtime.min
+
+    def take_legs(self, qty):
+        """Remove `qty` from the lot's legs (oldest first); returns the [key, quantity] pairs taken."""
+        taken = []
+        while qty > 0 and self.legs:
+            key, leg_qty = self.legs[0]
+            take = min(leg_qty, qty)
+            taken.append([key, take])
+            qty -= take
+            if take == leg_qty:
+                self.legs.pop(0)
+            else:
+                self.legs[0] = [key, leg_qty - take]
+        return taken
+
+
+class _Position:
+    """Open lots of one symbol plus the closed part of the current round trip."""
+
+    __slots__ = ('lots', 'side', 'opened', 'closed_qty', 'entry_value', 'exit_value',
+                 'closed_legs', 'segment', 'exchange')
+
+    def __init__(self):
+        self.lots = deque()
+        self.side = None          # 'buy' (long) / 'sell' (short) while a position is open
+        self.opened = None        # first lot of the current round trip
+        self.closed_qty = Decimal('0')
+        self.entry_value = Decimal('0')
+        self.exit_value = Decimal('0')
+        self.closed_legs = []     # [leg key, quantity] pairs of the closed part
+        self.segment = ''
+        self.exchange = ''
+
+    def open(self, side, lot):
+        if not self.lots:
+            self.side = side
+            if self.opened is None:
+                self.opened = lot
+        self.lots.append(lot)
+
+
+class LotMatcher:
+    """
+    Replays execution legs into round-trip trades.
+
+    Args:
+        method:  'fifo' (default) or 'lifo'.
+        user:    When given, the user's stored open imported trades seed the
+                 lots (see module docstring).
+    """
+
+    def __init__(self, method='fifo', user=None):
+        if method not in LOT_METHODS:
+            raise ValueError(f"Invalid lot matching method. Choose one of: {', '.join(LOT_METHODS)}.")
+        self.method = method
+        self.user = user
+
+    def match(self, legs, broker='', time_format='%H:%M'):
+        """Turn Leg tuples into normalized trade rows (same shape as aggregate_legs)."""
+        by_symbol = defaultdict(list)
+        for index, leg in enumerate(legs):
+            if leg.side in ('buy', 'sell') and leg.qty > 0:
+                by_symbol[leg.symbol].append((leg.date, leg.time.time() if leg.time else dtime.min, index, leg))
+
+        self._drop_consumed_legs(by_symbol, broker)
+        carried, overlapped = self._load_stored_open_trades(by_symbol, broker)
+
+        normalized = []
+        for symbol, entries in by_symbol.items():
+            entries.sort(key=lambda e: e[:3])
+            seeds = carried.get(symbol, [])
+            rows = self._match_symbol(symbol, seeds, [e[3] for e in entries], time_format)
+            replaces = {str(lot.trade_id) for lot in seeds}
+            if overlapped.get(symbol):
+                produced = self._fingerprints(rows, broker)
+                replaces.update(str(trade.pk) for trade in overlapped[symbol] if trade.fingerprint not in produced)
+            for row in rows:
+                if replaces:
+                    row['replaces'] = sorted(replaces)
+            normalized.extend(rows)
+        return normalized
+
+    def _fingerprints(self, rows, broker):
+        from .writer import build_trade
+
+        return {build_trade(row, self.user, broker).fingerprint for row in rows}
+
+    def _stored_trades(self, symbols, broker):
+        stored = Trade.objects.filter(
+            user=self.user, symbol__in=list(symbols), import_source='csv_import', deleted_at__isnull=True,
+        )
+        if broker:
+            stored = stored.filter(broker_name=broker)
+        return stored
+
+    def _drop_consumed_legs(self, by_symbol, broker):
+        """
+        Take out leg quantity that stored closed lot-matched trades already
+        consumed (see module docstring). Updates `by_symbol` in place.
+        """
+        if self.user is None or not by_symbol:
+            return
+
+        last_dates = {symbol: max(e[0] for e in entries) for symbol, entries in by_symbol.items()}
+        consumed = Counter()
+        # A closed trade is dated by its opening leg, so one that opened after
+        # the file's last leg cannot hold any of them
+        stored = self._stored_trades(last_dates, broker).filter(exit_price__isnull=False).exclude(lot_legs=[])
+        for symbol, trade_date, lot_legs in stored.values_list('symbol', 'trade_date', 'lot_legs'):
+            if trade_date.isoformat() <= last_dates[symbol]:
+                for key, qty in lot_legs:
+                    consumed[key] += Decimal(qty)
+        if not consumed:
+            return
+
+        for symbol in list(by_symbol):
+            remaining = []
+            for entry in sorted(by_symbol[symbol], key=lambda e: e[:3]):
+                leg = entry[3]
+                key = leg_key(leg)
+                take = min(consumed[key], leg.qty)
+                if take:
+                    consumed[key] -= take
+                    leg = leg._replace(qty=leg.qty - take)
+                if leg.qty > 0:
+                    remaining.append(entry[:3] + (leg,))
+            if remaining:
+                by_symbol[symbol] = remaining
+            else:
+                del by_symbol[symbol]
+
+    def _load_stored_open_trades(self, by_symbol, broker):
+        """
+        Stored open imported trades of the file's symbols, as
+        ({symbol: [OpenLot]} for those before the file's first leg,
+         {symbol: [Trade]} for those inside the file's date range).
+        """
+        if self.user is None or not by_symbol:
+            return {}, {}
+
+        first_dates = {symbol: min(e[0] for e in entries) for symbol, entries in by_symbol.items()}
+        last_dates = {symbol: max(e[0] for e in entries) for symbol, entries in by_symbol.items()}
+        stored = self._stored_trades(first_dates, broker).filter(exit_price__isnull=True)
+
+        carried, overlapped = defaultdict(list), defaultdict(list)
+        for trade in stored.order_by('trade_date', 'trade_time', 'created_at'):
+            trade_date = trade.trade_date.isoformat()
+            if trade_date > last_dates[trade.symbol]:
+                continue
+            if trade_date >= first_dates[trade.symbol]:
+                overlapped[trade.symbol].append(trade)
+                continue
+            carried[trade.symbol].append(OpenLot(
+                qty=trade.quantity,
+                price=trade.entry_price,
+                date=trade_date,
+                time=datetime.combine(trade.trade_date, trade.trade_time) if trade.trade_time else None,
+                trade_id=trade.pk,
+                side='buy' if trade.direction == 'long' else 'sell',
+                legs=[[key, Decimal(qty)] for key, qty in trade.lot_legs],
+            ))
+        return carried, overlapped
+
+    def _match_symbol(self, symbol, seeds, legs, time_format):
+        position = _Position()
+        rows = []
+
+        for seed in seeds:
+            lot = OpenLot(seed.qty, seed.price, seed.date, seed.time, trade_id=seed.trade_id, legs=seed.legs)
+            if position.lots and seed.side != position.side:
+                # Stored long and short open trades on one symbol — replay the
+                # later one as a closing leg like any other execution.
+                self._close(position, seed.side, lot.qty, lot.price, lot, rows, symbol, time_format)
+            else:
+                position.open(seed.side, lot)
+
+        for leg in legs:
+            position.segment = leg.segment
+            position.exchange = leg.exchange
+            lot = OpenLot(leg.qty, leg.price, leg.date, leg.time, leg.time_str, legs=[[leg_key(leg), leg.qty]])
+            if not position.lots or leg.side == position.side:
+                position.open(leg.side, lot)
+            else:
+                self._close(position, leg.side, leg.qty, leg.price, lot, rows, symbol, time_format)
+
+        # End of file: the closed part of an unfinished round trip is a
+        # finished trade; the remaining lots carry forward as one open trade.
+        if position.closed_qty:
+            rows.append(self._closed_row(position, symbol, time_format))
+        if position.lots:
+            rows.append(self._open_row(position, symbol, time_format))
+        return rows
+
+    def _close(self, position, side, qty, price, lot, rows, symbol, time_format):
+        take_lot = position.lots.popleft if self.method == 'fifo' else position.lots.pop
+        peek = 0 if self.method == 'fifo' else -1
+
+        remaining = qty
+        while remaining > 0 and position.lots:
+            open_lot = position.lots[peek]
+            take = min(open_lot.qty, remaining)
+            position.closed_qty += take
+            position.entry_value += take * open_lot.price
+            position.exit_value += take * price
+            position.closed_legs += open_lot.take_legs(take) + lot.take_legs(take)
+            open_lot.qty -= take
+            remaining -= take
+            if open_lot.qty == 0:
+                take_lot()
+
+        if position.lots:
+            return
+
+        # Flat again — the round trip is complete
+        rows.append(self._closed_row(position, symbol, time_format))
+        position.side = None
+        position.opened = None
+        if remaining > 0:
+            # The leg overshoots and opens a position the other way
+            position.open(side, OpenLot(remaining, price, lot.date, lot.time, lot.time_str, legs=lot.legs))
+
+    def _closed_row(self, position, symbol, time_format):
+        qty = position.closed_qty
+        row = self._row(
+            position, symbol, position.opened, time_format,
+            quantity=qty,
+            entry_price=position.entry_value / qty,
+            exit_price=position.exit_value / qty,
+            legs=position.closed_legs,
+        )
+        position.closed_qty = Decimal('0')
+        position.entry_value = Decimal('0')
+        position.exit_value = Decimal('0')
+        position.closed_legs = []
+        return row
+
+    def _open_row(self, position, symbol, time_format):
+        qty = sum((lot.qty for lot in position.lots), Decimal('0'))
+        value = sum((lot.qty * lot.price for lot in position.lots), Decimal('0'))
+        first = min(position.lots, key=OpenLot.sort_key)
+        legs = [pair for lot in position.lots for pair in lot.legs]
+        return self._row(position, symbol, first, time_format, quantity=qty, entry_price=value / qty, legs=legs)
+
+    def _row(self, position, symbol, first_lot, time_format, quantity, entry_price, exit_price=None, legs=()):
+        if first_lot.time is not None:
+            trade_time_str = first_lot.time.strftime(time_format)
+        else:
+            trade_time_str = first_lot.time_str
+        return {
+            'symbol': symbol,
+            'trade_date': first_lot.date,
+            'time': trade_time_str,
+            'direction': 'long' if position.side == 'buy' else 'short',
+            'quantity': str(quantity),
+            'entry_price': str(entry_price.quantize(_PRICE_QUANTUM, rounding=ROUND_HALF_UP)),
+            'exit_price': str(exit_price.quantize(_PRICE_QUANTUM, rounding=ROUND_HALF_UP)) if exit_price is not None else '',
+            'fees': '0',
+            'market_type': MARKET_TYPE_BY_SEGMENT.get(position.segment, 'indian_stocks'),
+            'exchange': position.exchange,
+            'segment': position.segment,
+            'lot_legs': _merge_legs(legs),
+        }
+
+
+def _merge_legs(legs):
+    """[leg key, quantity] pairs with one entry per key, quantities as strings."""
+    merged = {}
+    for key, qty in legs:
+        merged[key] = merged.get(key, Decimal('0')) + qty
+    return [[key, f'{qty.normalize():f}'] for key, qty in merged.items()]
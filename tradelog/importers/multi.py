@@ -0,0 +1,150 @@
+"""
+Multi-file and .zip imports.
+
+Every uploaded file (or archive member) is parsed and normalized in a
+process pool — openpyxl and the Decimal VWAP work are CPU-bound, so threads
+would serialise on the GIL. The normalized rows of all files are then
+written by one batch-mode import, so each affected session date is checked
+and evaluated once no matter how many files touched it.
+
+Workers only parse; they never touch the database.
+"""
+import io
+import os
+import threading
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+import django
+from django.conf import settings
+
+from .parser import SUPPORTED_EXTENSIONS, iter_upload_rows, detect_and_normalize
+from .writer import ROW_BROKER_KEY, ROW_FILE_KEY
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+class ArchiveError(ValueError):
+    """Raised for zip uploads that are corrupt or exceed the archive limits."""
+
+
+def is_zip(filename):
+    return filename.lower().endswith('.zip')
+
+
+def read_uploads(files):
+    """
+    Flatten uploaded files into [(filename, bytes)], expanding .zip archives.
+
+    Archive members that are not CSV/Excel (folders, __MACOSX metadata,
+    readme files) are ignored. Raises ArchiveError when an archive is
+    unreadable, contains another archive, or exceeds
+    IMPORT_ARCHIVE_MAX_FILES / IMPORT_ARCHIVE_MAX_BYTES.
+    """
+    uploads = []
+    for f in files:
+        if is_zip(f.name):
+            uploads.extend(_read_zip(f))
+        else:
+            uploads.append((f.name, f.read()))
+    return uploads
+
+
+def _read_zip(file):
+    max_files = getattr(settings, 'IMPORT_ARCHIVE_MAX_FILES', 20)
+    max_bytes = getattr(settings, 'IMPORT_ARCHIVE_MAX_BYTES', 100 * 1024 * 1024)
+
+    try:
+        archive = zipfile.ZipFile(file)
+    except zipfile.BadZipFile:
+        raise ArchiveError(f'{file.name}: not a valid zip archive.')
+
+    with archive:
+        # Nested archives are refused rather than expanded, so the limits
+        # below always describe everything that will be parsed.
+        if any(is_zip(info.filename) for info in archive.infolist() if not info.is_dir()):
+            raise ArchiveError(f'{file.name}: nested archives are not supported.')
+        members = [
+            info for info in archive.infolist()
+            if not info.is_dir()
+            and not info.filename.startswith('__MACOSX/')
+            and info.filename.lower().endswith(SUPPORTED_EXTENSIONS)
+        ]
+        if not members:
+            raise ArchiveError(f'{file.name}: no CSV or Excel files found in the archive.')
+        if len(members) > max_files:
+            raise ArchiveError(f'{file.name}: archive has more than {max_files} files.')
+
+        uploads = []
+        remaining = max_bytes
+        for info in members:
+            # Declared sizes can lie, so cap the actual read as well
+            if info.file_size > remaining:
+                raise ArchiveError(f'{file.name}: archive expands to more than {max_bytes} bytes.')
+            with archive.open(info) as member:
+                data = member.read(remaining + 1)
+            if len(data) > remaining:
+                raise ArchiveError(f'{file.name}: archive expands to more than {max_bytes} bytes.')
+            remaining -= len(data)
+            uploads.append((f'{file.name}/{info.filename}', data))
+        return uploads
+
+
+def parse_upload(filename, data, broker_hint=''):
+    """
+    Parse and normalize one file. Runs inside a pool worker, so it takes and
+    returns plain picklable values: {'filename', 'detected_broker',
+    'detected_formats', 'rows'} or {'filename', 'error'}.
+    """
+    formats = {}
+    try:
+        raw_rows = iter_upload_rows(io.BytesIO(data), filename)
+        detected_broker, rows = detect_and_normalize(raw_rows, broker_hint, formats=formats)
+        rows = list(rows)
+    except Exception as e:
+        return {'filename': filename, 'error': str(e)}
+    return {
+        'filename': filename,
+        'detected_broker': detected_broker,
+        'detected_formats': formats,
+        'rows': rows,
+    }
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn, not fork: the web process may hold DB connections and
+            # running threads (the import job pool) that must not be copied.
+            _pool = ProcessPoolExecutor(
+                max_workers=getattr(settings, 'IMPORT_PARSE_PROCESSES', None) or os.cpu_count(),
+                mp_context=get_context('spawn'),
+                # Referenced directly: this module imports models, so it can
+                # only be unpickled in the worker once Django is set up.
+                initializer=django.setup,
+            )
+        return _pool
+
+
+def parse_uploads(uploads, broker_hint=''):
+    """Parse [(filename, bytes)] — in the process pool when there is more than one file."""
+    if len(uploads) == 1:
+        return [parse_upload(uploads[0][0], uploads[0][1], broker_hint)]
+
+    pool = _get_pool()
+    futures = [pool.submit(parse_upload, filename, data, broker_hint) for filename, data in uploads]
+    return [future.result() for future in futures]
+
+
+def merged_rows(results):
+    """Yield the rows of every successfully parsed file, tagged with their file and broker."""
+    for result in results:
+        if 'error' in result:
+            continue
+        for row in result['rows']:
+            row[ROW_FILE_KEY] = result['filename']
+            row[ROW_BROKER_KEY] = result['detected_broker']
+            yield row
@@ -1,5 +1,6 @@
-import io
+import codecs
 import csv
+from itertools import chain
 from .zerodha import normalize_zerodha
 from .groww import normalize_groww
 from .upstox import normalize_upstox
@@ -10,64 +11,163 @@ _HEADER_KEYWORDS = (
     'order_id', 'side', 'trade_num', 'segment', 'series',
 )
 
+# Uploads are decoded in fixed-size chunks so a worker never holds the whole
+# file as one string, no matter how many execution legs the tradebook has.
+_READ_CHUNK_SIZE = 64 * 1024
+_DELIMITER_SAMPLE_SIZE = 2048
+
+SUPPORTED_EXTENSIONS = ('.csv', '.xlsx', '.xls')
+
+
+class UnsupportedFileType(ValueError):
+    """Raised for uploads that are neither CSV nor Excel."""
+
+
+def iter_rows_from_raw_data(raw_data):
+    """
+    Lazy version of extract_rows_from_raw_data.
+
+    Consumes any iterable of raw rows (lists/tuples), skips junk header rows
+    (broker name, account info, blanks) until the real column header row is
+    found, then yields one dict per non-empty data row.
+    """
+    headers = None
+    for row in raw_data:
+        if not any(row):
+            continue  # blank row
+
+        if headers is None:
+            row_lower = [str(item).strip().lower() if item else '' for item in row]
+            # Match if ANY cell in this row contains a known header keyword
+            if any(any(kw in cell for kw in _HEADER_KEYWORDS) for cell in row_lower if cell):
+                headers = [str(h).strip().lower().replace(' ', '_') for h in row]
+            continue
+
+        yield dict(zip(headers, [str(v).strip() if v is not None else '' for v in row]))
+
+
 def extract_rows_from_raw_data(raw_data):
     """
     Skip junk header rows (broker name, account info, blanks) and find the
     real column header row.
     """
-    header_idx = None
-    for i, row in enumerate(raw_data):
-        if not any(row):
-            continue  # blank row
-        row_lower = [str(item).strip().lower() if item else '' for item in row]
-        # Match if ANY cell in this row contains a known header keyword
-        if any(any(kw in cell for kw in _HEADER_KEYWORDS) for cell in row_lower if cell):
-            header_idx = i
+    return list(iter_rows_from_raw_data(raw_data))
+
+
+def _iter_text_lines(file, encoding='utf-8-sig'):
+    """
+    Decode a binary upload incrementally and yield text lines (with line
+    endings kept, so csv.reader still handles quoted multi-line cells).
+    utf-8-sig drops the byte order mark Excel writes before the header.
+    """
+    decoder = codecs.getincrementaldecoder(encoding)(errors='ignore')
+    pending = ''
+    while True:
+        chunk = file.read(_READ_CHUNK_SIZE)
+        final = not chunk
+        pending += decoder.decode(chunk or b'', final=final)
+        *lines, pending = pending.split('\n')
+        # The last piece may be an incomplete line — keep it for the next chunk
+        for line in lines:
+            yield line + '\n'
+        if final:
+            if pending:
+                yield pending
             break
 
-    if header_idx is None or not raw_data:
-        return []
 
-    headers = [str(h).strip().lower().replace(' ', '_') for h in raw_data[header_idx]]
+def iter_csv(file):
+    """
+    Stream a CSV/TSV upload: yields normalized row dicts one at a time.
+    The delimiter is sniffed from the first 2 KB, like the eager parser did.
+    """
+    lines = _iter_text_lines(file)
+
+    head = []
+    sample_len = 0
+    for line in lines:
+        head.append(line)
+        sample_len += len(line)
+        if sample_len >= _DELIMITER_SAMPLE_SIZE:
+            break
+    sample = ''.join(head)[:_DELIMITER_SAMPLE_SIZE]
+    delimiter = '\t' if sample.count('\t') > sample.count(',') else ','
+
+    reader = csv.reader(chain(head, lines), delimiter=delimiter)
+    yield from iter_rows_from_raw_data(reader)
 
-    rows = []
-    for row in raw_data[header_idx + 1:]:
-        if any(row):  # skip entirely empty rows
-            row_dict = dict(zip(headers, [str(v).strip() if v is not None else '' for v in row]))
-            rows.append(row_dict)
-    return rows
 
 def parse_csv(file):
-    content = file.read().decode('utf-8', errors='ignore')
-    sample = content[:2048]
-    delimiter = '\t' if sample.count('\t') > sample.count(',') else ','
+    return list(iter_csv(file))
 
-    reader = csv.reader(io.StringIO(content), delimiter=delimiter)
-    raw_data = list(reader)
 
-    return extract_rows_from_raw_data(raw_data)
+def iter_excel(file):
+    """
+    Stream an .xlsx upload: yields normalized row dicts one at a time.
 
-def parse_excel(file):
+    The workbook is opened in read-only mode, so openpyxl parses the sheet
+    XML as rows are requested instead of building the whole workbook in
+    memory. Opening happens eagerly so a corrupt file fails here rather than
+    half-way through the import.
+    """
     try:
         import openpyxl
     except ImportError:
         raise ImportError('openpyxl not installed. Run: pip install openpyxl')
 
-    wb = openpyxl.load_workbook(file, data_only=True)
-    ws = wb.active
-    raw_data = list(ws.iter_rows(values_only=True))
+    wb = openpyxl.load_workbook(file, read_only=True, data_only=True)
+    return _iter_sheet_rows(wb)
+
+
+def _iter_sheet_rows(wb):
+    try:
+        ws = wb.active
+        # Broker exports often carry a wrong <dimension> tag; without this a
+        # read-only sheet would stop at the declared range.
+        ws.reset_dimensions()
+        yield from iter_rows_from_raw_data(ws.iter_rows(values_only=True))
+    finally:
+        wb.close()
 
-    return extract_rows_from_raw_data(raw_data)
 
-def detect_and_normalize(raw_rows, broker_hint=''):
+def parse_excel(file):
+    return list(iter_excel(file))
+
+
+def iter_upload_rows(file, filename):
+    """
+    Pick the parser for an upload from its file extension.
+    Raises UnsupportedFileType for anything that is not CSV or Excel.
+    """
+    filename = filename.lower()
+    if filename.endswith('.csv'):
+        return iter_csv(file)
+    if filename.endswith(SUPPORTED_EXTENSIONS):
+        return iter_excel(file)
+    raise UnsupportedFileType('Unsupported file type. Upload CSV or Excel.')
+
+
+def detect_and_normalize(raw_rows, broker_hint='', formats=None, lots=None):
     """
     Auto-detect broker format from headers or broker_hint,
     then return (broker_name, normalized_rows).
+
+    `raw_rows` may be a list or a lazy iterator of row dicts; only the first
+    row is inspected for detection. The returned rows are an iterator, so
+    callers can consume them without materialising the whole file.
+
+    `formats`, if given, is a dict that receives the date/time format the
+    broker normalizer detected for each column (see importers/dates.py).
+    `lots`, if given, is a LotMatcher that pairs broker execution legs into
+    round-trip trades; it does not apply to the generic format.
     """
-    if not raw_rows:
-        return 'unknown', []
+    raw_rows = iter(raw_rows)
+    first = next(raw_rows, None)
+    if first is None:
+        return 'unknown', iter(())
 
-    headers = set(raw_rows[0].keys())
+    headers = set(first.keys())
+    raw_rows = chain((first,), raw_rows)
 
     # Zerodha detection
     is_zerodha = (
@@ -76,7 +176,7 @@ def detect_and_normalize(raw_rows, broker_hint=''):
         {'order_execution_time', 'series', 'segment', 'trade_type'}.issubset(headers)
     )
     if is_zerodha:
-        return 'zerodha', normalize_zerodha(raw_rows)
+        return 'zerodha', normalize_zerodha(raw_rows, formats, lots)
 
     # Groww detection
     is_groww = (
@@ -85,15 +185,15 @@ def detect_and_normalize(raw_rows, broker_hint=''):
         {'execution_date_and_time', 'order_status'}.issubset(headers)
     )
     if is_groww:
-        return 'groww', normalize_groww(raw_rows)
-    
+        return 'groww', normalize_groww(raw_rows, formats, lots)
+
     # Upstox detection
     is_upstox = (
         broker_hint == 'upstox' or
         {'scrip_code', 'trade_num', 'side', 'trade_time'}.issubset(headers)
     )
     if is_upstox:
-        return 'upstox', normalize_upstox(raw_rows)
+        return 'upstox', normalize_upstox(raw_rows, formats, lots)
 
     # Fallback: generic format
-    return broker_hint or 'generic', raw_rows
\ No newline at end of file
+    return broker_hint or 'generic', raw_rows
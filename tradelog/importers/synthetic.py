@@ -0,0 +1,110 @@
+"""
+Synthetic broker exports for import benchmarks.
+
+generate_file() builds a Zerodha, Groww, Upstox or generic tradebook with
+the same columns (and the same junk rows above the header) as the real
+exports, as CSV or XLSX. Output is deterministic for a given seed, so
+benchmark runs stay comparable.
+"""
+import csv
+import io
+import random
+from datetime import datetime, timedelta
+
+BROKERS = ('zerodha', 'groww', 'upstox', 'generic')
+FILE_FORMATS = ('csv', 'xlsx')
+
+_SYMBOLS = (
+    'RELIANCE', 'TCS', 'INFY', 'HDFCBANK', 'ICICIBANK', 'SBIN', 'ITC', 'LT', 'AXISBANK', 'KOTAKBANK',
+    'BHARTIARTL', 'ASIANPAINT', 'MARUTI', 'TITAN', 'SUNPHARMA', 'WIPRO', 'ULTRACEMCO', 'NESTLEIND',
+    'BAJFINANCE', 'HCLTECH', 'TATAMOTORS', 'TATASTEEL', 'ONGC', 'NTPC', 'POWERGRID', 'COALINDIA',
+    'ADANIENT', 'ADANIPORTS', 'JSWSTEEL', 'GRASIM', 'HINDALCO', 'DRREDDY', 'CIPLA', 'EICHERMOT',
+    'BPCL', 'BRITANNIA', 'DIVISLAB', 'HEROMOTOCO', 'TECHM', 'INDUSINDBK',
+)
+
+# Execution legs per symbol per trading day
+_LEGS_PER_SYMBOL_DAY = 6
+
+_HEADERS = {
+    'zerodha': ['symbol', 'isin', 'trade_date', 'exchange', 'segment', 'series', 'trade_type', 'auction',
+                'quantity', 'price', 'trade_id', 'order_id', 'order_execution_time'],
+    'groww': ['Stock name', 'Symbol', 'ISIN', 'Type', 'Quantity', 'Value', 'Exchange',
+              'Exchange Order Id', 'Execution date and time', 'Order status'],
+    'upstox': ['Date', 'Company', 'Amount', 'Exchange', 'Segment', 'Scrip Code', 'Instrument Type',
+               'Strike Price', 'Expiry', 'Trade Num', 'Trade Time', 'Side', 'Quantity', 'Price'],
+    'generic': ['symbol', 'trade_date', 'time', 'direction', 'quantity', 'entry_price', 'exit_price', 'fees'],
+}
+
+# Account details some brokers put above the real header row
+_PREAMBLE = {
+    'zerodha': [['Client ID', 'AB1234'], ['Tradebook for Equity'], []],
+    'groww': [['Name', 'Benchmark User'], []],
+    'upstox': [],
+    'generic': [],
+}
+
+
+def _iter_legs(count, seed):
+    """Yield (symbol, side, quantity, price, executed_at) for `count` legs."""
+    rng = random.Random(seed)
+    prices = {symbol: rng.uniform(100, 4000) for symbol in _SYMBOLS}
+    day = datetime(2024, 1, 1, 9, 15)
+    produced = 0
+    while produced < count:
+        # Skip weekends like a real tradebook
+        while day.weekday() >= 5:
+            day += timedelta(days=1)
+        for symbol in rng.sample(_SYMBOLS, 10):
+            qty = rng.choice((1, 5, 10, 25, 50, 100))
+            for leg in range(_LEGS_PER_SYMBOL_DAY):
+                if produced == count:
+                    return
+                prices[symbol] = max(1.0, prices[symbol] * rng.uniform(0.995, 1.005))
+                side = 'buy' if leg < _LEGS_PER_SYMBOL_DAY // 2 else 'sell'
+                executed_at = day + timedelta(minutes=rng.randint(0, 370))
+                yield symbol, side, qty, round(prices[symbol], 2), executed_at
+                produced += 1
+        day += timedelta(days=1)
+
+
+def iter_rows(broker, legs, seed=0):
+    """Yield raw rows (lists) of a synthetic export, preamble and header first."""
+    yield from _PREAMBLE[broker]
+    yield _HEADERS[broker]
+
+    for n, (symbol, side, qty, price, at) in enumerate(_iter_legs(legs, seed), start=1):
+        if broker == 'zerodha':
+            yield [symbol, 'INE000000000', f'{at:%Y-%m-%d}', 'NSE', 'EQ', 'EQ', side, 'false',
+                   qty, price, n, 1000000 + n, f'{at:%Y-%m-%dT%H:%M:%S}']
+        elif broker == 'groww':
+            yield [symbol.title(), symbol, 'INE000000000', side.upper(), qty, round(qty * price, 2), 'NSE',
+                   1100000 + n, f'{at:%d-%m-%Y %I:%M %p}', 'Executed']
+        elif broker == 'upstox':
+            yield [f'{at:%d-%m-%Y}', symbol.title(), round(qty * price, 2), 'NSE', 'EQ', symbol, '', '', '',
+                   n, f'{at:%H:%M:%S}', side.title(), qty, f'₹{price:,.2f}']
+        else:
+            direction = 'long' if side == 'buy' else 'short'
+            yield [symbol, f'{at:%Y-%m-%d}', f'{at:%H:%M}', direction, qty, price,
+                   round(price * 1.004, 2), 20]
+
+
+def generate_file(broker, legs, file_format='csv', seed=0):
+    """Return the bytes of a synthetic export with `legs` execution rows."""
+    if broker not in BROKERS:
+        raise ValueError(f"Unknown broker {broker!r}. Choose one of: {', '.join(BROKERS)}.")
+
+    rows = iter_rows(broker, legs, seed)
+    if file_format == 'csv':
+        text = io.StringIO()
+        csv.writer(text).writerows(rows)
+        return text.getvalue().encode('utf-8')
+    if file_format == 'xlsx':
+        import openpyxl
+        wb = openpyxl.Workbook(write_only=True)
+        ws = wb.create_sheet()
+        for row in rows:
+            ws.append(row)
+        out = io.BytesIO()
+        wb.save(out)
+        return out.getvalue()
+    raise ValueError(f"Unknown file format {file_format!r}. Choose one of: {', '.join(FILE_FORMATS)}.")
@@ -0,0 +1,442 @@
+"""
+Import writers — turn normalized row dicts into saved Trade rows.
+
+Two modes share the same row parsing (build_trade) and skip rows whose
+fingerprint was already imported for the user:
+  - row   → save_imported_trade saves one trade at a time; every save fires
+            the post_save rule evaluation in discipline/signals.py.
+  - batch → bulk_import_rows groups rows by trade_date, checks each date's lock
+            once, bulk_creates the trades and runs the rule engine once per
+            affected session.
+"""
+from collections import defaultdict
+from datetime import datetime, date as ddate, time as dtime
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from tradelog.models import Trade
+from .dates import DateTimeSniffer
+
+# bulk_create chunk size for batched imports
+BULK_BATCH_SIZE = 500
+
+# How often (in rows) row-mode imports report progress
+PROGRESS_EVERY = 200
+
+# Row mode looks up already-imported fingerprints for this many rows at once
+DEDUPE_CHUNK_SIZE = 500
+
+# Accepted trade_date formats for normalized rows, in priority order
+TRADE_DATE_FORMATS = ('%Y-%m-%d', '%d-%m-%Y', '%d/%m/%Y', '%m/%d/%Y')
+
+# Optional keys set on rows merged from several files (importers/multi.py):
+# the source file and the broker detected for it
+ROW_FILE_KEY = '_file'
+ROW_BROKER_KEY = '_broker'
+
+# Fields refreshed on an already-imported trade when on_duplicate='update'.
+# Everything else is part of the fingerprint and therefore unchanged.
+_DUPLICATE_UPDATE_FIELDS = ['fees', 'market_type', 'total_pnl', 'version', 'updated_at']
+
+
+class SessionLockedError(ValueError):
+    """Raised when a row targets a trade date whose session is locked."""
+
+    def __init__(self, lock_msg):
+        super().__init__(f"Trade blocked — session locked: {lock_msg}")
+
+
+def trade_date_parser(report=None):
+    """A per-file DateTimeSniffer for the trade_date column of normalized rows."""
+    return DateTimeSniffer(TRADE_DATE_FORMATS, name='trade_date', report=report)
+
+
+def build_trade(row, user, broker_name, date_parser=None):
+    """
+    Build an unsaved Trade (no session linked yet) from a normalized row dict.
+    Pass the same `date_parser` for every row of a file so the trade_date
+    format is only detected once. A row's own ROW_BROKER_KEY overrides
+    `broker_name`.
+    """
+    broker_name = row.get(ROW_BROKER_KEY) or broker_name
+    symbol = row.get('symbol') or row.get('scrip', '')
+    direction = (row.get('direction') or row.get('trade_type', 'long')).lower()
+    quantity = Decimal(str(row.get('quantity') or row.get('qty', 1)))
+    entry_price = Decimal(str(row.get('entry_price') or row.get('buy_price', 0)))
+    exit_price_raw = row.get('exit_price') or row.get('sell_price', '')
+    exit_price = Decimal(str(exit_price_raw)) if exit_price_raw else None
+    fees = Decimal(str(row.get('fees') or row.get('brokerage', 0)))
+
+    # Date parsing — strip any time component first (e.g. Upstox sends "2026-02-24 00:00:00")
+    date_raw = row.get('date') or row.get('trade_date', '')
+    if date_raw and ' ' in str(date_raw):
+        date_raw = str(date_raw).split(' ')[0]
+    parsed = (date_parser or trade_date_parser()).parse(str(date_raw)) if date_raw else None
+    trade_date = parsed.date() if parsed else ddate.today()
+
+    # Time parsing
+    time_raw = row.get('time') or row.get('trade_time', '')
+    trade_time = None
+    if time_raw:
+        try:
+            parts = time_raw.split(':')
+            trade_time = dtime(
+                int(parts[0]),
+                int(parts[1]),
+                int(parts[2]) if len(parts) > 2 else 0
+            )
+        except Exception:
+            pass
+
+    trade = Trade(
+        user=user,
+        trade_date=trade_date,
+        trade_time=trade_time,
+        symbol=symbol or 'UNKNOWN',
+        market_type=row.get('market_type', 'indian_stocks'),
+        direction='long' if direction in ('long', 'buy', 'b') else 'short',
+        quantity=quantity,
+        entry_price=entry_price,
+        exit_price=exit_price,
+        fees=fees,
+        import_source='csv_import',
+        broker_name=broker_name,
+        is_tagged_complete=False,
+        lot_legs=row.get('lot_legs') or [],
+    )
+    trade.calculate_pnl()
+    trade.fingerprint = trade.compute_fingerprint()
+    return trade
+
+
+def get_session_for_date(user, trade_date):
+    """
+    Get or create the DisciplineSession for a date, making sure
+    lock_cycle_started_at is initialised to the start of that day
+    (same rule as discipline/signals.py).
+    """
+    from discipline.models import DisciplineSession
+
+    session, created = DisciplineSession.objects.get_or_create(
+        user=user, session_date=trade_date, defaults={'session_state': 'green'}
+    )
+    if created or session.lock_cycle_started_at is None:
+        session.lock_cycle_started_at = timezone.make_aware(
+            datetime.combine(session.session_date, dtime.min)
+        )
+        session.save(update_fields=['lock_cycle_started_at', 'updated_at'])
+    return session
+
+
+def save_imported_trade(trade, user):
+    """Row mode: save one built trade after checking its date's session lock."""
+    from discipline.models import DisciplineSession
+    from rules.engine import is_session_locked
+
+    locked, lock_msg = is_session_locked(user, date=trade.trade_date)
+    if locked:
+        raise SessionLockedError(lock_msg)
+
+    # Get or create a discipline session for this trade date
+    trade.session, _ = DisciplineSession.objects.get_or_create(
+        user=user, session_date=trade.trade_date, defaults={'session_state': 'green'}
+    )
+    trade.save()
+
+    # Update strategy maturity after import
+    if trade.strategy:
+        total = Trade.objects.filter(
+            strategy=trade.strategy, deleted_at__isnull=True
+        ).count()
+        trade.strategy.update_maturity(total)
+
+    # Rule evaluation handled by post_save signal — see perform_create comment.
+
+    return trade
+
+
+def retire_replaced_trades(user, trade_ids):
+    """
+    Soft-delete stored open trades that lot-matched rows now cover (see lots.py),
+    then recount the sessions they leave — the queryset update skips the
+    per-trade counter signal.
+    """
+    from discipline.counters import refresh_session_counters
+
+    if not trade_ids:
+        return
+    retired = Trade.objects.filter(user=user, pk__in=trade_ids, deleted_at__isnull=True)
+    trade_dates = sorted(set(retired.values_list('trade_date', flat=True)))
+    now = timezone.now()
+    retired.update(deleted_at=now, updated_at=now)
+    for trade_date in trade_dates:
+        refresh_session_counters(get_session_for_date(user, trade_date))
+
+
+def existing_fingerprints(user, fingerprints):
+    """
+    One set-based lookup: {fingerprint: trade_id} for already-imported live
+    trades (deleted ones don't count, so they are imported again).
+    """
+    fingerprints = [fp for fp in fingerprints if fp]
+    if not fingerprints:
+        return {}
+    return dict(
+        Trade.objects.filter(
+            user=user, fingerprint__in=fingerprints, deleted_at__isnull=True,
+        ).values_list('fingerprint', 'id')
+    )
+
+
+def _as_update_of(trade, existing_id):
+    """Point a freshly built trade at the already-imported row it duplicates."""
+    trade.pk = existing_id
+    trade._state.adding = False
+    trade.version = F('version') + 1  # the stored version isn't loaded
+    return trade
+
+
+class ImportStats:
+    """Counters and error report collected while an import runs."""
+
+    def __init__(self, max_errors=10):
+        self.max_errors = max_errors
+        self.parsed = 0
+        self.imported = 0
+        self.failed = 0
+        self.blocked = 0      # rows rejected because their session was locked
+        self.skipped = 0      # rows already imported earlier (same fingerprint)
+        self.updated = 0      # already-imported rows refreshed (on_duplicate=update)
+        self.errors = []
+        self.detected_formats = {}   # column → date/time format detected for this file
+
+    def record_error(self, row_number, row, exc):
+        self.failed += 1
+        if isinstance(exc, SessionLockedError):
+            self.blocked += 1
+        if self.max_errors is None or len(self.errors) < self.max_errors:
+            self.errors.append({'row': row_number, 'error': str(exc), 'data': row})
+
+    def as_dict(self):
+        return {
+            'parsed': self.parsed,
+            'imported': self.imported,
+            'failed': self.failed,
+            'blocked': self.blocked,
+            'skipped': self.skipped,
+            'updated': self.updated,
+            'errors': self.errors,
+            'detected_formats': self.detected_formats,
+        }
+
+
+def run_import(rows, user, broker_name, mode='row', on_duplicate='skip',
+               max_errors=10, progress=None, detected_formats=None):
+    """
+    Import normalized rows in the given mode ('row' or 'batch').
+
+    Rows whose fingerprint was already imported for this user are skipped,
+    or with on_duplicate='update' have their fees/market type refreshed.
+    `progress`, when given, is called with the ImportStats every
+    PROGRESS_EVERY rows (row mode) or after each trade date (batch mode).
+    `max_errors=None` keeps every error (used for background job reports).
+    `detected_formats` is the dict passed to detect_and_normalize; the
+    trade_date format is added to it and it is kept on the stats.
+    """
+    stats = ImportStats(max_errors=max_errors)
+    if detected_formats is not None:
+        stats.detected_formats = detected_formats
+    if mode == 'batch':
+        bulk_import_rows(rows, user, broker_name, on_duplicate=on_duplicate, stats=stats, progress=progress)
+    else:
+        date_parser = trade_date_parser(report=stats.detected_formats)
+        for chunk in _chunked(enumerate(rows, start=1), DEDUPE_CHUNK_SIZE):
+            _import_chunk_row_by_row(chunk, user, broker_name, on_duplicate, stats, progress, date_parser)
+    return stats
+
+
+def _chunked(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _import_chunk_row_by_row(chunk, user, broker_name, on_duplicate, stats, progress, date_parser):
+    built = []
+    for i, row in chunk:
+        stats.parsed += 1
+        try:
+            built.append((i, row, build_trade(row, user, broker_name, date_parser)))
+        except Exception as e:
+            stats.record_error(i, row, e)
+
+    seen = existing_fingerprints(user, [trade.fingerprint for _, _, trade in built])
+
+    for i, row, trade in built:
+        # Session lock is checked inside save_imported_trade
+        # per-row based on the actual trade date.
+        try:
+            existing_id = seen.get(trade.fingerprint)
+            if existing_id is None:
+                save_imported_trade(trade, user)
+                retire_replaced_trades(user, row.get('replaces'))
+                seen[trade.fingerprint] = trade.pk
+                stats.imported += 1
+            elif on_duplicate == 'update':
+                _update_duplicate(_as_update_of(trade, existing_id), user)
+                stats.updated += 1
+            else:
+                stats.skipped += 1
+        except Exception as e:
+            stats.record_error(i, row, e)
+        if progress and i % PROGRESS_EVERY == 0:
+            progress(stats)
+
+
+def _update_duplicate(trade, user):
+    from rules.engine import is_session_locked
+
+    locked, lock_msg = is_session_locked(user, date=trade.trade_date)
+    if locked:
+        raise SessionLockedError(lock_msg)
+    # fees changes P&L, so this save is not in the signal's skip list and the
+    # rule engine re-evaluates the day.
+    trade.save(update_fields=_DUPLICATE_UPDATE_FIELDS)
+
+
+def bulk_import_rows(rows, user, broker_name, on_duplicate='skip', stats=None, progress=None):
+    """
+    Batch mode: import normalized rows with a fixed number of queries per
+    trade date instead of several per row.
+
+    Rows are grouped by trade_date and already-imported fingerprints are
+    looked up once per date. For each date the session lock is checked
+    once; if the date is locked every row for it is rejected with the same
+    message row mode gives. Otherwise the trades are bulk_created (which does
+    not fire post_save) and the rule engine runs once for that session with
+    all new trades, followed by a single is_disciplined update.
+
+    Lock behaviour matches row mode: when a date's batch leaves its session
+    locked, the batch is rolled back and that date is imported row by row,
+    so rows after the lock-triggering trade are rejected exactly as in row
+    mode. Dates that don't lock keep the fixed query count.
+
+    Returns the ImportStats.
+    """
+    from rules.engine import is_session_locked
+
+    stats = stats or ImportStats()
+    date_parser = trade_date_parser(report=stats.detected_formats)
+    by_date = defaultdict(list)   # trade_date → [(row_number, row, trade)]
+
+    for i, row in enumerate(rows, start=1):
+        stats.parsed += 1
+        try:
+            trade = build_trade(row, user, broker_name, date_parser)
+        except Exception as e:
+            stats.record_error(i, row, e)
+            continue
+        by_date[trade.trade_date].append((i, row, trade))
+
+    for trade_date in sorted(by_date):
+        entries = by_date[trade_date]
+
+        seen = existing_fingerprints(user, [trade.fingerprint for _, _, trade in entries])
+        new_entries, duplicate_entries = [], []
+        for entry in entries:
+            trade = entry[2]
+            existing_id = seen.get(trade.fingerprint)
+            if existing_id is None:
+                seen[trade.fingerprint] = trade.pk   # also drops repeats within the file
+                new_entries.append(entry)
+            elif on_duplicate == 'update':
+                _as_update_of(trade, existing_id)
+                duplicate_entries.append(entry)
+            else:
+                stats.skipped += 1
+
+        if not new_entries and not duplicate_entries:
+            continue
+
+        locked, lock_msg = is_session_locked(user, date=trade_date)
+        if locked:
+            exc = SessionLockedError(lock_msg)
+            for i, row, _ in new_entries + duplicate_entries:
+                stats.record_error(i, row, exc)
+        else:
+            try:
+                with transaction.atomic():
+                    _write_session_batch(
+                        user, trade_date,
+                        [trade for _, _, trade in new_entries],
+                        [trade for _, _, trade in duplicate_entries],
+                    )
+                    retire_replaced_trades(
+                        user, {trade_id for _, row, _ in new_entries for trade_id in row.get('replaces', ())}
+                    )
+                    if len(new_entries) + len(duplicate_entries) > 1 and is_session_locked(user, date=trade_date)[0]:
+                        raise _LockedInBatch()
+                stats.imported += len(new_entries)
+                stats.updated += len(duplicate_entries)
+            except _LockedInBatch:
+                # Some trade of the date locked its session: redo it row by row
+                # to find which rows row mode would still have accepted
+                _import_date_row_by_row(user, new_entries, duplicate_entries, stats)
+            except Exception as e:
+                for i, row, _ in new_entries + duplicate_entries:
+                    stats.record_error(i, row, e)
+
+        if progress:
+            progress(stats)
+
+    return stats
+
+
+class _LockedInBatch(Exception):
+    """A date's batch left its session locked (rolled back, see bulk_import_rows)."""
+
+
+def _import_date_row_by_row(user, new_entries, duplicate_entries, stats):
+    """Row-mode import of one date's entries, in file order, after a rolled-back batch."""
+    new_rows = {i for i, _, _ in new_entries}
+    for i, row, trade in sorted(new_entries + duplicate_entries, key=lambda entry: entry[0]):
+        try:
+            if i in new_rows:
+                trade._state.adding = True  # bulk_create marked it saved
+                save_imported_trade(trade, user)
+                retire_replaced_trades(user, row.get('replaces'))
+                stats.imported += 1
+            else:
+                _update_duplicate(trade, user)
+                stats.updated += 1
+        except Exception as e:
+            stats.record_error(i, row, e)
+
+
+def _write_session_batch(user, trade_date, trades, updated_trades=()):
+    """Insert (and refresh) one date's trades and run the rule engine once for its session."""
+    from discipline.counters import refresh_session_counters
+    from rules.engine import evaluate_rules_for_user, update_discipline_flags
+
+    session = get_session_for_date(user, trade_date)
+    for trade in trades:
+        trade.session = session
+    Trade.objects.bulk_create(trades, batch_size=BULK_BATCH_SIZE)
+    if updated_trades:
+        now = timezone.now()
+        for trade in updated_trades:
+            trade.updated_at = now
+        Trade.objects.bulk_update(updated_trades, _DUPLICATE_UPDATE_FIELDS, batch_size=BULK_BATCH_SIZE)
+
+    refresh_session_counters(session)
+    evaluated = list(trades) + list(updated_trades)
+    evaluate_rules_for_user(user=user, session=session, trades=evaluated)
+    update_discipline_flags(session, evaluated)
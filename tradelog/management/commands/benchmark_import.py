@@ -0,0 +1,196 @@
+"""
+Management command to benchmark trade import throughput.
+
+Builds synthetic broker files (tradelog/importers/synthetic.py) and times
+each stage of the import pipeline:
+  parse      → parse_csv / parse_excel
+  normalize  → detect_and_normalize
+  import     → the full TradeImportView request, inside a transaction that
+               is rolled back afterwards (nothing is left in the database)
+
+Each result records rows/sec (input legs per second), the stage's own peak
+memory (Python allocations traced by tracemalloc above what was already
+allocated when the stage started) and the number of DB queries. Tracing
+slows every stage down by the same factor, so compare runs with each other,
+not with untraced timings. Save a run with --output and pass it to
+--compare next time to see regressions.
+
+Usage:
+    python manage.py benchmark_import
+    python manage.py benchmark_import --legs 1000 10000 100000 1000000 --formats csv
+    python manage.py benchmark_import --output bench.json --compare last.json --fail-on-regression
+"""
+import io
+import json
+import time
+import tracemalloc
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from tradelog.importers.parser import parse_csv, parse_excel, detect_and_normalize
+from tradelog.importers.synthetic import BROKERS, FILE_FORMATS, generate_file
+
+STAGES = ('parse', 'normalize', 'import')
+
+
+class _QueryCounter:
+    """execute_wrapper that only counts queries (CaptureQueriesContext keeps every SQL string)."""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def _mb(size):
+    return round(size / (1024 * 1024), 1)
+
+
+class Command(BaseCommand):
+    help = "Benchmark trade import throughput on synthetic broker files."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--legs", type=int, nargs="+", default=[1000, 10000, 100000],
+                            help="File sizes in execution legs (e.g. 1000 10000 100000 1000000)")
+        parser.add_argument("--brokers", nargs="+", choices=BROKERS, default=list(BROKERS))
+        parser.add_argument("--formats", nargs="+", choices=FILE_FORMATS, default=list(FILE_FORMATS))
+        parser.add_argument("--stages", nargs="+", choices=STAGES, default=list(STAGES))
+        parser.add_argument("--mode", choices=("row", "batch"), default="batch",
+                            help="Import mode for the import stage")
+        parser.add_argument("--import-max-legs", type=int, default=10000,
+                            help="Skip the import stage for files larger than this")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--output", help="Write results as JSON to this file")
+        parser.add_argument("--compare", help="JSON file from an earlier run to compare rows/sec against")
+        parser.add_argument("--threshold", type=float, default=0.2,
+                            help="Relative rows/sec drop reported as a regression (default 0.2 = 20%%)")
+        parser.add_argument("--fail-on-regression", action="store_true")
+
+    def handle(self, *args, **options):
+        results = []
+        tracemalloc.start()
+        try:
+            for broker in options["brokers"]:
+                for file_format in options["formats"]:
+                    for legs in options["legs"]:
+                        data = generate_file(broker, legs, file_format, seed=options["seed"])
+                        results.extend(self._bench_file(broker, file_format, legs, data, options))
+        finally:
+            tracemalloc.stop()
+
+        report = {
+            'created_at': timezone.now().isoformat(),
+            'database': connection.vendor,
+            'mode': options["mode"],
+            'results': results,
+        }
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(f"Results written to {options['output']}")
+
+        if options["compare"]:
+            regressions = self._compare(results, options["compare"], options["threshold"])
+            if regressions and options["fail_on_regression"]:
+                raise CommandError(f"{regressions} benchmark(s) regressed by more than {options['threshold']:.0%}.")
+
+    def _bench_file(self, broker, file_format, legs, data, options):
+        stages = options["stages"]
+        results = []
+        parse = parse_csv if file_format == 'csv' else parse_excel
+
+        raw_rows = None
+        if 'parse' in stages or 'normalize' in stages:
+            raw_rows, result = self._measure(lambda: parse(io.BytesIO(data)))
+            if 'parse' in stages:
+                results.append(self._record(broker, file_format, legs, 'parse', result))
+
+        if 'normalize' in stages:
+            _, result = self._measure(lambda: list(detect_and_normalize(raw_rows, broker)[1]))
+            results.append(self._record(broker, file_format, legs, 'normalize', result))
+        raw_rows = None
+
+        if 'import' in stages and legs <= options["import_max_legs"]:
+            _, result = self._measure(lambda: self._run_import_view(broker, file_format, data, options["mode"]))
+            results.append(self._record(broker, file_format, legs, 'import', result))
+
+        return results
+
+    def _measure(self, fn):
+        counter = _QueryCounter()
+        # Peak of this stage alone, not the process's high-water mark
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        with connection.execute_wrapper(counter):
+            value = fn()
+        seconds = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1] - baseline
+        return value, {'seconds': seconds, 'queries': counter.count, 'peak_mb': _mb(peak)}
+
+    def _run_import_view(self, broker, file_format, data, mode):
+        from rest_framework.test import APIRequestFactory, force_authenticate
+        from accounts.models import User
+        from tradelog.views import TradeImportView
+
+        with transaction.atomic():
+            user = User.objects.create_user(
+                username='benchmark-import', email='benchmark-import@example.com', password=None,
+            )
+            upload = SimpleUploadedFile(f'{broker}.{file_format}', data)
+            request = APIRequestFactory().post(
+                '/api/tradelog/trades/import/',
+                {'file': upload, 'broker_name': broker, 'mode': mode},
+                format='multipart',
+            )
+            force_authenticate(request, user=user)
+            response = TradeImportView.as_view()(request)
+            transaction.set_rollback(True)
+
+        if response.status_code != 201:
+            raise CommandError(f"Import of synthetic {broker} {file_format} failed: {response.data}")
+        return response.data
+
+    def _record(self, broker, file_format, legs, stage, measured):
+        seconds = measured['seconds']
+        result = {
+            'case': f'{broker}/{file_format}/{legs}/{stage}',
+            'broker': broker,
+            'format': file_format,
+            'legs': legs,
+            'stage': stage,
+            'seconds': round(seconds, 4),
+            'rows_per_sec': round(legs / seconds, 1) if seconds else None,
+            'queries': measured['queries'],
+            'peak_mb': measured['peak_mb'],
+        }
+        self.stdout.write(
+            f"{result['case']:<34} {result['seconds']:>9.3f}s {result['rows_per_sec'] or 0:>12,.0f} rows/s "
+            f"{result['queries']:>8} queries {result['peak_mb']:>8.1f} MB"
+        )
+        return result
+
+    def _compare(self, results, path, threshold):
+        with open(path) as f:
+            previous = {r['case']: r for r in json.load(f)['results']}
+
+        regressions = 0
+        self.stdout.write(f"\nCompared with {path}:")
+        for result in results:
+            before = previous.get(result['case'])
+            if not before or not before.get('rows_per_sec') or not result['rows_per_sec']:
+                continue
+            change = result['rows_per_sec'] / before['rows_per_sec'] - 1
+            line = (f"{result['case']:<34} {before['rows_per_sec']:>12,.0f} → {result['rows_per_sec']:>12,.0f} rows/s "
+                    f"({change:+.1%}), queries {before['queries']} → {result['queries']}")
+            if change < -threshold:
+                regressions += 1
+                self.stdout.write(self.style.ERROR(line + "  REGRESSION"))
+            else:
+                self.stdout.write(line)
+        return regressions
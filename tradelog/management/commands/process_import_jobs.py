@@ -0,0 +1,35 @@
+"""
+Management command to drain queued background imports.
+
+Web processes run new jobs in their own thread pool; this command picks up
+anything left queued (e.g. after a restart) or can run as a dedicated worker.
+Each pass first fails jobs left running by a worker that died
+(IMPORT_JOB_STALE_SECONDS without progress).
+
+Usage:
+    python manage.py process_import_jobs
+    python manage.py process_import_jobs --watch --interval 5
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from tradelog.importers.jobs import run_queued_jobs
+
+
+class Command(BaseCommand):
+    help = "Process queued trade import jobs."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--limit", type=int, default=None, help="Process at most this many jobs per pass")
+        parser.add_argument("--watch", action="store_true", help="Keep polling for new jobs")
+        parser.add_argument("--interval", type=float, default=5.0, help="Seconds between polls with --watch")
+
+    def handle(self, *args, **options):
+        while True:
+            processed = run_queued_jobs(limit=options["limit"])
+            if processed:
+                self.stdout.write(self.style.SUCCESS(f"Processed {processed} import job(s)."))
+            if not options["watch"]:
+                break
+            time.sleep(options["interval"])
@@ -0,0 +1,36 @@
+"""
+Management command to delete expired Idempotency-Key records.
+
+Keys older than IDEMPOTENCY_KEY_TTL_HOURS are no longer replayed (see
+tradelog/idempotency.py); this removes them in chunks so the table stays
+small. Schedule it (e.g. hourly cron).
+
+Usage:
+    python manage.py purge_idempotency_keys
+    python manage.py purge_idempotency_keys --batch-size 5000
+"""
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from tradelog.idempotency import idempotency_ttl
+from tradelog.models import IdempotencyKey
+
+
+class Command(BaseCommand):
+    help = "Delete expired Idempotency-Key records."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=10000, help="Rows deleted per query")
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - idempotency_ttl()
+        deleted = 0
+        while True:
+            ids = list(
+                IdempotencyKey.objects.filter(created_at__lt=cutoff)
+                .values_list('pk', flat=True)[:options["batch_size"]]
+            )
+            if not ids:
+                break
+            deleted += IdempotencyKey.objects.filter(pk__in=ids).delete()[0]
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} expired idempotency key(s)."))
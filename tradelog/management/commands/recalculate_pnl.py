@@ -0,0 +1,45 @@
+"""
+Management command to recompute stored trade P&L in the database.
+
+total_pnl is recalculated with Trade.calculate_pnl()'s formula as a SQL
+expression (tradelog.models.trade_pnl_expression), one UPDATE per chunk of
+trades — nothing is loaded into Python. The affected users' session
+counters (realized P&L, loss streak) are rebuilt afterwards.
+
+Usage:
+    python manage.py recalculate_pnl
+    python manage.py recalculate_pnl --missing-only
+    python manage.py recalculate_pnl --user 42 --batch-size 20000
+"""
+from django.core.management.base import BaseCommand
+
+from discipline.counters import rebuild_session_counters
+from discipline.models import DisciplineSession
+from tradelog.models import Trade
+
+
+class Command(BaseCommand):
+    help = "Recalculate total_pnl for trades with set-based UPDATEs."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=5000, help="Trades per UPDATE")
+        parser.add_argument("--user", type=int, default=None, help="Only this user's trades (user id)")
+        parser.add_argument("--missing-only", action="store_true",
+                            help="Only closed trades whose total_pnl is NULL")
+        parser.add_argument("--include-deleted", action="store_true", help="Also recalculate soft-deleted trades")
+
+    def handle(self, *args, **options):
+        qs = Trade.objects.all()
+        if not options["include_deleted"]:
+            qs = qs.filter(deleted_at__isnull=True)
+        if options["user"] is not None:
+            qs = qs.filter(user_id=options["user"])
+        if options["missing_only"]:
+            qs = qs.filter(exit_price__isnull=False, total_pnl__isnull=True)
+
+        user_ids = list(qs.order_by().values_list("user_id", flat=True).distinct())
+        updated = qs.recalculate_pnl(batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Recalculated P&L for {updated} trade(s)."))
+
+        drifted = rebuild_session_counters(DisciplineSession.objects.filter(user_id__in=user_ids))
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt counters for {len(drifted)} session(s)."))
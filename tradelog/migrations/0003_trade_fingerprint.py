@@ -0,0 +1,100 @@
+# Generated by Django 5.0.14 on 2026-10-17 00:13
+
+import hashlib
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def _fingerprint(broker_name, symbol, trade_date, direction, quantity,
+                 entry_price, exit_price, trade_time):
+    # Frozen copy of tradelog.models.trade_fingerprint() as of this migration.
+    # Imports must keep producing the same values, so the live helper only
+    # changes together with a migration that re-fingerprints stored trades.
+    def dec(value):
+        if value is None or value == '':
+            return ''
+        return format(Decimal(str(value)).quantize(Decimal('0.0001')), 'f')
+
+    parts = [
+        (broker_name or '').strip().lower(),
+        (symbol or '').strip(),
+        trade_date.isoformat() if trade_date else '',
+        direction or '',
+        dec(quantity),
+        dec(entry_price),
+        dec(exit_price),
+        trade_time.strftime('%H:%M:%S') if trade_time else '',
+    ]
+    return hashlib.sha256('|'.join(parts).encode()).hexdigest()
+
+
+def backfill_fingerprints(apps, schema_editor):
+    """
+    Fingerprint previously imported trades so the next re-import of the same
+    file skips them. When a user already has duplicates, only the oldest copy
+    gets the fingerprint (the unique constraint is added after this step).
+    """
+    Trade = apps.get_model('tradelog', 'Trade')
+    qs = Trade.objects.filter(import_source='csv_import', fingerprint__isnull=True).order_by('user_id', 'created_at')
+
+    current_user = None
+    seen = set()
+    batch = []
+    for trade in qs.iterator(chunk_size=2000):
+        if trade.user_id != current_user:
+            current_user = trade.user_id
+            seen = set()
+        fp = _fingerprint(
+            trade.broker_name, trade.symbol, trade.trade_date, trade.direction,
+            trade.quantity, trade.entry_price, trade.exit_price, trade.trade_time,
+        )
+        if fp in seen:
+            continue
+        seen.add(fp)
+        trade.fingerprint = fp
+        batch.append(trade)
+        if len(batch) >= 2000:
+            Trade.objects.bulk_update(batch, ['fingerprint'])
+            batch = []
+    if batch:
+        Trade.objects.bulk_update(batch, ['fingerprint'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('discipline', '0002_initial'),
+        ('strategies', '0001_initial'),
+        ('tradelog', '0002_importjob'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importjob',
+            name='on_duplicate',
+            field=models.CharField(choices=[('skip', 'Skip'), ('update', 'Update')], default='skip', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='importjob',
+            name='rows_skipped',
+            field=models.IntegerField(default=0, help_text='Rows already imported earlier (same fingerprint)'),
+        ),
+        migrations.AddField(
+            model_name='importjob',
+            name='rows_updated',
+            field=models.IntegerField(default=0, help_text='Already-imported rows refreshed with on_duplicate=update'),
+        ),
+        migrations.AddField(
+            model_name='trade',
+            name='fingerprint',
+            field=models.CharField(blank=True, editable=False, help_text='Identity of an imported trade — re-imports of the same trade are skipped', max_length=64, null=True),
+        ),
+        migrations.RunPython(backfill_fingerprints, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='trade',
+            constraint=models.UniqueConstraint(fields=('user', 'fingerprint'), name='trades_user_fingerprint_uniq'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.14 on 2026-10-17 00:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tradelog', '0003_trade_fingerprint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importjob',
+            name='detected_formats',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
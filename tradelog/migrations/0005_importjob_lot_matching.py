@@ -0,0 +1,18 @@
+# Generated by Django 5.0.14 on 2026-10-17 00:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tradelog', '0004_importjob_detected_formats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importjob',
+            name='lot_matching',
+            field=models.CharField(blank=True, choices=[('', 'Off'), ('fifo', 'FIFO'), ('lifo', 'LIFO')], max_length=10),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.0.14 on 2026-10-17 00:24
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('discipline', '0002_initial'),
+        ('strategies', '0001_initial'),
+        ('tradelog', '0005_importjob_lot_matching'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='trade',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', True)), fields=['user', '-trade_date', '-trade_time', '-id'], name='trades_user_keyset_idx'),
+        ),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 5.0.14 on 2026-10-17 00:30
+
+from decimal import Decimal
+
+from django.db import migrations
+from django.db.models import Case, DecimalField, F, Q, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+BATCH_SIZE = 5000
+
+
+def _pnl_expression():
+    # Frozen copy of tradelog.models.trade_pnl_expression() as of this
+    # migration — later changes to the live formula must not alter it.
+    leverage = Case(
+        When(Q(leverage__isnull=True) | Q(leverage=0), then=Value(Decimal('1'))),
+        default=F('leverage'),
+    )
+    fees = Coalesce(F('fees'), Value(Decimal('0')))
+    return Case(
+        When(Q(exit_price__isnull=True) | Q(exit_price=0), then=Value(None)),
+        When(direction='long', then=(F('exit_price') - F('entry_price')) * F('quantity') * leverage - fees),
+        default=(F('entry_price') - F('exit_price')) * F('quantity') * leverage - fees,
+        output_field=DecimalField(max_digits=15, decimal_places=2),
+    )
+
+
+def backfill_trade_pnl(apps, schema_editor):
+    # Closed trades saved without a P&L (e.g. by older code paths) get it
+    # computed once here, so readers can rely on the stored column. One
+    # UPDATE per BATCH_SIZE rows, walked in primary-key order.
+    Trade = apps.get_model('tradelog', 'Trade')
+    pending = Trade.objects.filter(exit_price__isnull=False, total_pnl__isnull=True)
+
+    now = timezone.now()
+    last_pk = None
+    while True:
+        chunk = pending.order_by('pk')
+        if last_pk is not None:
+            chunk = chunk.filter(pk__gt=last_pk)
+        bounds = list(chunk.values_list('pk', flat=True)[:BATCH_SIZE])
+        if not bounds:
+            return
+        pending.filter(pk__gte=bounds[0], pk__lte=bounds[-1]).update(
+            total_pnl=_pnl_expression(), updated_at=now,
+        )
+        last_pk = bounds[-1]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tradelog', '0006_trade_keyset_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_trade_pnl, migrations.RunPython.noop),
+    ]
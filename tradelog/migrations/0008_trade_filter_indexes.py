@@ -0,0 +1,33 @@
+# Generated by Django 5.0.14 on 2026-10-17 00:32
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('discipline', '0002_initial'),
+        ('strategies', '0001_initial'),
+        ('tradelog', '0007_backfill_trade_pnl'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='trade',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', True)), fields=['user', 'symbol', '-trade_date', '-trade_time', '-id'], name='trades_user_symbol_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='trade',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', True)), fields=['user', 'strategy', '-trade_date', '-trade_time', '-id'], name='trades_user_strategy_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='trade',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', True)), fields=['user', 'market_type', '-trade_date', '-trade_time', '-id'], name='trades_user_market_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='trade',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', True)), fields=['user', 'total_pnl'], name='trades_user_pnl_idx'),
+        ),
+    ]
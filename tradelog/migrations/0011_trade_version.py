@@ -0,0 +1,18 @@
+# Generated by Django 5.0.14 on 2026-10-17 00:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tradelog', '0010_idempotencykey'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trade',
+            name='version',
+            field=models.PositiveIntegerField(default=1, help_text='Bumped on every edit — the trade ETag'),
+        ),
+    ]
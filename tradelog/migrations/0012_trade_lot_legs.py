@@ -0,0 +1,18 @@
+# Generated by Django 5.0.14 on 2026-10-17 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tradelog', '0011_trade_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trade',
+            name='lot_legs',
+            field=models.JSONField(blank=True, default=list, editable=False, help_text='[leg key, quantity] of the executions a lot-matched import built this trade from'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.0.14 on 2026-10-17 09:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tradelog', '0012_trade_lot_legs'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='trade',
+            name='trades_user_fingerprint_uniq',
+        ),
+        migrations.AddConstraint(
+            model_name='trade',
+            constraint=models.UniqueConstraint(condition=models.Q(('deleted_at__isnull', True)), fields=('user', 'fingerprint'), name='trades_user_fingerprint_uniq'),
+        ),
+    ]
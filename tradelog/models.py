@@ -1,6 +1,82 @@
+import hashlib
 import uuid
+from decimal import ROUND_HALF_UP, Decimal
 from django.db import models
+from django.db.models import Case, DecimalField, F, Q, Value, When
+from django.db.models.functions import Coalesce
 from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+
+
+def trade_fingerprint(broker_name, symbol, trade_date, direction, quantity,
+                      entry_price, exit_price, trade_time):
+    """
+    Stable identity of an imported trade, used to skip re-imported rows.
+    Decimals are quantized to the model precision so '100' and '100.0000'
+    produce the same fingerprint.
+    """
+    def dec(value):
+        if value is None or value == '':
+            return ''
+        return format(Decimal(str(value)).quantize(Decimal('0.0001')), 'f')
+
+    parts = [
+        (broker_name or '').strip().lower(),
+        (symbol or '').strip(),
+        trade_date.isoformat() if trade_date else '',
+        direction or '',
+        dec(quantity),
+        dec(entry_price),
+        dec(exit_price),
+        trade_time.strftime('%H:%M:%S') if trade_time else '',
+    ]
+    return hashlib.sha256('|'.join(parts).encode()).hexdigest()
+
+
+def trade_pnl_expression():
+    """
+    Trade.calculate_pnl() as a database expression, for set-based updates.
+    Same rules: no P&L without a (non-zero) exit price, a missing or zero
+    leverage counts as 1x, and fees are subtracted.
+    """
+    decimal = DecimalField(max_digits=15, decimal_places=2)
+    leverage = Case(
+        When(Q(leverage__isnull=True) | Q(leverage=0), then=Value(Decimal('1'))),
+        default=F('leverage'),
+    )
+    fees = Coalesce(F('fees'), Value(Decimal('0')))
+    return Case(
+        When(Q(exit_price__isnull=True) | Q(exit_price=0), then=Value(None)),
+        When(direction='long', then=(F('exit_price') - F('entry_price')) * F('quantity') * leverage - fees),
+        default=(F('entry_price') - F('exit_price')) * F('quantity') * leverage - fees,
+        output_field=decimal,
+    )
+
+
+class TradeQuerySet(models.QuerySet):
+
+    def recalculate_pnl(self, batch_size=5000):
+        """
+        Recompute total_pnl in the database, one UPDATE per `batch_size` rows
+        (walked in primary-key order so no chunk is read twice). Touches
+        updated_at so delta sync sends the rows again. Returns the number of
+        rows updated.
+        """
+        now = timezone.now()
+        updated = 0
+        last_pk = None
+        while True:
+            chunk = self.order_by('pk')
+            if last_pk is not None:
+                chunk = chunk.filter(pk__gt=last_pk)
+            bounds = list(chunk.values_list('pk', flat=True)[:batch_size])
+            if not bounds:
+                return updated
+            updated += self.filter(pk__gte=bounds[0], pk__lte=bounds[-1]).update(
+                total_pnl=trade_pnl_expression(), updated_at=now,
+            )
+            last_pk = bounds[-1]
 
 
 class Trade(models.Model):
@@ -68,6 +144,7 @@ class Trade(models.Model):
     rules_followed = models.JSONField(default=list, blank=True)
     is_disciplined = models.BooleanField(default=True)
     is_tagged_complete = models.BooleanField(default=False, help_text='True when strategy+psychology fully tagged')
+    version = models.PositiveIntegerField(default=1, help_text='Bumped on every edit — the trade ETag')
 
     # ── Media 
     screenshot_urls = models.JSONField(default=list, blank=True)
@@ -75,6 +152,14 @@ class Trade(models.Model):
     # ── Import metadata 
     import_source = models.CharField(max_length=15, choices=IMPORT_SOURCE_CHOICES, default='manual')
     broker_name = models.CharField(max_length=100, blank=True, null=True)
+    fingerprint = models.CharField(
+        max_length=64, null=True, blank=True, editable=False,
+        help_text='Identity of an imported trade — re-imports of the same trade are skipped'
+    )
+    lot_legs = models.JSONField(
+        default=list, blank=True, editable=False,
+        help_text='[leg key, quantity] of the executions a lot-matched import built this trade from'
+    )
 
     # ── Soft delete 
     deleted_at = models.DateTimeField(null=True, blank=True)
@@ -82,17 +167,67 @@ class Trade(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = TradeQuerySet.as_manager()
+
     class Meta:
         db_table = 'trades'
         ordering = ['-trade_date', '-trade_time']
         indexes = [
             models.Index(fields=['user', 'trade_date']),
             models.Index(fields=['user', 'session']),
+            # Keyset pagination of the trade list (pagination.TradeCursorPagination)
+            models.Index(
+                fields=['user', '-trade_date', '-trade_time', '-id'],
+                name='trades_user_keyset_idx',
+                condition=models.Q(deleted_at__isnull=True),
+            ),
+            # Filtered trade lists (tradelog/filters.py) — equality column
+            # first, then the list ordering, so filtered pages are range scans
+            models.Index(
+                fields=['user', 'symbol', '-trade_date', '-trade_time', '-id'],
+                name='trades_user_symbol_idx',
+                condition=models.Q(deleted_at__isnull=True),
+            ),
+            models.Index(
+                fields=['user', 'strategy', '-trade_date', '-trade_time', '-id'],
+                name='trades_user_strategy_idx',
+                condition=models.Q(deleted_at__isnull=True),
+            ),
+            models.Index(
+                fields=['user', 'market_type', '-trade_date', '-trade_time', '-id'],
+                name='trades_user_market_idx',
+                condition=models.Q(deleted_at__isnull=True),
+            ),
+            # P&L ranges and the wins/losses quick filters
+            models.Index(
+                fields=['user', 'total_pnl'],
+                name='trades_user_pnl_idx',
+                condition=models.Q(deleted_at__isnull=True),
+            ),
+            # Delta sync (tradelog/sync.py) — not partial: deletions are synced too
+            models.Index(fields=['user', 'updated_at', 'id'], name='trades_user_updated_idx'),
+        ]
+        constraints = [
+            # Live trades only: a trade the user deleted can be imported again
+            models.UniqueConstraint(
+                fields=['user', 'fingerprint'], name='trades_user_fingerprint_uniq',
+                condition=models.Q(deleted_at__isnull=True),
+            ),
         ]
 
     def __str__(self):
         return f"{self.symbol} {self.direction.upper()} {self.trade_date}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Keep the loaded row so saving the trade can move its session's
+        # running counters by the difference (discipline/counters.py reads it
+        # only then). Partially loaded trades fall back to a full refresh.
+        if len(values) == len(cls._meta.concrete_fields):
+            instance._loaded_values = values
+        return instance
+
     def calculate_pnl(self):
         """Calculate and set total_pnl using the unified formula."""
         if not self.exit_price:
@@ -108,8 +243,134 @@ class Trade(models.Model):
             raw_pnl = (exit_p - entry) * qty * leverage
         else:
             raw_pnl = (entry - exit_p) * qty * leverage
-        self.total_pnl = raw_pnl - fees
+        # Rounded as the column stores it, so the in-memory value is the saved one
+        self.total_pnl = Decimal(raw_pnl - fees).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+
+    def update_tagging_status(self):
+        """Fix 5: mark tagging complete once strategy and psychology fields are all present."""
+        if self.strategy_id and self.emotional_state and self.entry_confidence:
+            self.is_tagged_complete = True
+
+    def compute_fingerprint(self):
+        return trade_fingerprint(
+            self.broker_name, self.symbol, self.trade_date, self.direction,
+            self.quantity, self.entry_price, self.exit_price, self.trade_time,
+        )
 
     @property
     def is_winner(self):
-        return self.total_pnl is not None and self.total_pnl > 0
\ No newline at end of file
+        return self.total_pnl is not None and self.total_pnl > 0
+
+class ImportJob(models.Model):
+    """
+    Background trade import. The row itself is the queue entry: a worker
+    claims it by moving status queued → running, then records progress
+    counters and the error report while the file is processed.
+    """
+
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+    ]
+    MODE_CHOICES = [
+        ('row', 'Row'),
+        ('batch', 'Batch'),
+    ]
+    ON_DUPLICATE_CHOICES = [
+        ('skip', 'Skip'),
+        ('update', 'Update'),
+    ]
+    LOT_MATCHING_CHOICES = [
+        ('', 'Off'),
+        ('fifo', 'FIFO'),
+        ('lifo', 'LIFO'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='import_jobs')
+    file = models.FileField(upload_to='imports/', blank=True)
+    original_filename = models.CharField(max_length=255)
+    broker_name = models.CharField(max_length=100, blank=True)
+    mode = models.CharField(max_length=10, choices=MODE_CHOICES, default='row')
+    on_duplicate = models.CharField(max_length=10, choices=ON_DUPLICATE_CHOICES, default='skip')
+    lot_matching = models.CharField(max_length=10, choices=LOT_MATCHING_CHOICES, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    detected_broker = models.CharField(max_length=100, blank=True)
+    detected_formats = models.JSONField(default=dict, blank=True)  # column → detected date/time format
+
+    # ── Progress 
+    rows_parsed = models.IntegerField(default=0)
+    rows_inserted = models.IntegerField(default=0)
+    rows_failed = models.IntegerField(default=0)
+    rows_blocked = models.IntegerField(default=0, help_text='Rows rejected because their session was locked')
+    rows_skipped = models.IntegerField(default=0, help_text='Rows already imported earlier (same fingerprint)')
+    rows_updated = models.IntegerField(default=0, help_text='Already-imported rows refreshed with on_duplicate=update')
+    errors = models.JSONField(default=list, blank=True)  # Full per-row error report
+    error_message = models.TextField(blank=True)  # Fatal error that stopped the job
+
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'import_jobs'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+        ]
+
+    def __str__(self):
+        return f"Import {self.original_filename} [{self.status.upper()}]"
+
+
+class SyncTombstone(models.Model):
+    """
+    A hard-deleted row the delta sync feed (tradelog/sync.py) still has to
+    report, so offline clients can drop their copy. Soft-deleted models
+    (trades) don't need one — their deleted_at is the tombstone.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='sync_tombstones')
+    collection = models.CharField(max_length=30)  # sync collection name, e.g. 'journals'
+    object_id = models.UUIDField()
+    deleted_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        db_table = 'sync_tombstones'
+        indexes = [
+            models.Index(fields=['user', 'collection', 'deleted_at', 'id'], name='tombstones_user_sync_idx'),
+        ]
+
+    def __str__(self):
+        return f"Deleted {self.collection} {self.object_id}"
+
+
+class IdempotencyKey(models.Model):
+    """
+    A client-supplied Idempotency-Key and the response it produced
+    (tradelog/idempotency.py). status_code is NULL while the first request
+    is still running. Rows expire after IDEMPOTENCY_KEY_TTL_HOURS.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='idempotency_keys')
+    key = models.CharField(max_length=255)
+    endpoint = models.CharField(max_length=255)  # "POST /api/tradelog/trades/"
+    request_hash = models.CharField(max_length=64)
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    response_body = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'idempotency_keys'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'key'], name='idempotency_keys_user_key_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['created_at']),  # TTL purge
+        ]
+
+    def __str__(self):
+        return f"{self.endpoint} [{self.key}]"
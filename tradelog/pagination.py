@@ -1,6 +1,232 @@
-from rest_framework.pagination import PageNumberPagination
+import base64
+import json
+from collections import namedtuple
+from datetime import date, datetime, time
+from uuid import UUID
+
+from django.core.exceptions import ValidationError
+from django.db.models import F, Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
 
 class StandardResultsSetPagination(PageNumberPagination):
     page_size = 5
-    page_size_query_param = 'page_size' 
-    max_page_size = 100
\ No newline at end of file
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+
+# ─── Keyset helpers ───────────────────────────────────────────────────────────
+#
+# A keyset is an ordered list of fields ending in a unique one (usually id).
+# Descending nullable fields sort NULLs first and ascending ones NULLs last —
+# PostgreSQL's defaults, applied explicitly so every backend agrees.
+
+KeysetField = namedtuple('KeysetField', 'name descending nullable')
+
+
+def keyset_ordering(keys, reverse=False):
+    """order_by() expressions for a keyset (reversed for walking backwards)."""
+    ordering = []
+    for key in keys:
+        descending = key.descending != reverse
+        if descending:
+            ordering.append(F(key.name).desc(nulls_first=True) if key.nullable else F(key.name).desc())
+        else:
+            ordering.append(F(key.name).asc(nulls_last=True) if key.nullable else F(key.name).asc())
+    return ordering
+
+
+def keyset_after(keys, position, reverse=False):
+    """Q matching rows that sort strictly after `position` (one value per key)."""
+    branches = []
+    equal = Q()
+    for key, value in zip(keys, position):
+        descending = key.descending != reverse
+        after = _after(key, value, descending)
+        if after is not None:
+            branches.append(equal & after)
+        equal &= Q(**{f'{key.name}__isnull': True}) if value is None else Q(**{key.name: value})
+
+    if not branches:
+        return Q(pk__in=[])
+    condition = branches[0]
+    for branch in branches[1:]:
+        condition |= branch
+    return condition
+
+
+def _after(key, value, descending):
+    if value is None:
+        # NULLs are first in descending order and last in ascending order
+        return Q(**{f'{key.name}__isnull': False}) if descending else None
+    after = Q(**{f'{key.name}__lt' if descending else f'{key.name}__gt': value})
+    if key.nullable and not descending:
+        after |= Q(**{f'{key.name}__isnull': True})
+    return after
+
+
+def _encode_value(value):
+    if isinstance(value, (date, datetime, time)):
+        return value.isoformat()
+    if isinstance(value, UUID):
+        return str(value)
+    return value
+
+
+def encode_cursor(payload):
+    """Opaque URL-safe cursor for a JSON-serialisable dict (values may be dates/times/UUIDs)."""
+    data = {k: [_encode_value(v) for v in val] if isinstance(val, (list, tuple)) else _encode_value(val)
+            for k, val in payload.items()}
+    return base64.urlsafe_b64encode(json.dumps(data, separators=(',', ':')).encode()).decode().rstrip('=')
+
+
+def decode_position(fields, values):
+    """
+    A keyset position from a cursor, each value run through its model field's
+    to_python() so tampered values fail here and not in the query. Raises
+    ValueError.
+    """
+    if not isinstance(values, list) or len(values) != len(fields):
+        raise ValueError('Invalid cursor.')
+    position = []
+    for field, value in zip(fields, values):
+        if value is None and not field.null:
+            raise ValueError('Invalid cursor.')
+        try:
+            position.append(field.to_python(value))
+        except (ValidationError, TypeError, ValueError):
+            raise ValueError('Invalid cursor.')
+    return position
+
+
+def decode_cursor(cursor, fields=None):
+    """
+    Inverse of encode_cursor. `fields` ({key: [model field, ...]}) decodes
+    those payload values as keyset positions. Raises ValueError on a
+    malformed cursor.
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+    except Exception:
+        raise ValueError('Invalid cursor.')
+    if not isinstance(payload, dict):
+        raise ValueError('Invalid cursor.')
+    for key, key_fields in (fields or {}).items():
+        if key in payload:
+            payload[key] = decode_position(key_fields, payload[key])
+    return payload
+
+
+# ─── Trade list cursor pagination ─────────────────────────────────────────────
+
+class TradeCursorPagination(BasePagination):
+    """
+    Keyset pagination over (trade_date desc, trade_time desc, id desc) — the
+    trade list's ordering with id as the tie-breaker — so every page is an
+    index range scan no matter how deep it is.
+
+    `?cursor=` comes from the `next` / `previous` links. The total count is
+    only computed with `?count=true`.
+    """
+    page_size = StandardResultsSetPagination.page_size
+    page_size_query_param = 'page_size'
+    max_page_size = StandardResultsSetPagination.max_page_size
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+    keys = (
+        KeysetField('trade_date', descending=True, nullable=False),
+        KeysetField('trade_time', descending=True, nullable=True),
+        KeysetField('id', descending=True, nullable=False),
+    )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self._get_page_size(request)
+
+        reverse = False
+        position = None
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            fields = [queryset.model._meta.get_field(key.name) for key in self.keys]
+            try:
+                payload = decode_cursor(cursor, fields={'v': fields})
+                reverse = payload.get('d') == 'p'
+                position = payload['v']
+            except (ValueError, KeyError):
+                raise NotFound('Invalid cursor.')
+
+        self.count = None
+        if str(request.query_params.get(self.count_query_param, '')).lower() in ('1', 'true', 'yes'):
+            self.count = queryset.count()
+
+        queryset = queryset.order_by(*keyset_ordering(self.keys, reverse=reverse))
+        if position is not None:
+            queryset = queryset.filter(keyset_after(self.keys, position, reverse=reverse))
+
+        rows = list(queryset[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if reverse:
+            rows.reverse()
+
+        # Walking forward there is a previous page whenever we started from a
+        # cursor; walking backward there is always a next page.
+        self.has_next = has_more if not reverse else True
+        self.has_previous = (position is not None) if not reverse else has_more
+        self.page = rows
+        return rows
+
+    def _get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(size, 1), self.max_page_size)
+
+    def _position(self, obj):
+        # Pages may hold model instances or .values() dicts
+        if isinstance(obj, dict):
+            return [obj[key.name] for key in self.keys]
+        return [getattr(obj, key.name) for key in self.keys]
+
+    def _link(self, direction, obj):
+        cursor = encode_cursor({'d': direction, 'v': self._position(obj)})
+        return replace_query_param(self.base_url, self.cursor_query_param, cursor)
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self._link('n', self.page[-1])
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self._link('p', self.page[0])
+
+    def get_paginated_response(self, data):
+        response = {
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        }
+        if self.count is not None:
+            response = {'count': self.count, **response}
+        return Response(response)
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'count': {'type': 'integer'},
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
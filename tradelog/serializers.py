@@ -1,9 +1,68 @@
+from decimal import Decimal
+
 from rest_framework import serializers
-from tradelog.models import Trade
+from tradelog.models import Trade, ImportJob
+
+# Columns of the compact trade table (`?view=compact` on the trade list)
+TRADE_COMPACT_FIELDS = (
+    'id', 'trade_date', 'trade_time', 'symbol', 'direction', 'quantity',
+    'entry_price', 'exit_price', 'total_pnl', 'is_disciplined',
+)
 
 
 class TradeManagementSerializer(serializers.ModelSerializer):
     class Meta:
         model = Trade
-        exclude = ['deleted_at']
-        read_only_fields = ['id', 'user', 'total_pnl', 'is_disciplined', 'session', 'created_at', 'updated_at']
\ No newline at end of file
+        exclude = ['deleted_at', 'fingerprint', 'lot_legs']
+        read_only_fields = ['id', 'user', 'total_pnl', 'is_disciplined', 'session', 'version', 'created_at', 'updated_at']
+
+
+class TradeValuesRepresentation:
+    """
+    Render `Trade.objects.values(*fields)` rows exactly like
+    TradeManagementSerializer would, without building model instances or
+    running the serializer field by field. Used for sparse trade lists.
+    """
+
+    def __init__(self, fields):
+        serializer_fields = TradeManagementSerializer().fields
+        self.converters = [(name, self._converter(serializer_fields[name])) for name in fields]
+
+    @classmethod
+    def field_names(cls):
+        return set(TradeManagementSerializer().fields)
+
+    @staticmethod
+    def _converter(field):
+        if isinstance(field, serializers.DecimalField):
+            quantum = Decimal(1).scaleb(-field.decimal_places)
+            return lambda value: f'{value.quantize(quantum):f}'
+        if isinstance(field, serializers.DateTimeField):
+            return field.to_representation
+        if isinstance(field, (serializers.DateField, serializers.TimeField)):
+            return lambda value: value.isoformat()
+        if isinstance(field, serializers.UUIDField):
+            return str
+        # Char/choice/bool/int/JSON values and related-object ids pass through
+        return None
+
+    def represent(self, row):
+        item = {}
+        for name, convert in self.converters:
+            value = row[name]
+            item[name] = value if convert is None or value is None else convert(value)
+        return item
+
+    def __call__(self, rows):
+        return [self.represent(row) for row in rows]
+
+class ImportJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ImportJob
+        fields = [
+            'id', 'status', 'original_filename', 'broker_name', 'mode', 'detected_broker', 'detected_formats',
+            'on_duplicate', 'lot_matching', 'rows_parsed', 'rows_inserted', 'rows_failed', 'rows_blocked',
+            'rows_skipped', 'rows_updated', 'error_message',
+            'started_at', 'finished_at', 'created_at',
+        ]
+        read_only_fields = fields
@@ -0,0 +1,138 @@
+"""
+Delta sync for offline clients — GET /api/tradelog/sync/.
+
+Every synced collection is walked in (updated_at, id) order from the
+client's cursor, on a (user, updated_at, id) index, so a sync reads only
+the rows that changed since the last one. Deletions are reported as
+tombstones: soft-deleted trades through their deleted_at, hard-deleted
+journal entries through SyncTombstone rows.
+
+Rows changed in the last SYNC_SETTLE_SECONDS are not returned yet: a
+transaction that started earlier may still commit rows stamped before them,
+and the cursor would already have moved past those.
+"""
+import uuid
+from collections import namedtuple
+from datetime import timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .pagination import KeysetField, decode_position, keyset_after, keyset_ordering
+
+SYNC_COLLECTIONS = ('trades', 'journals', 'sessions')
+
+SYNC_DEFAULT_LIMIT = 200
+SYNC_MAX_LIMIT = 1000
+
+# Sorts before every real id (all synced models have UUID keys)
+_FIRST_ID = uuid.UUID(int=0)
+
+# One keyset-ordered source of changes. `deleted` tells whether a row is a
+# tombstone; `render` serializes a page of live rows.
+_Stream = namedtuple('_Stream', 'name collection queryset timestamp deleted render')
+
+
+def _render_trades(rows):
+    from .serializers import TradeManagementSerializer
+    return TradeManagementSerializer(rows, many=True).data
+
+
+def _render_journals(rows):
+    from journal.serializers import DailyJournalSerializer
+    return DailyJournalSerializer(rows, many=True).data
+
+
+def _render_sessions(rows):
+    from discipline.serializers import DisciplineSessionSerializer
+    return DisciplineSessionSerializer(rows, many=True).data
+
+
+def _streams(user):
+    from discipline.models import DisciplineSession
+    from journal.models import DailyJournal
+    from .models import SyncTombstone, Trade
+
+    return [
+        _Stream('trades', 'trades', Trade.objects.filter(user=user), 'updated_at',
+                lambda t: t.deleted_at is not None, _render_trades),
+        _Stream('journals', 'journals', DailyJournal.objects.filter(user=user), 'updated_at',
+                lambda j: False, _render_journals),
+        _Stream('journal_tombstones', 'journals',
+                SyncTombstone.objects.filter(user=user, collection='journals'), 'deleted_at',
+                lambda t: True, None),
+        _Stream('sessions', 'sessions', DisciplineSession.objects.filter(user=user), 'updated_at',
+                lambda s: False, _render_sessions),
+    ]
+
+
+def _tombstone(row):
+    # SyncTombstone rows point at the deleted object; soft-deleted rows are it
+    return {
+        'id': str(getattr(row, 'object_id', row.pk)),
+        'deleted_at': row.deleted_at.isoformat(),
+    }
+
+
+def parse_since(value):
+    """`?since=` ISO datetime → aware datetime. Raises ValueError."""
+    since = parse_datetime(value or '')
+    if since is None:
+        raise ValueError('since must be an ISO 8601 datetime.')
+    if timezone.is_naive(since):
+        since = timezone.make_aware(since, dt_timezone.utc)
+    return since
+
+
+def sync_changes(user, positions=None, since=None, collections=SYNC_COLLECTIONS, limit=SYNC_DEFAULT_LIMIT):
+    """
+    Changes for `user` after `positions` ({stream: [timestamp, id]}, from a
+    previous call) or, for streams without a position, changed at or after
+    `since` (everything when None). Raises ValueError for a position that
+    doesn't decode.
+
+    Returns (changes, positions, has_more): changes is
+    {collection: {'updated': [...], 'deleted': [...]}} and positions is
+    what the next call should pass back — one for every requested stream,
+    including those that had no changes.
+    """
+    positions = dict(positions or {})
+    upper = timezone.now() - timedelta(seconds=getattr(settings, 'SYNC_SETTLE_SECONDS', 5))
+    changes = {name: {'updated': [], 'deleted': []} for name in collections}
+    has_more = False
+
+    for stream in _streams(user):
+        if stream.collection not in collections:
+            continue
+        keys = (
+            KeysetField(stream.timestamp, descending=False, nullable=False),
+            KeysetField('id', descending=False, nullable=False),
+        )
+        qs = stream.queryset.filter(**{f'{stream.timestamp}__lt': upper})
+        position = positions.get(stream.name)
+        if position:
+            model = stream.queryset.model
+            position = decode_position([model._meta.get_field(key.name) for key in keys], position)
+            qs = qs.filter(keyset_after(keys, position))
+        elif since is not None:
+            qs = qs.filter(**{f'{stream.timestamp}__gte': since})
+
+        rows = list(qs.order_by(*keyset_ordering(keys))[:limit + 1])
+        if len(rows) > limit:
+            rows = rows[:limit]
+            has_more = True
+        if not rows:
+            if not position:
+                # Nothing changed before the settle bound: the next call starts there
+                positions[stream.name] = [upper, _FIRST_ID]
+            continue
+
+        live = [row for row in rows if not stream.deleted(row)]
+        if live:
+            changes[stream.collection]['updated'].extend(stream.render(live))
+        changes[stream.collection]['deleted'].extend(_tombstone(row) for row in rows if stream.deleted(row))
+        last = rows[-1]
+        positions[stream.name] = [getattr(last, stream.timestamp), last.pk]
+
+    return changes, positions, has_more
@@ -1,3 +1,1598 @@
-from django.test import TestCase
+import io
+import zipfile
+from decimal import Decimal
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.db.models import F
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from accounts.models import User
+from discipline.models import DisciplineSession
+from rules.models import Rule
+from tradelog.models import Trade
+from tradelog.pagination import encode_cursor
+
+
+def _trade_payload(**overrides):
+    payload = {
+        'trade_date': '2025-03-03',
+        'trade_time': '09:30:00',
+        'symbol': 'INFY',
+        'market_type': 'indian_stocks',
+        'direction': 'long',
+        'quantity': '10',
+        'entry_price': '100',
+        'exit_price': '105',
+        'fees': '2',
+    }
+    payload.update(overrides)
+    return payload
+
+
+def _zerodha_upload(legs, name='tradebook.csv'):
+    """A Zerodha tradebook with one execution per (symbol, date, side, qty, price, time) leg."""
+    lines = ['symbol,isin,trade_date,exchange,segment,series,trade_type,auction,'
+             'quantity,price,trade_id,order_id,order_execution_time']
+    for i, (symbol, day, side, qty, price, at) in enumerate(legs, start=1):
+        lines.append(f'{symbol},INE000000000,{day},NSE,EQ,EQ,{side},false,{qty},{price},{i},{i},{day}T{at}')
+    return SimpleUploadedFile(name, ('\n'.join(lines) + '\n').encode(), content_type='text/csv')
+
+
+class ReimportFingerprintTests(TestCase):
+    """Re-imported rows are matched by fingerprint and skipped or refreshed, never duplicated."""
+
+    LEGS = [
+        ('INFY', '2025-01-02', 'buy', 10, 100, '09:15:00'),
+        ('INFY', '2025-01-02', 'sell', 10, 105, '10:15:00'),
+    ]
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='reimport', email='reimport@example.com', password='pw')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def _import(self, **params):
+        response = self.client.post(
+            '/api/tradelog/trades/import/', {'file': _zerodha_upload(self.LEGS), **params}, format='multipart',
+        )
+        self.assertEqual(response.status_code, 201)
+        return response.data
+
+    def _assert_reimport(self, mode):
+        self.assertEqual(self._import(mode=mode)['imported'], 1)
+        trade = Trade.objects.get(user=self.user)
+        # Edited since the first import
+        Trade.objects.filter(pk=trade.pk).update(fees=Decimal('7'), total_pnl=Decimal('43'))
+
+        data = self._import(mode=mode)
+        self.assertEqual((data['imported'], data['skipped'], data['updated']), (0, 1, 0))
+        self.assertEqual(Trade.objects.get(pk=trade.pk).fees, Decimal('7'))
+
+        data = self._import(mode=mode, on_duplicate='update')
+        self.assertEqual((data['imported'], data['skipped'], data['updated']), (0, 0, 1))
+        refreshed = Trade.objects.get(pk=trade.pk)
+        self.assertEqual((refreshed.fees, refreshed.total_pnl), (trade.fees, trade.total_pnl))
+        self.assertEqual(refreshed.version, trade.version + 1)
+        self.assertEqual(Trade.objects.filter(user=self.user).count(), 1)
+
+    def test_reimport_row_mode(self):
+        self._assert_reimport('row')
+
+    def test_reimport_batch_mode(self):
+        self._assert_reimport('batch')
+
+    def _assert_deleted_trade_is_imported_again(self, mode, on_duplicate):
+        self._import(mode=mode)
+        deleted = Trade.objects.get(user=self.user, deleted_at__isnull=True)
+        self.assertEqual(self.client.delete(f'/api/tradelog/trades/{deleted.pk}/').status_code, 204)
+
+        data = self._import(mode=mode, on_duplicate=on_duplicate)
+        self.assertEqual((data['imported'], data['skipped'], data['updated']), (1, 0, 0))
+        live = Trade.objects.get(user=self.user, deleted_at__isnull=True)
+        self.assertNotEqual(live.pk, deleted.pk)
+        self.assertEqual(live.fingerprint, deleted.fingerprint)
+        # The deleted row is left alone
+        stale = Trade.objects.get(pk=deleted.pk)
+        self.assertEqual((stale.version, stale.deleted_at is not None), (deleted.version + 1, True))
+
+    def test_deleted_trade_is_imported_again_row_mode(self):
+        self._assert_deleted_trade_is_imported_again('row', 'skip')
+        self._assert_deleted_trade_is_imported_again('row', 'update')
+
+    def test_deleted_trade_is_imported_again_batch_mode(self):
+        self._assert_deleted_trade_is_imported_again('batch', 'skip')
+        self._assert_deleted_trade_is_imported_again('batch', 'update')
+
+
+class DateTimeSnifferTests(SimpleTestCase):
+    """The date sniffer only settles on a format once a value rules the other candidates out."""
+
+    def _sniffer(self):
+        from tradelog.importers.dates import DateTimeSniffer
+        from tradelog.importers.writer import TRADE_DATE_FORMATS
+
+        report = {}
+        return DateTimeSniffer(TRADE_DATE_FORMATS, name='trade_date', report=report), report
+
+    def _dates(self, sniffer, values):
+        return [sniffer.parse(value).date().isoformat() for value in values]
+
+    def test_ambiguous_values_use_the_preferred_format(self):
+        sniffer, report = self._sniffer()
+        self.assertEqual(self._dates(sniffer, ['03/04/2025', '05/06/2025', '12/11/2025']),
+                         ['2025-04-03', '2025-06-05', '2025-11-12'])
+        self.assertEqual((report, sniffer.ambiguous, sniffer.mismatches), ({'trade_date': '%d/%m/%Y'}, 3, 0))
+
+    def test_deciding_value_switches_the_format(self):
+        sniffer, report = self._sniffer()
+        self.assertEqual(self._dates(sniffer, ['03/04/2025', '12/25/2025', '05/06/2025']),
+                         ['2025-04-03', '2025-12-25', '2025-05-06'])
+        self.assertEqual((report, sniffer.ambiguous), ({'trade_date': '%m/%d/%Y'}, 1))
+
+    def test_unambiguous_first_value_settles_the_format(self):
+        sniffer, report = self._sniffer()
+        self.assertEqual(self._dates(sniffer, ['25/03/2025', '03/04/2025']), ['2025-03-25', '2025-04-03'])
+        self.assertEqual((report, sniffer.ambiguous), ({'trade_date': '%d/%m/%Y'}, 0))
+
+    def test_mixed_formats_fall_back_per_row(self):
+        sniffer, report = self._sniffer()
+        self.assertEqual(self._dates(sniffer, ['12/25/2025', '25/12/2025', '2025-01-02', '01/02/2025']),
+                         ['2025-12-25', '2025-12-25', '2025-01-02', '2025-01-02'])
+        self.assertEqual((report, sniffer.mismatches), ({'trade_date': '%m/%d/%Y'}, 2))
+        self.assertIsNone(sniffer.parse('31/31/2025'))
+        self.assertIsNone(sniffer.parse(''))
+
+
+class CsvStreamingTests(SimpleTestCase):
+    """iter_csv decodes uploads chunk by chunk without splitting characters or lines."""
+
+    HEADER = 'symbol,trade_date,direction,quantity,entry_price,exit_price'
+
+    def _rows(self, data):
+        from tradelog.importers.parser import iter_csv
+
+        return list(iter_csv(io.BytesIO(data)))
+
+    def test_multibyte_character_split_across_chunks(self):
+        from tradelog.importers import parser
+
+        head = f'{self.HEADER}\nINFY,2025-01-02,long,1,100,101\n'.encode()
+        # Pad so the 3-byte "₹" starts one byte before the chunk boundary
+        padding = parser._READ_CHUNK_SIZE - len(head) - len(b'PAD,2025-01-02,long,1,100,') - 1
+        line = b'PAD,2025-01-02,long,1,100,' + b'9' * padding + '₹\n'.encode()
+        data = head + line + b'TCS,2025-01-03,short,2,200,190\n'
+        self.assertEqual(data.index('₹'.encode()), parser._READ_CHUNK_SIZE - 1)
+
+        rows = self._rows(data)
+        self.assertEqual([row['symbol'] for row in rows], ['INFY', 'PAD', 'TCS'])
+        self.assertEqual(rows[1]['exit_price'], '9' * padding + '₹')
+        self.assertEqual(rows[2]['exit_price'], '190')
+
+    def test_byte_order_mark_is_dropped(self):
+        rows = self._rows(f'\ufeff{self.HEADER}\nINFY,2025-01-02,long,1,100,101\n'.encode())
+        self.assertEqual(list(rows[0]), self.HEADER.split(','))
+        self.assertEqual(rows[0]['symbol'], 'INFY')
+
+    def test_crlf_line_endings(self):
+        text = f'{self.HEADER}\r\nINFY,2025-01-02,long,1,100,101\r\n"TCS\r\nLTD",2025-01-03,short,2,200,190\r\n'
+        rows = self._rows(text.encode())
+        self.assertEqual(rows, [
+            dict(zip(self.HEADER.split(','), ['INFY', '2025-01-02', 'long', '1', '100', '101'])),
+            dict(zip(self.HEADER.split(','), ['TCS\r\nLTD', '2025-01-03', 'short', '2', '200', '190'])),
+        ])
+
+    def test_last_line_without_newline(self):
+        rows = self._rows(f'{self.HEADER}\nINFY,2025-01-02,long,1,100,101'.encode())
+        self.assertEqual(rows[0]['exit_price'], '101')
+
+
+class ExcelStreamingTests(SimpleTestCase):
+    """iter_excel reads a read-only workbook row by row, skipping broker preamble rows."""
+
+    def _workbook(self, rows):
+        import openpyxl
+
+        wb = openpyxl.Workbook()
+        for row in rows:
+            wb.active.append(row)
+        buffer = io.BytesIO()
+        wb.save(buffer)
+        return buffer.getvalue()
+
+    def _with_dimension(self, data, ref):
+        """Rewrite the sheet's <dimension> tag, as some broker exports get it wrong."""
+        import re
+
+        source, target = zipfile.ZipFile(io.BytesIO(data)), io.BytesIO()
+        with source, zipfile.ZipFile(target, 'w') as out:
+            for info in source.infolist():
+                content = source.read(info)
+                if info.filename == 'xl/worksheets/sheet1.xml':
+                    content = re.sub(rb'<dimension ref="[^"]*"', f'<dimension ref="{ref}"'.encode(), content)
+                out.writestr(info, content)
+        return target.getvalue()
+
+    def test_junk_rows_above_the_header_are_skipped(self):
+        from tradelog.importers.parser import iter_upload_rows
+
+        data = self._workbook([
+            ['Tradebook for Equity'],
+            ['Client ID', 'AB1234'],
+            [],
+            ['Symbol', 'Trade Date', 'Trade Type', 'Quantity', 'Price', 'Trade ID', 'Order Execution Time'],
+            ['INFY', '2025-01-02', 'buy', 10, 100.5, 1, '2025-01-02T09:15:00'],
+            [None, None, None, None, None, None, None],
+            ['TCS', '2025-01-03', 'sell', 5, 200, 2, '2025-01-03T10:15:00'],
+        ])
+        rows = list(iter_upload_rows(io.BytesIO(self._with_dimension(data, 'A1:B2')), 'tradebook.xlsx'))
+        self.assertEqual(rows, [
+            {'symbol': 'INFY', 'trade_date': '2025-01-02', 'trade_type': 'buy', 'quantity': '10',
+             'price': '100.5', 'trade_id': '1', 'order_execution_time': '2025-01-02T09:15:00'},
+            {'symbol': 'TCS', 'trade_date': '2025-01-03', 'trade_type': 'sell', 'quantity': '5',
+             'price': '200', 'trade_id': '2', 'order_execution_time': '2025-01-03T10:15:00'},
+        ])
+
+    def test_corrupt_workbook_fails_before_streaming(self):
+        from tradelog.importers.parser import iter_upload_rows
+
+        with self.assertRaises(Exception):
+            iter_upload_rows(io.BytesIO(b'not a workbook'), 'tradebook.xlsx')
+
+
+class BrokerAggregationTests(SimpleTestCase):
+    """Broker exports fold their execution legs into one VWAP trade per group."""
+
+    FIELDS = ('symbol', 'trade_date', 'time', 'direction', 'quantity', 'entry_price', 'exit_price', 'market_type')
+
+    ZERODHA = (
+        'symbol,isin,trade_date,exchange,segment,series,trade_type,auction,quantity,price,trade_id,order_id,'
+        'order_execution_time\n'
+        # Partial fills on both sides of a long
+        'INFY,INE009A01021,2025-01-02,NSE,EQ,EQ,buy,false,10,100,1,11,2025-01-02T09:15:00\n'
+        'INFY,INE009A01021,2025-01-02,NSE,EQ,EQ,buy,false,5,103,2,12,2025-01-02T09:20:00\n'
+        'INFY,INE009A01021,2025-01-02,NSE,EQ,EQ,sell,false,15,106,3,13,2025-01-02T10:00:00\n'
+        # A short covered in two fills — flat, so reported as long (bought ≥ sold)
+        'TCS,INE467B01029,2025-01-02,NSE,EQ,EQ,sell,false,20,200,4,14,2025-01-02T11:00:00\n'
+        'TCS,INE467B01029,2025-01-02,NSE,EQ,EQ,buy,false,8,190,5,15,2025-01-02T11:30:00\n'
+        'TCS,INE467B01029,2025-01-02,NSE,EQ,EQ,buy,false,12,195,6,16,2025-01-02T11:45:00\n'
+        # Reversal: long 10, then sold 25 — folded into one short of the larger side
+        'SBIN,INE062A01020,2025-01-03,NSE,EQ,EQ,buy,false,10,50,7,17,2025-01-03T09:30:00\n'
+        'SBIN,INE062A01020,2025-01-03,NSE,EQ,EQ,sell,false,25,52,8,18,2025-01-03T10:00:00\n'
+        # Same symbol on another day is another trade; an unclosed buy has no exit
+        'INFY,INE009A01021,2025-01-03,NSE,EQ,EQ,buy,false,4,110,9,19,2025-01-03 09:45:00\n'
+    )
+
+    GROWW = (
+        'Stock name,Symbol,ISIN,Type,Quantity,Value,Exchange,Exchange Order Id,Execution date and time,'
+        'Order status\n'
+        'Reliance Industries,RELIANCE,INE002A01018,BUY,10,25000,NSE,1,02-01-2025 09:30 AM,Executed\n'
+        'Reliance Industries,RELIANCE,INE002A01018,BUY,5,12600,NSE,2,02-01-2025 09:45 AM,Executed\n'
+        'Reliance Industries,RELIANCE,INE002A01018,SELL,15,38250,NSE,3,02-01-2025 02:15 PM,Executed\n'
+        'Reliance Industries,RELIANCE,INE002A01018,SELL,5,13000,NSE,4,02-01-2025 02:20 PM,Cancelled\n'
+        # Reversal: short 10, then bought 30
+        'HDFC Bank,HDFCBANK,INE040A01034,SELL,10,16000,BSE,5,03-01-2025 10:00 AM,Executed\n'
+        'HDFC Bank,HDFCBANK,INE040A01034,BUY,30,47400,BSE,6,03-01-2025 11:00 AM,Executed\n'
+    )
+
+    UPSTOX = (
+        'Date,Company,Amount,Exchange,Segment,Scrip Code,Instrument Type,Strike Price,Expiry,Trade Num,'
+        'Trade Time,Side,Quantity,Price\n'
+        '02-01-2025,Tata Steel,14000,NSE,EQ,TATASTEEL,,,,1,09:16:05,Buy,100,140\n'
+        '02-01-2025,Tata Steel,7075,NSE,EQ,TATASTEEL,,,,2,09:16:07,Buy,50,141.5\n'
+        '02-01-2025,Tata Steel,21750,NSE,EQ,TATASTEEL,,,,3,14:00:00,Sell,150,145\n'
+        # Option reversal: short 50, then bought 75
+        '02-01-2025,Nifty,6025,FON,FO,NIFTY,Call Option,23500,30-01-2025,4,10:00:00,Sell,50,₹120.50\n'
+        '02-01-2025,Nifty,8250,FON,FO,NIFTY,Call Option,23500,30-01-2025,5,11:00,Buy,75,₹110\n'
+    )
+
+    def _trades(self, text):
+        from tradelog.importers.parser import detect_and_normalize, iter_csv
+
+        formats = {}
+        broker, rows = detect_and_normalize(iter_csv(io.BytesIO(text.encode())), formats=formats)
+        return broker, [tuple(row[key] for key in self.FIELDS) for row in rows], formats
+
+    def test_zerodha(self):
+        broker, trades, formats = self._trades(self.ZERODHA)
+        self.assertEqual(broker, 'zerodha')
+        self.assertEqual(trades, [
+            ('INFY', '2025-01-02', '09:15', 'long', '15', '101.0000', '106.0000', 'indian_stocks'),
+            ('TCS', '2025-01-02', '11:00', 'long', '20', '193.0000', '200.0000', 'indian_stocks'),
+            ('SBIN', '2025-01-03', '09:30', 'short', '25', '52.0000', '50.0000', 'indian_stocks'),
+            ('INFY', '2025-01-03', '09:45', 'long', '4', '110.0000', '', 'indian_stocks'),
+        ])
+        self.assertEqual(formats, {'order_execution_time': '%Y-%m-%dT%H:%M:%S'})
+
+    def test_groww(self):
+        broker, trades, formats = self._trades(self.GROWW)
+        self.assertEqual(broker, 'groww')
+        self.assertEqual(trades, [
+            ('RELIANCE', '2025-01-02', '09:30', 'long', '15', '2506.6667', '2550.0000', 'indian_stocks'),
+            ('HDFCBANK', '2025-01-03', '10:00', 'long', '30', '1580.0000', '1600.0000', 'indian_stocks'),
+        ])
+        self.assertEqual(formats, {'execution_date_and_time': '%d-%m-%Y %I:%M %p'})
+
+    def test_upstox(self):
+        broker, trades, formats = self._trades(self.UPSTOX)
+        self.assertEqual(broker, 'upstox')
+        self.assertEqual(trades, [
+            ('TATASTEEL', '2025-01-02', '09:16:05', 'long', '150', '140.5000', '145.0000', 'indian_stocks'),
+            ('NIFTY 30-01-2025 23500 CE', '2025-01-02', '10:00:00', 'long', '75', '110.0000', '120.5000',
+             'options'),
+        ])
+        self.assertEqual(formats, {'date': '%d-%m-%Y', 'trade_time': '%d-%m-%Y %H:%M:%S'})
+
+
+class AmbiguousDateImportTests(TestCase):
+    """A generic CSV's date format is decided by the first value that rules a candidate out."""
+
+    def test_month_first_file_with_ambiguous_first_row(self):
+        user = User.objects.create_user(username='dates', email='dates@example.com', password='pw')
+        client = APIClient()
+        client.force_authenticate(user)
+        upload = SimpleUploadedFile('trades.csv', (
+            'symbol,trade_date,direction,quantity,entry_price,exit_price\n'
+            'AAA,03/04/2025,long,1,100,101\n'
+            'BBB,12/25/2025,long,1,100,101\n'
+            'CCC,05/06/2025,long,1,100,101\n'
+        ).encode(), content_type='text/csv')
+        response = client.post('/api/tradelog/trades/import/', {'file': upload}, format='multipart')
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(response.data['detected_formats'], {'trade_date': '%m/%d/%Y'})
+        dates = dict(Trade.objects.filter(user=user).values_list('symbol', 'trade_date'))
+        # AAA was read before BBB decided the format
+        self.assertEqual({symbol: day.isoformat() for symbol, day in dates.items()},
+                         {'AAA': '2025-04-03', 'BBB': '2025-12-25', 'CCC': '2025-05-06'})
+
+
+class ImportLockTests(TestCase):
+    """Batch imports block the same rows as row imports when a rule locks the session."""
+
+    LEGS = [
+        (symbol, day, side, 10, price, at)
+        for symbol, day in (('INFY', '2025-01-02'), ('TCS', '2025-01-02'), ('WIPRO', '2025-01-02'),
+                            ('HDFC', '2025-01-02'), ('ITC', '2025-01-03'))
+        for side, price, at in (('buy', 100, '09:15:00'), ('sell', 95, '09:45:00'))
+    ]
+
+    def _import(self, mode):
+        cache.clear()
+        user = User.objects.create_user(username=f'lock-{mode}', email=f'lock-{mode}@example.com', password='pw')
+        Rule.objects.create(
+            user=user, rule_name='two trades', category='risk', rule_type='hard',
+            trigger_scope='per_day', trigger_condition={'maxTrades': 2}, action='lock',
+        )
+        client = APIClient()
+        client.force_authenticate(user)
+        response = client.post('/api/tradelog/trades/import/', {'file': _zerodha_upload(self.LEGS), 'mode': mode},
+                               format='multipart')
+        self.assertEqual(response.status_code, 201)
+        trades = sorted(Trade.objects.filter(user=user).values_list('trade_date', 'symbol', 'is_disciplined'))
+        return {key: response.data[key] for key in ('imported', 'failed', 'blocked')}, trades, \
+            [error['row'] for error in response.data['errors']]
+
+    def test_batch_mode_blocks_rows_after_the_lock_like_row_mode(self):
+        row_mode = self._import('row')
+        self.assertEqual(row_mode[0], {'imported': 3, 'failed': 2, 'blocked': 2})
+        self.assertEqual([symbol for _, symbol, _ in row_mode[1]], ['INFY', 'TCS', 'ITC'])
+        self.assertEqual(self._import('batch'), row_mode)
+
+
+def _zip_upload(members, name='tradebooks.zip'):
+    """A .zip upload holding {member_name: bytes}."""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        for member, data in members.items():
+            archive.writestr(member, data)
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='application/zip')
+
+
+class MultiFileImportTests(TestCase):
+    """Several files or a .zip are imported in batch mode, within the archive limits."""
+
+    LEGS = [
+        ('INFY', '2025-01-02', 'buy', 10, 100, '09:15:00'),
+        ('INFY', '2025-01-02', 'sell', 10, 105, '10:15:00'),
+    ]
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='multi', email='multi@example.com', password='pw')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def _tradebook(self):
+        return _zerodha_upload(self.LEGS).read()
+
+    def _post(self, data):
+        return self.client.post('/api/tradelog/trades/import/', data, format='multipart')
+
+    def test_zip_is_imported(self):
+        response = self._post({'file': _zip_upload({'jan/tradebook.csv': self._tradebook(), 'readme.txt': b'hi'})})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['imported'], 1)
+        self.assertEqual(response.data['files'][0]['filename'], 'tradebooks.zip/jan/tradebook.csv')
+
+    def test_row_mode_is_rejected_for_several_files(self):
+        response = self._post({
+            'files': [_zerodha_upload(self.LEGS, 'a.csv'), _zerodha_upload(self.LEGS, 'b.csv')],
+            'mode': 'row',
+        })
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('mode=row', response.data['error'])
+        self.assertFalse(Trade.objects.filter(user=self.user).exists())
+
+    def test_row_mode_is_rejected_for_zip(self):
+        response = self._post({'file': _zip_upload({'tradebook.csv': self._tradebook()}), 'mode': 'row'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('mode=row', response.data['error'])
+
+    @override_settings(IMPORT_ARCHIVE_MAX_FILES=2)
+    def test_zip_with_too_many_files_is_rejected(self):
+        members = {f'{i}.csv': self._tradebook() for i in range(3)}
+        response = self._post({'file': _zip_upload(members)})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('more than 2 files', response.data['error'])
+        self.assertFalse(Trade.objects.filter(user=self.user).exists())
+
+    def test_zip_over_the_size_limit_is_rejected(self):
+        data = self._tradebook()
+        with override_settings(IMPORT_ARCHIVE_MAX_BYTES=2 * len(data) - 1):
+            response = self._post({'file': _zip_upload({'a.csv': data, 'b.csv': data})})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('expands to more than', response.data['error'])
+        self.assertFalse(Trade.objects.filter(user=self.user).exists())
+
+    def test_nested_zip_is_rejected(self):
+        inner = _zip_upload({'tradebook.csv': self._tradebook()}, 'inner.zip').read()
+        response = self._post({'file': _zip_upload({'tradebook.csv': self._tradebook(), 'more/inner.zip': inner})})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('nested archives', response.data['error'])
+        self.assertFalse(Trade.objects.filter(user=self.user).exists())
+
+
+class LotMatchingImportTests(TestCase):
+    """Lot-matched imports pair legs across uploads and never count a position twice."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='lots', email='lots@example.com', password='pw')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def _import(self, legs, **params):
+        return self.client.post(
+            '/api/tradelog/trades/import/', {'file': _zerodha_upload(legs), **params}, format='multipart',
+        )
+
+    def _live(self):
+        return sorted(
+            (str(t.trade_date), t.direction, t.quantity, t.entry_price, t.exit_price)
+            for t in Trade.objects.filter(user=self.user, deleted_at__isnull=True)
+        )
+
+    def test_fifo_and_lifo_pair_different_lots(self):
+        legs = [
+            ('INFY', '2025-01-02', 'buy', 10, 100, '09:15:00'),
+            ('INFY', '2025-01-03', 'buy', 10, 110, '09:15:00'),
+            ('INFY', '2025-01-06', 'sell', 15, 120, '10:00:00'),
+        ]
+        self.assertEqual(self._import(legs, lot_matching='fifo').status_code, 201)
+        self.assertEqual(self._live(), [
+            ('2025-01-02', 'long', Decimal('15'), Decimal('103.3333'), Decimal('120')),
+            ('2025-01-03', 'long', Decimal('5'), Decimal('110'), None),
+        ])
+
+        Trade.objects.filter(user=self.user).delete()
+        self.assertEqual(self._import(legs, lot_matching='lifo').status_code, 201)
+        self.assertEqual(self._live(), [
+            ('2025-01-02', 'long', Decimal('5'), Decimal('100'), None),
+            ('2025-01-02', 'long', Decimal('15'), Decimal('106.6667'), Decimal('120')),
+        ])
+
+    def test_later_upload_closes_carried_lot(self):
+        self._import([('INFY', '2025-01-02', 'buy', 10, 100, '09:15:00')], lot_matching='fifo')
+        response = self._import([('INFY', '2025-01-08', 'sell', 10, 130, '09:30:00')], lot_matching='fifo')
+        self.assertEqual(response.data['imported'], 1)
+        self.assertEqual(self._live(), [('2025-01-02', 'long', Decimal('10'), Decimal('100'), Decimal('130'))])
+
+    def test_reupload_is_skipped(self):
+        legs = [('INFY', '2025-01-02', 'buy', 10, 100, '09:15:00')]
+        self._import(legs, lot_matching='fifo')
+        response = self._import(legs, lot_matching='fifo')
+        self.assertEqual((response.data['imported'], response.data['skipped']), (0, 1))
+        self.assertEqual(len(self._live()), 1)
+
+    def _assert_overlap_replaces_open_trade(self, mode):
+        self._import([('INFY', '2025-01-02', 'buy', 10, 100, '09:15:00')], lot_matching='fifo', mode=mode)
+        # The day-1 buy again, plus the sell that closes it
+        response = self._import([
+            ('INFY', '2025-01-02', 'buy', 10, 100, '09:15:00'),
+            ('INFY', '2025-01-05', 'sell', 10, 125, '11:00:00'),
+        ], lot_matching='fifo', mode=mode)
+        self.assertEqual(response.data['imported'], 1)
+        self.assertEqual(self._live(), [('2025-01-02', 'long', Decimal('10'), Decimal('100'), Decimal('125'))])
+        session = DisciplineSession.objects.get(user=self.user, session_date='2025-01-02')
+        self.assertEqual(session.trade_count, 1)
+
+    def test_overlapping_reupload_replaces_open_trade_row_mode(self):
+        self._assert_overlap_replaces_open_trade('row')
+
+    def test_overlapping_reupload_replaces_open_trade_batch_mode(self):
+        self._assert_overlap_replaces_open_trade('batch')
+
+    def test_reuploading_closing_file_does_not_reopen_position(self):
+        buy = [('INFY', '2025-01-02', 'buy', 10, 100, '09:15:00')]
+        sell = [('INFY', '2025-01-08', 'sell', 10, 130, '10:00:00')]
+        self._import(buy, lot_matching='fifo')
+        self._import(sell, lot_matching='fifo')
+        closed = [('2025-01-02', 'long', Decimal('10'), Decimal('100'), Decimal('130'))]
+        self.assertEqual(self._live(), closed)
+
+        response = self._import(sell, lot_matching='fifo')
+        self.assertEqual((response.status_code, response.data['imported']), (201, 0))
+        self.assertEqual(self._live(), closed)
+
+        # Both files again, and the opening file alone, change nothing either
+        self.assertEqual(self._import(buy + sell, lot_matching='fifo').data['imported'], 0)
+        self.assertEqual(self._import(buy, lot_matching='fifo').data['imported'], 0)
+        self.assertEqual(self._live(), closed)
+
+    def test_reupload_with_new_legs_replays_only_the_new_ones(self):
+        self._import([('INFY', '2025-01-02', 'buy', 10, 100, '09:15:00'),
+                      ('INFY', '2025-01-08', 'sell', 15, 130, '10:00:00')], lot_matching='fifo')
+        # The sell overshot into a short of 5; the new buy closes it
+        response = self._import([('INFY', '2025-01-08', 'sell', 15, 130, '10:00:00'),
+                                 ('INFY', '2025-01-09', 'buy', 5, 120, '09:30:00')], lot_matching='fifo')
+        self.assertEqual(response.data['imported'], 1)
+        self.assertEqual(self._live(), [
+            ('2025-01-02', 'long', Decimal('10'), Decimal('100'), Decimal('130')),
+            ('2025-01-08', 'short', Decimal('5'), Decimal('130'), Decimal('120')),
+        ])
+
+    def test_overlapping_reupload_keeps_reproduced_open_trade(self):
+        legs = [
+            ('INFY', '2025-01-02', 'buy', 10, 100, '09:15:00'),
+            ('INFY', '2025-01-02', 'sell', 10, 105, '10:15:00'),
+            ('INFY', '2025-01-03', 'buy', 5, 110, '09:15:00'),
+        ]
+        self._import(legs, lot_matching='fifo')
+        # An earlier round trip is added; the 01-03 open trade comes out the same
+        response = self._import([('INFY', '2025-01-01', 'buy', 1, 90, '09:15:00'),
+                                 ('INFY', '2025-01-01', 'sell', 1, 95, '09:45:00')] + legs, lot_matching='fifo')
+        # The stored 01-02 round trip already consumed its legs; the open trade is a duplicate
+        self.assertEqual((response.data['imported'], response.data['skipped']), (1, 1))
+        self.assertIn(('2025-01-03', 'long', Decimal('5'), Decimal('110'), None), self._live())
+        self.assertEqual(len(self._live()), 3)
+
+
+class StaleImportJobTests(TestCase):
+    """A job left running by a dead worker is failed instead of staying running forever."""
+
+    def test_stale_running_job_is_failed(self):
+        from datetime import timedelta
+        from django.utils import timezone
+        from tradelog.importers.jobs import run_queued_jobs
+        from tradelog.models import ImportJob
+
+        user = User.objects.create_user(username='jobs', email='jobs@example.com', password='pw')
+        stale = ImportJob.objects.create(user=user, original_filename='old.csv', status='running')
+        live = ImportJob.objects.create(user=user, original_filename='new.csv', status='running')
+        ImportJob.objects.filter(pk=stale.pk).update(updated_at=timezone.now() - timedelta(hours=1))
+
+        with self.assertLogs('tradelog.importers.jobs', 'WARNING'):
+            self.assertEqual(run_queued_jobs(), 0)
+        stale.refresh_from_db()
+        live.refresh_from_db()
+        self.assertEqual(stale.status, 'failed')
+        self.assertIsNotNone(stale.finished_at)
+        self.assertTrue(stale.error_message)
+        self.assertEqual(live.status, 'running')
+
+    def _queued_job(self, mode):
+        from tradelog.models import ImportJob
+
+        user = User.objects.create_user(username=f'slow-{mode}', email=f'slow-{mode}@example.com', password='pw')
+        upload = _zerodha_upload([('INFY', '2025-01-02', 'buy', 10, 100, '09:15:00'),
+                                  ('INFY', '2025-01-02', 'sell', 10, 105, '10:15:00'),
+                                  ('TCS', '2025-01-03', 'buy', 5, 300, '09:20:00'),
+                                  ('TCS', '2025-01-03', 'sell', 5, 310, '11:20:00')])
+        return ImportJob.objects.create(user=user, file=upload, original_filename='tradebook.csv', mode=mode)
+
+    def test_abandoned_job_keeps_failed_status(self):
+        from unittest import mock
+        from tradelog.importers import jobs
+        from tradelog.models import ImportJob
+
+        for mode in ('row', 'batch'):
+            job = self._queued_job(mode)
+            run_import = jobs.run_import
+
+            def slow_import(*args, **kwargs):
+                stats = run_import(*args, **kwargs)
+                # Declared dead while it was still finishing
+                ImportJob.objects.filter(pk=job.pk).update(status='failed', error_message='abandoned')
+                return stats
+
+            with mock.patch.object(jobs, 'run_import', slow_import), self.assertLogs(jobs.logger, 'WARNING'):
+                self.assertFalse(jobs.run_import_job(job.pk))
+            job.refresh_from_db()
+            self.assertEqual((job.status, job.error_message, job.finished_at), ('failed', 'abandoned', None))
+            self.assertFalse(job.file)
+
+    def test_abandoned_job_stops_at_next_progress_report(self):
+        from tradelog.importers import jobs
+        from tradelog.models import ImportJob
+
+        from unittest import mock
+        from tradelog.importers import writer
+
+        job = self._queued_job('batch')
+        write_session_batch = writer._write_session_batch
+
+        def write_then_give_up(*args, **kwargs):
+            write_session_batch(*args, **kwargs)
+            ImportJob.objects.filter(pk=job.pk).update(status='failed')
+
+        with mock.patch.object(writer, '_write_session_batch', write_then_give_up), \
+                self.assertLogs(jobs.logger, 'WARNING'):
+            self.assertFalse(jobs.run_import_job(job.pk))
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'failed')
+        # The first date was written before the job was given up on; the second never is
+        self.assertEqual(list(Trade.objects.filter(user=job.user).values_list('symbol', flat=True)), ['INFY'])
+
+
+class TradeCursorPaginationTests(TestCase):
+    """?pagination=cursor walks the trade list by keyset, NULL trade times included."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='pager', email='pager@example.com', password='pw')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def _page(self, url=None, **params):
+        if url:
+            response = self.client.get(url)
+        else:
+            response = self.client.get('/api/tradelog/trades/', {'pagination': 'cursor', 'page_size': 2, **params})
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_pages_across_null_trade_times(self):
+        for i, (day, at) in enumerate([('2025-03-03', '09:30:00'), ('2025-03-03', None), ('2025-03-03', '11:00:00'),
+                                       ('2025-03-03', None), ('2025-03-02', None), ('2025-03-02', '10:00:00'),
+                                       ('2025-03-01', '09:15:00')]):
+            trade_id = self.client.post('/api/tradelog/trades/', _trade_payload(trade_date=day, symbol=f'S{i}'),
+                                        format='json').data['id']
+            Trade.objects.filter(pk=trade_id).update(trade_time=at)
+        expected = [str(pk) for pk in Trade.objects.filter(user=self.user).order_by(
+            '-trade_date', F('trade_time').desc(nulls_first=True), '-id').values_list('id', flat=True)]
+
+        pages = [self._page()]
+        while pages[-1]['next']:
+            pages.append(self._page(pages[-1]['next']))
+        self.assertEqual([row['id'] for page in pages for row in page['results']], expected)
+        self.assertEqual(len(pages), 4)
+
+        # And back again from the last page
+        back = self._page(pages[-1]['previous'])
+        self.assertEqual(back['results'], pages[-2]['results'])
+
+    def test_invalid_cursor_is_not_found(self):
+        self.client.post('/api/tradelog/trades/', _trade_payload(), format='json')
+        tampered = encode_cursor({'d': 'n', 'v': ['nope', None, 'x']})
+        for cursor in (tampered, encode_cursor({'d': 'n', 'v': [None, None, None]}),
+                       encode_cursor({'d': 'n', 'v': [['2025-03-03'], None, 1]}), 'not-a-cursor'):
+            response = self.client.get('/api/tradelog/trades/', {'pagination': 'cursor', 'cursor': cursor})
+            self.assertEqual(response.status_code, 404, cursor)
+
+
+class TradeFilterTests(TestCase):
+    """Trade list query parameters are validated by TradeFilterSerializer and select the same trades on every page."""
+
+    def setUp(self):
+        from strategies.models import Strategy
+
+        self.user = User.objects.create_user(username='filters', email='filters@example.com', password='pw')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.strategy = Strategy.objects.create(user=self.user, strategy_name='Breakout')
+        self.ids = {}
+        for name, symbol, day, market, exit_price, strategy in [
+            ('infy_win', 'INFY', '2025-03-01', 'indian_stocks', '105', self.strategy),
+            ('tcs_loss', 'TCS', '2025-03-02', 'crypto', '95', None),
+            ('infy_big', 'INFY', '2025-03-03', 'indian_stocks', '110', None),
+            ('wipro_small', 'WIPRO', '2025-03-03', 'forex', '101', self.strategy),
+        ]:
+            trade_id = self.client.post('/api/tradelog/trades/', _trade_payload(
+                symbol=symbol, trade_date=day, market_type=market, exit_price=exit_price,
+            ), format='json').data['id']
+            Trade.objects.filter(pk=trade_id).update(strategy=strategy)
+            self.ids[name] = trade_id
+
+    def _names(self, **params):
+        response = self.client.get('/api/tradelog/trades/', {'page_size': 50, **params})
+        self.assertEqual(response.status_code, 200, response.data)
+        names = {trade_id: name for name, trade_id in self.ids.items()}
+        return sorted(names[row['id']] for row in response.data['results'])
+
+    def test_invalid_parameters_are_rejected(self):
+        for params, field in [
+            ({'filter': 'winners'}, 'filter'),
+            ({'market': 'stocks'}, 'market'),
+            ({'strategy': 'not-a-uuid'}, 'strategy'),
+            ({'min_pnl': 'ten'}, 'min_pnl'),
+            ({'min_pnl': '50', 'max_pnl': '0'}, 'min_pnl'),
+            ({'from': '2025-03-03', 'to': '2025-03-01'}, 'from'),
+        ]:
+            response = self.client.get('/api/tradelog/trades/', params)
+            self.assertEqual(response.status_code, 400, params)
+            self.assertIn(field, response.data, params)
+
+    def test_symbol_strategy_market_and_pnl_filters(self):
+        self.assertEqual(self._names(symbol='INFY'), ['infy_big', 'infy_win'])
+        self.assertEqual(self._names(symbol='TCS, WIPRO'), ['tcs_loss', 'wipro_small'])
+        self.assertEqual(self._names(strategy=str(self.strategy.pk)), ['infy_win', 'wipro_small'])
+        self.assertEqual(self._names(strategy='none'), ['infy_big', 'tcs_loss'])
+        self.assertEqual(self._names(market='crypto'), ['tcs_loss'])
+        self.assertEqual(len(self._names(market='all')), 4)
+        self.assertEqual(self._names(min_pnl='0', max_pnl='50'), ['infy_win', 'wipro_small'])
+        self.assertEqual(self._names(max_pnl='-0.01'), ['tcs_loss'])
+        self.assertEqual(self._names(filter='wins', symbol='INFY', strategy='none'), ['infy_big'])
+        self.assertEqual(self._names(filter='losses', market='indian_stocks'), [])
+
+    def test_filters_apply_to_every_cursor_page(self):
+        for i in range(5):
+            self.client.post('/api/tradelog/trades/', _trade_payload(
+                symbol='INFY', trade_date=f'2025-02-0{i + 1}', exit_price='90',
+            ), format='json')
+        params = {'symbol': 'INFY', 'min_pnl': '0'}
+        expected = [str(pk) for pk in Trade.objects.filter(
+            user=self.user, symbol='INFY', total_pnl__gte=0,
+        ).order_by('-trade_date', '-trade_time', '-id').values_list('id', flat=True)]
+
+        response = self.client.get('/api/tradelog/trades/', {'pagination': 'cursor', 'page_size': 1, **params})
+        seen = []
+        while True:
+            self.assertEqual(response.status_code, 200)
+            seen.extend(row['id'] for row in response.data['results'])
+            if not response.data['next']:
+                break
+            self.assertIn('symbol=INFY', response.data['next'])
+            response = self.client.get(response.data['next'])
+        self.assertEqual(seen, expected)
+        self.assertEqual(seen, [self.ids['infy_big'], self.ids['infy_win']])
+
+
+class SparseTradeListTests(TestCase):
+    """?fields= and ?view=compact return the full serializer's values for the selected fields only."""
+
+    URL = '/api/tradelog/trades/'
+
+    def setUp(self):
+        from strategies.models import Strategy
+
+        self.user = User.objects.create_user(username='sparse', email='sparse@example.com', password='pw')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        strategy = Strategy.objects.create(user=self.user, strategy_name='Breakout')
+        for overrides in (
+            {'symbol': 'INFY', 'trade_date': '2025-03-01', 'emotional_state': 'calm'},
+            {'symbol': 'TCS', 'trade_date': '2025-03-02', 'exit_price': None, 'trade_time': None},
+            {'symbol': 'WIPRO', 'trade_date': '2025-03-03', 'direction': 'short', 'fees': '0.35'},
+        ):
+            self.client.post(self.URL, _trade_payload(**overrides), format='json')
+        Trade.objects.filter(user=self.user, symbol='INFY').update(strategy=strategy)
+
+    def _rows(self, **params):
+        response = self.client.get(self.URL, params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()['results']
+
+    def test_unknown_fields_are_rejected(self):
+        response = self.client.get(self.URL, {'fields': 'symbol,pnl,user_id'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['error'], 'Unknown fields: pnl, user_id.')
+
+    def test_selected_fields_match_the_full_serializer(self):
+        from tradelog.serializers import TradeManagementSerializer
+
+        full = self._rows()
+        every_field = list(TradeManagementSerializer().fields)
+        self.assertEqual(self._rows(fields=','.join(every_field)), full)
+
+        selected = ['total_pnl', 'symbol', 'strategy', 'trade_time', 'created_at', 'fees']
+        sparse = self._rows(fields=','.join(selected + ['symbol']))
+        self.assertEqual([list(row) for row in sparse], [selected] * len(full))
+        self.assertEqual(sparse, [{name: row[name] for name in selected} for row in full])
+
+    def test_compact_view_matches_the_full_serializer(self):
+        from tradelog.serializers import TRADE_COMPACT_FIELDS
+
+        full = self._rows()
+        compact = self._rows(view='compact', fields='notes')  # view=compact wins over fields
+        self.assertEqual(compact, [{name: row[name] for name in TRADE_COMPACT_FIELDS} for row in full])
+
+    def test_sparse_fields_with_cursor_pagination(self):
+        full = self._rows()
+        rows, params = [], {'pagination': 'cursor', 'page_size': 1, 'fields': 'symbol,total_pnl'}
+        response = self.client.get(self.URL, params)
+        while True:
+            rows.extend(response.json()['results'])
+            if not response.json()['next']:
+                break
+            response = self.client.get(response.json()['next'])
+        self.assertEqual(rows, [{'symbol': row['symbol'], 'total_pnl': row['total_pnl']} for row in full])
+
+
+class TradeExportTests(TestCase):
+    """GET /trades/export/ streams the filtered, live trades as CSV or NDJSON."""
+
+    URL = '/api/tradelog/trades/export/'
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='exporter', email='exporter@example.com', password='pw')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.ids = [
+            self.client.post('/api/tradelog/trades/', _trade_payload(**overrides), format='json').data['id']
+            for overrides in (
+                {'symbol': 'INFY', 'trade_date': '2025-03-01'},
+                {'symbol': 'TCS', 'trade_date': '2025-03-02', 'exit_price': None},
+                {'symbol': 'INFY', 'trade_date': '2025-03-03', 'exit_price': '110'},
+                {'symbol': 'WIPRO', 'trade_date': '2025-03-04'},
+            )
+        ]
+        self.client.delete(f'/api/tradelog/trades/{self.ids[3]}/')
+
+    def _export(self, **params):
+        response = self.client.get(self.URL, params)
+        self.assertEqual(response.status_code, 200)
+        return response, b''.join(response.streaming_content).decode()
+
+    def _csv_rows(self, **params):
+        import csv
+
+        response, body = self._export(export_format='csv', **params)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        return list(csv.reader(io.StringIO(body)))
+
+    def _ndjson_items(self, **params):
+        import json
+
+        response, body = self._export(export_format='ndjson', **params)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertTrue(body == '' or body.endswith('\n'))
+        return [json.loads(line) for line in body.splitlines()]
+
+    def test_csv_headers_and_rows(self):
+        from django.utils import timezone
+        from tradelog.serializers import TradeManagementSerializer
+
+        response, _ = self._export()
+        self.assertEqual(response['Content-Disposition'],
+                         f'attachment; filename="trades-{timezone.localdate():%Y%m%d}.csv"')
+
+        rows = self._csv_rows()
+        self.assertEqual(rows[0], list(TradeManagementSerializer().fields))
+        by_id = {row[rows[0].index('id')]: dict(zip(rows[0], row)) for row in rows[1:]}
+        self.assertEqual(list(by_id), [self.ids[2], self.ids[1], self.ids[0]])
+        self.assertEqual(
+            {key: by_id[self.ids[0]][key] for key in ('symbol', 'trade_date', 'entry_price', 'total_pnl')},
+            {'symbol': 'INFY', 'trade_date': '2025-03-01', 'entry_price': '100.0000', 'total_pnl': '48.00'},
+        )
+        self.assertEqual(by_id[self.ids[1]]['total_pnl'], '')  # open trade: no P&L
+
+    def test_csv_selected_fields(self):
+        rows = self._csv_rows(fields='symbol,total_pnl')
+        self.assertEqual(rows, [['symbol', 'total_pnl'], ['INFY', '98.00'], ['TCS', ''], ['INFY', '48.00']])
+
+    def test_ndjson_matches_the_trade_detail(self):
+        items = self._ndjson_items()
+        self.assertEqual([item['id'] for item in items], [self.ids[2], self.ids[1], self.ids[0]])
+        for item in items:
+            self.assertEqual(item, self.client.get(f'/api/tradelog/trades/{item["id"]}/').json())
+
+    def test_filters_apply_to_the_export(self):
+        self.assertEqual([item['id'] for item in self._ndjson_items(symbol='INFY', min_pnl='50')], [self.ids[2]])
+        self.assertEqual(self._csv_rows(fields='symbol', symbol='INFY'), [['symbol'], ['INFY'], ['INFY']])
+        self.assertEqual(self._ndjson_items(symbol='WIPRO'), [])
+        self.assertEqual(self._csv_rows(fields='symbol', symbol='WIPRO'), [['symbol']])
+
+    def test_invalid_parameters_are_rejected(self):
+        for params in ({'export_format': 'xml'}, {'filter': 'winners'}, {'fields': 'symbol,nope'}):
+            self.assertEqual(self.client.get(self.URL, params).status_code, 400, params)
+
+
+@override_settings(SYNC_SETTLE_SECONDS=0)
+class SyncFeedTests(TestCase):
+    """The delta sync cursor resumes every collection, including ones that had no changes."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='sync', email='sync@example.com', password='pw')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def _sync(self, **params):
+        response = self.client.get('/api/tradelog/sync/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def _ids(self, data, collection, kind='updated'):
+        return [row['id'] for row in data['changes'][collection][kind]]
+
+    def test_cursor_covers_streams_without_changes(self):
+        from datetime import timedelta
+        from django.utils import timezone
+        from journal.models import DailyJournal
+
+        journal = DailyJournal.objects.create(user=self.user, journal_date='2025-02-01')
+        DailyJournal.objects.filter(pk=journal.pk).update(updated_at=timezone.now() - timedelta(days=30))
+        trade_id = self.client.post('/api/tradelog/trades/', _trade_payload(), format='json').data['id']
+
+        since = (timezone.now() - timedelta(days=1)).isoformat()
+        first = self._sync(since=since)
+        self.assertEqual(self._ids(first, 'trades'), [trade_id])
+        self.assertEqual(self._ids(first, 'journals'), [])
+
+        # The old journal is not sent again just because its stream was empty
+        second = self._sync(cursor=first['cursor'])
+        self.assertEqual(self._ids(second, 'journals'), [])
+        self.assertEqual(self._ids(second, 'trades'), [])
+
+    def test_deletions_are_tombstones(self):
+        from journal.models import DailyJournal
+
+        trade_id = self.client.post('/api/tradelog/trades/', _trade_payload(), format='json').data['id']
+        journal = DailyJournal.objects.create(user=self.user, journal_date='2025-03-03')
+        cursor = self._sync()['cursor']
+
+        self.assertEqual(self.client.delete(f'/api/tradelog/trades/{trade_id}/').status_code, 204)
+        self.assertEqual(self.client.delete(f'/api/journal/daily/{journal.pk}/').status_code, 204)
+        data = self._sync(cursor=cursor)
+        self.assertEqual(self._ids(data, 'trades', 'deleted'), [trade_id])
+        self.assertEqual(self._ids(data, 'trades'), [])
+        self.assertEqual(self._ids(data, 'journals', 'deleted'), [str(journal.pk)])
+        self.assertFalse(data['has_more'])
+
+    def test_invalid_cursor_is_rejected(self):
+        for positions in ({'trades': ['nope', 'x']}, {'trades': [None, None]}, {'trades': 'x'}):
+            response = self.client.get('/api/tradelog/sync/', {'cursor': encode_cursor(positions)})
+            self.assertEqual(response.status_code, 400, positions)
+
+
+class IdempotencyKeyTests(TestCase):
+    """A retried POST with the same Idempotency-Key replays the first response."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='idem', email='idem@example.com', password='pw')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def _post(self, key, **overrides):
+        return self.client.post('/api/tradelog/trades/', _trade_payload(**overrides), format='json',
+                                HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_retry_replays_response(self):
+        first = self._post('k1')
+        self.assertEqual(first.status_code, 201)
+        retry = self._post('k1')
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(retry.data['id'], first.data['id'])
+        self.assertEqual(Trade.objects.filter(user=self.user).count(), 1)
+
+    def test_key_reuse_for_another_request_is_rejected(self):
+        self._post('k1')
+        self.assertEqual(self._post('k1', symbol='TCS').status_code, 422)
+        self.assertEqual(Trade.objects.filter(user=self.user).count(), 1)
+
+    def test_key_in_flight_is_conflict(self):
+        from tradelog.models import IdempotencyKey
+
+        self._post('k1')
+        IdempotencyKey.objects.filter(user=self.user, key='k1').update(status_code=None, response_body=None)
+        self.assertEqual(self._post('k1').status_code, 409)
+        self.assertEqual(Trade.objects.filter(user=self.user).count(), 1)
+
+    def test_abandoned_key_is_taken_over(self):
+        from datetime import timedelta
+        from django.utils import timezone
+        from tradelog.models import IdempotencyKey
+
+        self._post('k1')
+        Trade.objects.filter(user=self.user).delete()
+        # The first request died before storing its response
+        IdempotencyKey.objects.filter(user=self.user, key='k1').update(status_code=None, response_body=None)
+        self.assertEqual(self._post('k1').status_code, 409)
+
+        IdempotencyKey.objects.filter(user=self.user, key='k1').update(
+            created_at=timezone.now() - timedelta(minutes=11),
+        )
+        response = self._post('k1')
+        self.assertEqual(response.status_code, 201)
+        self.assertNotIn('Idempotent-Replayed', response)
+        self.assertEqual(Trade.objects.filter(user=self.user).count(), 1)
+        self.assertEqual(self._post('k1')['Idempotent-Replayed'], 'true')
+
+    def test_crashed_request_releases_key(self):
+        from unittest import mock
+        from tradelog.models import IdempotencyKey
+
+        with mock.patch('tradelog.views._write_trade', side_effect=RuntimeError('boom')), \
+                self.assertRaises(RuntimeError):
+            self._post('k1')
+        self.assertFalse(IdempotencyKey.objects.filter(user=self.user, key='k1').exists())
+        self.assertEqual(self._post('k1').status_code, 201)
+
+    def test_failed_request_releases_key(self):
+        self.assertEqual(self._post('k1', quantity='').status_code, 400)
+        self.assertEqual(self._post('k1').status_code, 201)
+
+
+class TradeVersionTests(TestCase):
+    """Trade versions back the ETag / If-Match / If-None-Match handling."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='versions', email='versions@example.com', password='pw')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.trade_id = self.client.post('/api/tradelog/trades/', _trade_payload(), format='json').data['id']
+        self.url = f'/api/tradelog/trades/{self.trade_id}/'
+
+    def test_stale_if_match_is_rejected(self):
+        self.assertEqual(self.client.get(self.url)['ETag'], '"1"')
+        response = self.client.patch(self.url, {'exit_price': '106'}, format='json', HTTP_IF_MATCH='"1"')
+        self.assertEqual((response.status_code, response['ETag']), (200, '"2"'))
+
+        response = self.client.patch(self.url, {'exit_price': '107'}, format='json', HTTP_IF_MATCH='"1"')
+        self.assertEqual(response.status_code, 412)
+        self.assertEqual(self.client.delete(self.url, HTTP_IF_MATCH='"1"').status_code, 412)
+        self.assertEqual(Trade.objects.get(pk=self.trade_id).exit_price, Decimal('106'))
+
+    def test_matching_if_none_match_is_not_modified(self):
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH='"1"')
+        self.assertEqual((response.status_code, response['ETag']), (304, '"1"'))
+        self.client.patch(self.url, {'exit_price': '108'}, format='json')
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH='"1"').status_code, 200)
+
+    def test_unconditional_edit_bumps_the_stored_version(self):
+        from tradelog.views import _write_trade
+
+        trade = Trade.objects.get(pk=self.trade_id)
+        Trade.objects.filter(pk=trade.pk).update(version=5)  # edited elsewhere since it was read
+        _write_trade(trade, self.user)
+        self.assertEqual(trade.version, 6)
+        self.assertEqual(Trade.objects.get(pk=trade.pk).version, 6)
+
+    def test_batch_bumps_versions(self):
+        other_id = self.client.post('/api/tradelog/trades/', _trade_payload(symbol='TCS'), format='json').data['id']
+        Trade.objects.filter(pk=self.trade_id).update(version=4)
+        response = self.client.post('/api/tradelog/trades/batch/', {'operations': [
+            {'op': 'update', 'id': self.trade_id, 'data': {'exit_price': '110'}},
+            {'op': 'delete', 'id': other_id},
+        ]}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'][0]['trade']['version'], 5)
+        self.assertEqual(Trade.objects.get(pk=self.trade_id).version, 5)
+        self.assertEqual(Trade.objects.get(pk=other_id).version, 2)
+
+
+class TradeBatchTests(TestCase):
+    """POST /trades/batch/ applies every operation or none of them."""
+
+    URL = '/api/tradelog/trades/batch/'
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='batch', email='batch@example.com', password='pw', trading_capital=Decimal('100000'),
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.kept_id = self.client.post('/api/tradelog/trades/', _trade_payload(), format='json').data['id']
+        self.deleted_id = self.client.post(
+            '/api/tradelog/trades/', _trade_payload(symbol='TCS', trade_time='10:30:00'), format='json',
+        ).data['id']
+
+    def _batch(self, *operations):
+        return self.client.post(self.URL, {'operations': list(operations)}, format='json')
+
+    def test_mixed_operations(self):
+        response = self._batch(
+            {'op': 'create', 'data': _trade_payload(symbol='WIPRO', trade_time='11:30:00', exit_price='99')},
+            {'op': 'update', 'id': self.kept_id, 'data': {'exit_price': '110'}},
+            {'op': 'delete', 'id': self.deleted_id},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual({key: response.data[key] for key in ('created', 'updated', 'deleted')},
+                         {'created': 1, 'updated': 1, 'deleted': 1})
+        created = Trade.objects.get(pk=response.data['results'][0]['id'])
+        self.assertEqual((created.symbol, created.total_pnl), ('WIPRO', Decimal('-12')))
+        self.assertEqual(response.data['results'][0]['trade']['total_pnl'], '-12.00')
+        self.assertEqual(Trade.objects.get(pk=self.kept_id).total_pnl, Decimal('98'))
+        self.assertIsNotNone(Trade.objects.get(pk=self.deleted_id).deleted_at)
+        self.assertNotIn('trade', response.data['results'][2])
+
+    def test_invalid_item_rolls_back_the_batch(self):
+        response = self._batch(
+            {'op': 'create', 'data': _trade_payload(symbol='WIPRO')},
+            {'op': 'update', 'id': self.kept_id, 'data': {'exit_price': '110'}},
+            {'op': 'delete', 'id': self.deleted_id},
+            {'op': 'create', 'data': _trade_payload(direction='sideways')},
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([r['status'] for r in response.data['results']],
+                         ['created', 'updated', 'deleted', 'error'])
+        self.assertIn('direction', response.data['results'][3]['errors'])
+        self.assertEqual(Trade.objects.filter(user=self.user).count(), 2)
+        kept = Trade.objects.get(pk=self.kept_id)
+        self.assertEqual((kept.exit_price, kept.version), (Decimal('105'), 1))
+        self.assertIsNone(Trade.objects.get(pk=self.deleted_id).deleted_at)
+
+    def test_stale_version_rejects_the_batch(self):
+        self.client.patch(f'/api/tradelog/trades/{self.kept_id}/', {'exit_price': '106'}, format='json')
+        response = self._batch(
+            {'op': 'update', 'id': self.kept_id, 'version': 1, 'data': {'exit_price': '110'}},
+            {'op': 'delete', 'id': self.deleted_id, 'version': 1},
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('version', response.data['results'][0]['errors'])
+        self.assertEqual(response.data['results'][1]['status'], 'deleted')
+        self.assertEqual(Trade.objects.get(pk=self.kept_id).exit_price, Decimal('106'))
+        self.assertIsNone(Trade.objects.get(pk=self.deleted_id).deleted_at)
+
+        response = self._batch({'op': 'update', 'id': self.kept_id, 'version': 2, 'data': {'exit_price': '110'}})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'][0]['trade']['version'], 3)
+        # The ETag a client read before the batch no longer matches
+        stale = self.client.patch(f'/api/tradelog/trades/{self.kept_id}/', {'exit_price': '111'},
+                                  format='json', HTTP_IF_MATCH='"2"')
+        self.assertEqual(stale.status_code, 412)
+
+    def test_edit_after_validation_rejects_the_batch(self):
+        from unittest import mock
+        from tradelog import batch
+
+        validate = batch._validate
+
+        def validate_then_edit(*args, **kwargs):
+            planned = validate(*args, **kwargs)
+            Trade.objects.filter(pk=self.kept_id).update(version=F('version') + 1)  # concurrent edit
+            return planned
+
+        with mock.patch.object(batch, '_validate', validate_then_edit):
+            response = self._batch({'op': 'update', 'id': self.kept_id, 'version': 1, 'data': {'exit_price': '110'}})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('version', response.data['results'][0]['errors'])
+        self.assertEqual(Trade.objects.get(pk=self.kept_id).exit_price, Decimal('105'))
+
+    def test_counters_and_discipline_flags_after_batch(self):
+        from discipline.counters import rebuild_session_counters
+
+        Rule.objects.create(
+            user=self.user, rule_name='position size', category='risk', rule_type='hard',
+            trigger_scope='per_trade', trigger_condition={'maxPositionPercent': 1.5}, action='alert',
+        )
+        response = self._batch(
+            {'op': 'create', 'data': _trade_payload(symbol='WIPRO', trade_time='11:30:00', quantity='20',
+                                                    exit_price='99')},
+            {'op': 'update', 'id': self.kept_id, 'data': {'exit_price': '95'}},
+            {'op': 'delete', 'id': self.deleted_id},
+        )
+        self.assertEqual(response.status_code, 200)
+        created_id = response.data['results'][0]['id']
+        self.assertFalse(Trade.objects.get(pk=created_id).is_disciplined)
+        self.assertFalse(response.data['results'][0]['trade']['is_disciplined'])
+        self.assertTrue(Trade.objects.get(pk=self.kept_id).is_disciplined)
+
+        session = DisciplineSession.objects.get(user=self.user, session_date='2025-03-03')
+        self.assertEqual(
+            (session.trade_count, session.realized_pnl, session.max_position, session.loss_streak),
+            (2, Decimal('-74'), Decimal('2000'), 2),
+        )
+        self.assertEqual(rebuild_session_counters(DisciplineSession.objects.filter(user=self.user), dry_run=True), [])
+
+
+class TradeWriteQueryBudgetTests(TestCase):
+    """Manual create/update save the trade row once, with a fixed number of queries."""
+
+    # lock check, savepoint, session, INSERT/UPDATE, session counters,
+    # session refresh, session save, hard-violation check, release — the
+    # rule plan is cached after the first trade; an update without If-Match
+    # also reads back the version it bumped in SQL
+    CREATE_QUERIES = 9
+    UPDATE_QUERIES = 10
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='budget', email='budget@example.com', password='pw', trading_capital=Decimal('100000'),
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        # The first trade of the day also creates the session
+        self.trade_id = self.client.post('/api/tradelog/trades/', _trade_payload(), format='json').data['id']
+
+    def _trade_writes(self, queries):
+        return [
+            q['sql'] for q in queries
+            if q['sql'].startswith(('INSERT INTO "trades"', 'UPDATE "trades"'))
+        ]
+
+    def test_create_query_budget(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post('/api/tradelog/trades/', _trade_payload(symbol='TCS'), format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(ctx.captured_queries), self.CREATE_QUERIES, [q['sql'] for q in ctx.captured_queries])
+        self.assertEqual(len(self._trade_writes(ctx.captured_queries)), 1)
+
+        trade = Trade.objects.get(pk=response.data['id'])
+        self.assertEqual(trade.total_pnl, Decimal('48'))
+        self.assertEqual(trade.session.session_date.isoformat(), '2025-03-03')
+        self.assertTrue(trade.is_disciplined)
+        self.assertEqual(response.data['total_pnl'], '48.00')
+
+    def test_update_query_budget(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.patch(
+                f'/api/tradelog/trades/{self.trade_id}/', {'exit_price': '110'}, format='json',
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(ctx.captured_queries), self.UPDATE_QUERIES, [q['sql'] for q in ctx.captured_queries])
+        self.assertEqual(len(self._trade_writes(ctx.captured_queries)), 1)
+        self.assertEqual(Trade.objects.get(pk=self.trade_id).total_pnl, Decimal('98'))
+
+    def test_update_moves_session_with_trade_date(self):
+        response = self.client.patch(
+            f'/api/tradelog/trades/{self.trade_id}/', {'trade_date': '2025-03-04'}, format='json',
+        )
+        self.assertEqual(response.status_code, 200)
+        trade = Trade.objects.get(pk=self.trade_id)
+        self.assertEqual(trade.session.session_date.isoformat(), '2025-03-04')
+
+    def test_hard_violation_marks_trade_undisciplined(self):
+        Rule.objects.create(
+            user=self.user, rule_name='position size', category='risk', rule_type='hard',
+            trigger_scope='per_trade', trigger_condition={'maxPositionPercent': 0.5}, action='lock',
+        )
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post('/api/tradelog/trades/', _trade_payload(symbol='TCS'), format='json')
+        self.assertEqual(response.status_code, 201)
+        # INSERT, then the discipline flag — the only extra trade write
+        self.assertEqual(len(self._trade_writes(ctx.captured_queries)), 2)
+        self.assertFalse(Trade.objects.get(pk=response.data['id']).is_disciplined)
+        self.assertFalse(response.data['is_disciplined'])
+
+
+class RuleEvaluationQueryTests(TestCase):
+    """The rule engine's query count does not grow with the number of rules."""
+
+    CONDITIONS = [
+        {'maxLoss': 100000},
+        {'maxDailyPercent': 50},
+        {'maxPositionPercent': 90},
+        {'maxTrades': 50},
+        {'consecutiveLosses': 5},
+    ]
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='engine', email='engine@example.com', password='pw', trading_capital=Decimal('100000'),
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.client.post('/api/tradelog/trades/', _trade_payload(), format='json')
+
+    def _add_rules(self, copies):
+        for i in range(copies):
+            for cond in self.CONDITIONS:
+                Rule.objects.create(
+                    user=self.user, rule_name=f'{list(cond)[0]} {i}', category='risk', rule_type='soft',
+                    trigger_scope='per_day', trigger_condition=cond, action='warn',
+                )
+
+    def _create_trade_queries(self, symbol):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post('/api/tradelog/trades/', _trade_payload(symbol=symbol), format='json')
+        self.assertEqual(response.status_code, 201)
+        return len(ctx.captured_queries)
+
+    def test_query_count_is_constant_in_rule_count(self):
+        self._add_rules(1)
+        few = self._create_trade_queries('TCS')
+        self._add_rules(4)
+        many = self._create_trade_queries('WIPRO')
+        self.assertEqual(few, many)
+
+    def test_day_facts_trigger_rules(self):
+        max_trades = Rule.objects.create(
+            user=self.user, rule_name='two trades', category='risk', rule_type='soft',
+            trigger_scope='per_day', trigger_condition={'maxTrades': 2}, action='warn',
+        )
+        Rule.objects.create(
+            user=self.user, rule_name='losing streak', category='risk', rule_type='soft',
+            trigger_scope='per_day', trigger_condition={'consecutiveLosses': 2}, action='warn',
+        )
+        self._create_trade_queries('TCS')
+        # Two winning trades: the trade quota is reached, there is no loss streak
+        session = self.user.discipline_sessions.get()
+        self.assertEqual(session.rules_violated, [str(max_trades.id)])
+        self.assertEqual(session.session_state, 'yellow')
+
+    def test_rule_edit_applies_to_next_trade(self):
+        rule = Rule.objects.create(
+            user=self.user, rule_name='trade quota', category='risk', rule_type='soft',
+            trigger_scope='per_day', trigger_condition={'maxTrades': 10}, action='warn',
+        )
+        self._create_trade_queries('TCS')
+        session = self.user.discipline_sessions.get()
+        self.assertEqual(session.rules_violated, [])
+
+        rule.trigger_condition = {'maxTrades': 3}
+        rule.save()
+        self._create_trade_queries('WIPRO')
+        session.refresh_from_db()
+        self.assertEqual(session.rules_violated, [str(rule.id)])
+
+
+class SessionCounterTests(TestCase):
+    """Trade writes keep the session's running counters equal to a rebuild from trades."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='counters', email='counters@example.com', password='pw', trading_capital=Decimal('100000'),
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def _assert_in_step(self):
+        from discipline.counters import rebuild_session_counters
+        self.assertEqual(rebuild_session_counters(self.user.discipline_sessions.all(), dry_run=True), [])
+
+    def test_counters_follow_create_update_delete(self):
+        ids = [
+            self.client.post('/api/tradelog/trades/', _trade_payload(trade_time=t, exit_price=x), format='json').data['id']
+            for t, x in (('09:30:00', '95'), ('10:00:00', '104'), ('11:00:00', '97'), ('12:00:00', '98'))
+        ]
+        session = self.user.discipline_sessions.get()
+        self.assertEqual(session.trade_count, 4)
+        self.assertEqual(session.realized_pnl, Decimal('-68'))
+        self.assertEqual(session.loss_streak, 2)
+        self._assert_in_step()
+
+        # Turning the win before the last two losses into a loss joins all four
+        self.client.patch(f'/api/tradelog/trades/{ids[1]}/', {'exit_price': '99'}, format='json')
+        self.assertEqual(self.user.discipline_sessions.get().loss_streak, 4)
+        self._assert_in_step()
+
+        # Moving a trade to another day and deleting one
+        self.client.patch(f'/api/tradelog/trades/{ids[3]}/', {'trade_date': '2025-03-04'}, format='json')
+        self.client.delete(f'/api/tradelog/trades/{ids[0]}/')
+        self._assert_in_step()
+        session = self.user.discipline_sessions.get(session_date='2025-03-03')
+        self.assertEqual(session.trade_count, 2)
+        self.assertEqual(session.max_position, Decimal('1000'))
+
+    def _trade(self, day, at, exit_price):
+        return self.client.post(
+            '/api/tradelog/trades/', _trade_payload(trade_date=day, trade_time=at, exit_price=exit_price), format='json',
+        ).data['id']
+
+    def _streaks(self):
+        return dict(self.user.discipline_sessions.values_list('session_date', 'loss_streak'))
+
+    def test_loss_streak_follows_edits_and_deletes_across_days(self):
+        from datetime import date
+
+        self._trade('2025-03-03', '09:30:00', '104')
+        first_loss = self._trade('2025-03-03', '10:00:00', '95')
+        day2 = [self._trade('2025-03-04', '09:30:00', '97'), self._trade('2025-03-04', '10:30:00', '98')]
+        self.client.post('/api/tradelog/trades/', _trade_payload(trade_date='2025-03-05', exit_price=None), format='json')
+        self._trade('2025-03-06', '09:30:00', '99')
+        d1, d2, d3, d4 = (date(2025, 3, n) for n in (3, 4, 5, 6))
+        # The open-only day is skipped by the chain
+        self.assertEqual(self._streaks(), {d1: 1, d2: 3, d3: 0, d4: 4})
+        self._assert_in_step()
+
+        # A win moved after the last loss of day 1 breaks every later streak
+        self.client.patch(f'/api/tradelog/trades/{first_loss}/', {'exit_price': '110'}, format='json')
+        self.assertEqual(self._streaks(), {d1: 0, d2: 2, d3: 0, d4: 3})
+        self._assert_in_step()
+
+        # Turning it back into a loss reaches through again
+        self.client.patch(f'/api/tradelog/trades/{first_loss}/', {'exit_price': '95'}, format='json')
+        self.assertEqual(self._streaks(), {d1: 1, d2: 3, d3: 0, d4: 4})
+
+        # Deleting a loss of day 2 shortens it and the sessions after it
+        self.client.delete(f'/api/tradelog/trades/{day2[0]}/')
+        self.assertEqual(self._streaks(), {d1: 1, d2: 2, d3: 0, d4: 3})
+        self._assert_in_step()
+
+        # A win moved to the end of day 2 resets it; day 4 starts over
+        self.client.patch(f'/api/tradelog/trades/{day2[1]}/', {'exit_price': '120'}, format='json')
+        self.assertEqual(self._streaks(), {d1: 1, d2: 0, d3: 0, d4: 1})
+        self._assert_in_step()
+
+    def test_closed_trade_moved_before_the_last_one(self):
+        self._trade('2025-03-03', '09:30:00', '95')
+        win = self._trade('2025-03-03', '10:00:00', '104')
+        self._trade('2025-03-03', '11:00:00', '97')
+        self.assertEqual(self.user.discipline_sessions.get().loss_streak, 1)
+
+        # The win moves first: both losses now end the day
+        self.client.patch(f'/api/tradelog/trades/{win}/', {'trade_time': '09:00:00'}, format='json')
+        self.assertEqual(self.user.discipline_sessions.get().loss_streak, 2)
+        self._assert_in_step()
+
+    def test_rebuild_matches_incremental_counters(self):
+        from discipline.counters import COUNTER_FIELDS, rebuild_session_counters
+        from discipline.models import DisciplineSession
+
+        for day, at, exit_price in (('2025-03-03', '09:30:00', '95'), ('2025-03-03', '10:00:00', '104'),
+                                    ('2025-03-04', '09:30:00', '97'), ('2025-03-04', None, '98'),
+                                    ('2025-03-05', '09:15:00', None)):
+            self._trade(day, at, exit_price)
+        incremental = list(self.user.discipline_sessions.order_by('session_date').values(*COUNTER_FIELDS))
+
+        DisciplineSession.objects.filter(user=self.user).update(
+            trade_count=0, realized_pnl=0, loss_streak=9, max_position=0, last_closed_time=None,
+        )
+        self.assertEqual(len(rebuild_session_counters(self.user.discipline_sessions.all())), 3)
+        self.assertEqual(list(self.user.discipline_sessions.order_by('session_date').values(*COUNTER_FIELDS)),
+                         incremental)
+        self._assert_in_step()
+
+    def test_loading_trades_defers_the_counter_snapshot(self):
+        self._trade('2025-03-03', '09:30:00', '95')
+        trade = Trade.objects.get(user=self.user)
+        self.assertNotIn('_counter_state', trade.__dict__)
+        trade.exit_price = Decimal('104')
+        trade.calculate_pnl()
+        trade.save()
+        self.assertEqual(self.user.discipline_sessions.get().realized_pnl, Decimal('38'))
+        self._assert_in_step()
+
+    def test_unlock_keeps_running_counters(self):
+        from unittest import mock
+        from django.utils import timezone
+        from discipline.models import DisciplineSession
+
+        today = timezone.localdate().isoformat()
+        self._trade(today, '09:30:00', '95')
+        session = self.user.discipline_sessions.get()
+        DisciplineSession.objects.filter(pk=session.pk).update(session_state='yellow')
+        save = DisciplineSession.save
+
+        def save_after_concurrent_trade(instance, *args, **kwargs):
+            # A trade saved by another request between the unlock's read and write
+            DisciplineSession.objects.filter(pk=instance.pk).update(trade_count=2, realized_pnl=Decimal('-100'))
+            return save(instance, *args, **kwargs)
+
+        with mock.patch.object(DisciplineSession, 'save', save_after_concurrent_trade):
+            response = self.client.post('/api/discipline/unlock/', {'action': 'complete_journal'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        session.refresh_from_db()
+        self.assertEqual((session.session_state, session.trade_count, session.realized_pnl),
+                         ('green', 2, Decimal('-100')))
+
+
+@override_settings(RULE_ENGINE_METRICS_SINKS=['rules.instrumentation.HistogramSink'])
+class RuleEngineMetricsTests(TestCase):
+    """Each evaluation reaches the configured sinks with its counts and state transition."""
+
+    def setUp(self):
+        from rules.instrumentation import HistogramSink, get_sink
+
+        cache.clear()
+        self.sink = get_sink(HistogramSink)
+        self.sink.reset()
+        self.user = User.objects.create_user(
+            username='metrics', email='metrics@example.com', password='pw', trading_capital=Decimal('100000'),
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_evaluation_is_recorded(self):
+        Rule.objects.create(
+            user=self.user, rule_name='one trade', category='risk', rule_type='soft',
+            trigger_scope='per_day', trigger_condition={'maxTrades': 1}, action='warn',
+        )
+        Rule.objects.create(
+            user=self.user, rule_name='big loss', category='risk', rule_type='hard',
+            trigger_scope='per_day', trigger_condition={'maxLoss': 5000}, action='lock',
+        )
+        self.client.post('/api/tradelog/trades/', _trade_payload(), format='json')
+
+        snapshot = self.sink.snapshot()
+        self.assertEqual(snapshot['evaluations'], 1)
+        self.assertEqual(snapshot['failures'], 0)
+        self.assertEqual(snapshot['rules_evaluated'], 2)
+        self.assertEqual(snapshot['rules_triggered'], 1)
+        self.assertEqual(snapshot['violations_logged'], 1)
+        self.assertEqual(snapshot['state_transitions'], {'green→yellow': 1})
+        self.assertEqual(snapshot['duration_ms']['count'], 1)
+        self.assertGreater(snapshot['queries']['sum'], 0)
+        self.assertIn('rule_engine_state_transitions_total{from="green",to="yellow"} 1', self.sink.prometheus())
+
+    @override_settings(RULE_ENGINE_METRICS_SINKS=[])
+    def test_disabled_by_default(self):
+        from rules.instrumentation import evaluation_span
+
+        session = self.user.discipline_sessions.create(session_date='2025-03-03')
+        with evaluation_span(self.user, session) as span:
+            self.assertFalse(hasattr(span, 'duration_ms'))
+
+
+@override_settings(RULE_EVALUATION_ASYNC=True, RULE_EVALUATION_WORKER_THREADS=0)
+class DeferredEvaluationTests(TestCase):
+    """Queued evaluations run after commit, and the lock check never misses one."""
+
+    def setUp(self):
+        from django.utils import timezone
+
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='deferred', email='deferred@example.com', password='pw', trading_capital=Decimal('100000'),
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.today = timezone.localdate().isoformat()
+        self.rule = Rule.objects.create(
+            user=self.user, rule_name='one trade', category='risk', rule_type='hard',
+            trigger_scope='per_day', trigger_condition={'maxTrades': 1}, action='lock',
+        )
+
+    def test_evaluation_runs_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/tradelog/trades/', _trade_payload(trade_date=self.today), format='json')
+        self.assertEqual(response.status_code, 201)
+        session = self.user.discipline_sessions.get()
+        self.assertEqual(session.session_state, 'red')
+        self.assertIsNone(session.evaluation_pending_since)
+        self.assertFalse(Trade.objects.get(pk=response.data['id']).is_disciplined)
+
+    def test_lock_check_runs_pending_evaluation(self):
+        first = self.client.post('/api/tradelog/trades/', _trade_payload(trade_date=self.today), format='json')
+        session = self.user.discipline_sessions.get()
+        # Not evaluated in the request
+        self.assertEqual(session.session_state, 'green')
+        self.assertIsNotNone(session.evaluation_pending_since)
+
+        response = self.client.post(
+            '/api/tradelog/trades/', _trade_payload(trade_date=self.today, symbol='TCS'), format='json',
+        )
+        self.assertEqual(response.status_code, 423)
+        session.refresh_from_db()
+        self.assertEqual(session.session_state, 'red')
+        self.assertIsNone(session.evaluation_pending_since)
+        self.assertEqual(session.rules_violated, [str(self.rule.id)])
+        self.assertFalse(Trade.objects.get(pk=first.data['id']).is_disciplined)
+
+
+    def test_failed_evaluation_stays_pending(self):
+        from unittest import mock
+        from rules.dispatch import run_pending_evaluation
+
+        self.client.post('/api/tradelog/trades/', _trade_payload(trade_date=self.today), format='json')
+        session = self.user.discipline_sessions.get()
+        with mock.patch('rules.plan.get_rule_plan', side_effect=RuntimeError('boom')), \
+                self.assertLogs('rules.engine', 'ERROR'):
+            self.assertFalse(run_pending_evaluation(self.user.pk, session.session_date))
+        session.refresh_from_db()
+        self.assertIsNotNone(session.evaluation_pending_since)
+
+        # The next lock check retries it
+        response = self.client.post(
+            '/api/tradelog/trades/', _trade_payload(trade_date=self.today, symbol='TCS'), format='json',
+        )
+        self.assertEqual(response.status_code, 423)
+        session.refresh_from_db()
+        self.assertEqual(session.session_state, 'red')
+        self.assertIsNone(session.evaluation_pending_since)
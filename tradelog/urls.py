@@ -1,8 +1,16 @@
 from django.urls import path
-from tradelog.views import TradeListCreateView, TradeDetailView, TradeImportView
+from tradelog.views import (
+    TradeListCreateView, TradeDetailView, TradeImportView, TradeBatchView, TradeExportView,
+    ImportJobDetailView, ImportJobErrorReportView, SyncChangesView,
+)
 
 urlpatterns = [
     path('trades/', TradeListCreateView.as_view(), name='trade-list-create'),
+    path('trades/export/', TradeExportView.as_view(), name='trade-export'),
+    path('trades/batch/', TradeBatchView.as_view(), name='trade-batch'),
     path('trades/import/', TradeImportView.as_view(), name='trade-import'),
+    path('trades/import/jobs/<uuid:pk>/', ImportJobDetailView.as_view(), name='trade-import-job'),
+    path('trades/import/jobs/<uuid:pk>/errors/', ImportJobErrorReportView.as_view(), name='trade-import-job-errors'),
     path('trades/<uuid:pk>/', TradeDetailView.as_view(), name='trade-detail'),
+    path('sync/', SyncChangesView.as_view(), name='sync-changes'),
 ]                                                     
\ No newline at end of file
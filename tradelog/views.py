@@ -1,15 +1,45 @@
-from rest_framework import generics, permissions, serializers, status
+import csv
+import json
+
+from rest_framework import exceptions, generics, permissions, serializers, status
 from rest_framework.response import Response
 from rest_framework.parsers import MultiPartParser, FormParser
+from rest_framework.utils.encoders import JSONEncoder
+from django.db import transaction
+from django.db.models import F
+from django.http import HttpResponse, StreamingHttpResponse
 from django.utils import timezone
-from decimal import Decimal
 
-from tradelog.models import Trade
-from tradelog.serializers import TradeManagementSerializer
-from .pagination import StandardResultsSetPagination
+from tradelog.models import Trade, ImportJob
+from tradelog.serializers import (
+    TradeManagementSerializer, ImportJobSerializer, TradeValuesRepresentation, TRADE_COMPACT_FIELDS,
+)
+from .filters import filter_trades
+from .idempotency import idempotent
+from .pagination import StandardResultsSetPagination, TradeCursorPagination, decode_cursor, encode_cursor
 
 # Import the parsing logic
-from .importers.parser import parse_csv, parse_excel, detect_and_normalize
+from .importers.parser import (
+    iter_upload_rows, detect_and_normalize, UnsupportedFileType, SUPPORTED_EXTENSIONS,
+)
+from .importers.lots import LotMatcher, LOT_METHODS
+from .importers.multi import ArchiveError, is_zip, read_uploads, parse_uploads, merged_rows
+from .importers.writer import run_import, get_session_for_date
+from .importers.jobs import enqueue_import_job
+
+# Only the first few failing rows are echoed back in the import response
+_MAX_REPORTED_ERRORS = 10
+
+# row   → one save (and one rule evaluation) per trade
+# batch → bulk insert per trade date, one rule evaluation per session
+_IMPORT_MODES = ('row', 'batch')
+
+# What to do with rows whose fingerprint was already imported
+_ON_DUPLICATE_CHOICES = ('skip', 'update')
+
+# Trade export formats and rows fetched per server-side cursor round trip
+_EXPORT_FORMATS = ('csv', 'ndjson')
+_EXPORT_CHUNK_SIZE = 2000
 
 
 # ─────────────────────────────────────────────
@@ -17,8 +47,13 @@ from .importers.parser import parse_csv, parse_excel, detect_and_normalize
 # ─────────────────────────────────────────────
 
 class TradeImportSerializer(serializers.Serializer):
-    file = serializers.FileField()
+    file = serializers.FileField(required=False)
+    files = serializers.ListField(child=serializers.FileField(), required=False)
     broker_name = serializers.CharField(required=False, allow_blank=True)
+    mode = serializers.ChoiceField(choices=_IMPORT_MODES, required=False)
+    on_duplicate = serializers.ChoiceField(choices=_ON_DUPLICATE_CHOICES, required=False)
+    lot_matching = serializers.ChoiceField(choices=LOT_METHODS, required=False)
+    background = serializers.BooleanField(required=False)
 
 
 # ─────────────────────────────────────────────
@@ -47,6 +82,81 @@ def _get_session_lock_response(user):
     return None
 
 
+# ─────────────────────────────────────────────
+# TRADE WRITE HELPER
+# ─────────────────────────────────────────────
+
+class TradeVersionConflict(Exception):
+    """The trade was edited by someone else since the client read it."""
+
+
+def _write_trade(trade, user, expected_version=None):
+    """
+    Save a manually entered/edited trade with a single INSERT or UPDATE.
+
+    P&L, tagging status and the session link are filled in before the write;
+    the post_save signal then evaluates rules (and flips is_disciplined only
+    if a hard violation points at the trade) inside the same transaction.
+
+    Edits bump trade.version. With `expected_version` (If-Match) the bump is
+    a conditional UPDATE, so of two concurrent edits of the same version only
+    one gets through; the other raises TradeVersionConflict before its save
+    and rule evaluation.
+    """
+    with transaction.atomic():
+        if not trade._state.adding:
+            if expected_version is not None:
+                bumped = Trade.objects.filter(pk=trade.pk, version=expected_version).update(
+                    version=expected_version + 1
+                )
+                if not bumped:
+                    raise TradeVersionConflict()
+                trade.version = expected_version + 1
+            else:
+                # Bumped in SQL so a concurrent edit can't leave two saves on one version
+                trade.version = F('version') + 1
+        trade.calculate_pnl()
+        trade.update_tagging_status()
+        trade.user = user
+        trade.session = get_session_for_date(user, trade.trade_date)
+        trade.save()
+        if hasattr(trade.version, 'resolve_expression'):
+            trade.refresh_from_db(fields=['version'])  # for the ETag
+
+        # Fix 2: Update strategy maturity based on latest trade count
+        if trade.strategy:
+            total = Trade.objects.filter(
+                strategy=trade.strategy, deleted_at__isnull=True
+            ).count()
+            trade.strategy.update_maturity(total)
+    return trade
+
+
+# ─────────────────────────────────────────────
+# TRADE FIELD SELECTION HELPER
+# ─────────────────────────────────────────────
+
+def _requested_trade_fields(request):
+    """
+    Parse `?fields=a,b,c` / `?view=compact`. Returns (fields, None) — fields
+    is empty when neither is given — or (None, HTTP 400 Response) for
+    unknown field names.
+    """
+    fields = request.query_params.get('fields', '')
+    if request.query_params.get('view') == 'compact':
+        return list(TRADE_COMPACT_FIELDS), None
+    if not fields:
+        return [], None
+    fields = list(dict.fromkeys(f.strip() for f in fields.split(',') if f.strip()))
+    unknown = set(fields) - TradeValuesRepresentation.field_names()
+    if unknown:
+        return None, Response(
+            {'error': f"Unknown fields: {', '.join(sorted(unknown))}."},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    return fields, None
+
+
 # ─────────────────────────────────────────────
 # API VIEWS
 # ─────────────────────────────────────────────
@@ -56,6 +166,16 @@ class TradeImportView(generics.GenericAPIView):
     POST /api/tradelog/trades/import/
     Accepts CSV or Excel file. Parses and imports trades.
     Supports: Generic CSV, Zerodha, Upstox, Groww formats.
+    Optional `mode=batch` bulk-inserts per trade date and evaluates rules
+    once per session instead of once per row.
+    Rows already imported earlier (same trade fingerprint) are skipped, or
+    refreshed with `on_duplicate=update`.
+    Optional `lot_matching=fifo|lifo` pairs broker execution legs into
+    round-trip trades across days instead of one VWAP trade per group.
+    Optional `background=true` queues an ImportJob and returns 202 with its id
+    right away; poll GET /api/tradelog/trades/import/jobs/<id>/ for progress.
+    Several files (`files`) or a .zip are parsed in parallel and written as
+    one batch import — see importers/multi.py. `mode=row` is rejected there.
 
     BUG FIX: Returns HTTP 423 if the user's discipline session is locked.
     """
@@ -63,77 +183,238 @@ class TradeImportView(generics.GenericAPIView):
     parser_classes = [MultiPartParser, FormParser]
     serializer_class = TradeImportSerializer
 
+    @idempotent
     def post(self, request, *args, **kwargs):
         # Allow import to proceed so that per-row dates are checked correctly.
         # Top-level block by today's date prevents importing back-dated trades.
 
-        file = request.FILES.get('file')
-        if not file:
+        uploads = request.FILES.getlist('files') or request.FILES.getlist('file')
+        if not uploads:
             return Response({'error': 'No file uploaded.'}, status=status.HTTP_400_BAD_REQUEST)
+        file = uploads[0]
+        many = len(uploads) > 1 or is_zip(file.name)
 
         broker_name = request.data.get('broker_name', '').strip().lower()
-        filename = file.name.lower()
+        mode = request.data.get('mode', '').strip().lower() or 'row'
+        if mode not in _IMPORT_MODES:
+            return Response(
+                {'error': f"Invalid mode. Choose one of: {', '.join(_IMPORT_MODES)}."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        on_duplicate = request.data.get('on_duplicate', '').strip().lower() or 'skip'
+        if on_duplicate not in _ON_DUPLICATE_CHOICES:
+            return Response(
+                {'error': f"Invalid on_duplicate. Choose one of: {', '.join(_ON_DUPLICATE_CHOICES)}."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
 
-        try:
-            if filename.endswith('.csv'):
-                raw_rows = parse_csv(file)
-            elif filename.endswith(('.xlsx', '.xls')):
-                raw_rows = parse_excel(file)
-            else:
+        lot_matching = request.data.get('lot_matching', '').strip().lower()
+        if lot_matching and lot_matching not in LOT_METHODS:
+            return Response(
+                {'error': f"Invalid lot_matching. Choose one of: {', '.join(LOT_METHODS)}."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        background = str(request.data.get('background', '')).strip().lower() in ('1', 'true', 'yes')
+
+        if many:
+            if background or lot_matching:
                 return Response(
-                    {'error': 'Unsupported file type. Upload CSV or Excel.'},
+                    {'error': 'background and lot_matching need a single CSV or Excel file.'},
                     status=status.HTTP_400_BAD_REQUEST
                 )
+            # Several files are always written as one batch import; an explicit
+            # mode=row would otherwise be silently ignored.
+            if request.data.get('mode', '').strip().lower() == 'row':
+                return Response(
+                    {'error': 'mode=row needs a single CSV or Excel file; several files are imported in batch mode.'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            return self._import_many(request, uploads, broker_name, on_duplicate)
+
+        if background:
+            return self._queue_job(request, file, broker_name, mode, on_duplicate, lot_matching)
+
+        try:
+            raw_rows = iter_upload_rows(file, file.name)
+        except UnsupportedFileType as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
             return Response({'error': f'File parsing failed: {str(e)}'}, status=status.HTTP_400_BAD_REQUEST)
 
         # Detect broker format and normalize rows into standard trade dicts
+        detected_formats = {}
+        lots = LotMatcher(lot_matching, user=request.user) if lot_matching else None
         try:
-            detected_broker, rows = detect_and_normalize(raw_rows, broker_name)
+            detected_broker, rows = detect_and_normalize(
+                raw_rows, broker_name, formats=detected_formats, lots=lots,
+            )
         except Exception as e:
             return Response({'error': f'Format normalization failed: {str(e)}'}, status=status.HTTP_400_BAD_REQUEST)
 
-        created_trades = []
-        errors = []
+        # Rows are consumed lazily from the parser, so only counters and the
+        # first few errors are kept in memory while the file streams through.
+        try:
+            stats = run_import(
+                rows, request.user, detected_broker or broker_name,
+                mode=mode, on_duplicate=on_duplicate, max_errors=_MAX_REPORTED_ERRORS,
+                detected_formats=detected_formats,
+            )
+        except Exception as e:
+            # Parsing is lazy, so malformed input can surface mid-import
+            return Response({'error': f'File parsing failed: {str(e)}'}, status=status.HTTP_400_BAD_REQUEST)
 
-        for i, row in enumerate(rows, start=1):
-            # Session lock is now checked inside _create_trade_from_row
-            # per-row based on the actual trade date.
+        return Response({
+            'imported': stats.imported,
+            'failed': stats.failed,
+            'blocked': stats.blocked,
+            'skipped': stats.skipped,
+            'updated': stats.updated,
+            'errors': stats.errors,
+            'detected_broker': detected_broker,
+            'detected_formats': stats.detected_formats,
+            'message': f'{stats.imported} trades imported successfully.'
+        }, status=status.HTTP_201_CREATED)
+
+    def _import_many(self, request, uploads, broker_name, on_duplicate):
+        """
+        Parse every file in a process pool, then write all rows in one batch
+        import so each session date is evaluated once.
+        """
+        try:
+            results = parse_uploads(read_uploads(uploads), broker_name)
+        except ArchiveError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        files = [
+            {'filename': r['filename'], 'error': r['error']} if 'error' in r else {
+                'filename': r['filename'],
+                'detected_broker': r['detected_broker'],
+                'detected_formats': r['detected_formats'],
+                'rows': len(r['rows']),
+            }
+            for r in results
+        ]
+        if all('error' in r for r in results):
+            return Response(
+                {'error': 'File parsing failed for every file.', 'files': files},
+                status=status.HTTP_400_BAD_REQUEST
+            )
 
-            try:
-                trade = _create_trade_from_row(row, request.user, detected_broker or broker_name)
-                created_trades.append(trade)
-            except Exception as e:
-                errors.append({'row': i, 'error': str(e), 'data': row})
+        stats = run_import(
+            merged_rows(results), request.user, broker_name,
+            mode='batch', on_duplicate=on_duplicate, max_errors=_MAX_REPORTED_ERRORS,
+        )
 
         return Response({
-            'imported': len(created_trades),
-            'failed': len(errors),
-            'errors': errors[:10],
-            'detected_broker': detected_broker,
-            'message': f'{len(created_trades)} trades imported successfully.'
+            'imported': stats.imported,
+            'failed': stats.failed,
+            'blocked': stats.blocked,
+            'skipped': stats.skipped,
+            'updated': stats.updated,
+            'errors': stats.errors,
+            'files': files,
+            'message': f'{stats.imported} trades imported successfully from {len(files)} files.'
         }, status=status.HTTP_201_CREATED)
 
+    def _queue_job(self, request, file, broker_name, mode, on_duplicate, lot_matching):
+        if not file.name.lower().endswith(SUPPORTED_EXTENSIONS):
+            return Response(
+                {'error': 'Unsupported file type. Upload CSV or Excel.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        job = ImportJob.objects.create(
+            user=request.user,
+            file=file,
+            original_filename=file.name,
+            broker_name=broker_name,
+            mode=mode,
+            on_duplicate=on_duplicate,
+            lot_matching=lot_matching,
+        )
+        enqueue_import_job(job)
+        return Response({
+            'job_id': str(job.id),
+            'status': job.status,
+            'message': 'Import queued.',
+        }, status=status.HTTP_202_ACCEPTED)
+
+
+class ImportJobDetailView(generics.RetrieveAPIView):
+    """GET /api/tradelog/trades/import/jobs/<id>/ — progress and result counters."""
+    serializer_class = ImportJobSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        return ImportJob.objects.filter(user=self.request.user).defer('errors')
+
+
+class ImportJobErrorReportView(generics.GenericAPIView):
+    """GET /api/tradelog/trades/import/jobs/<id>/errors/ — per-row error report as CSV."""
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        return ImportJob.objects.filter(user=self.request.user)
+
+    def get(self, request, *args, **kwargs):
+        job = self.get_object()
+
+        response = HttpResponse(content_type='text/csv')
+        response['Content-Disposition'] = f'attachment; filename="import-{job.id}-errors.csv"'
+        writer = csv.writer(response)
+        writer.writerow(['row', 'error', 'data'])
+        for err in job.errors or []:
+            writer.writerow([err.get('row'), err.get('error'), json.dumps(err.get('data'), default=str)])
+        return response
+
 
 class TradeListCreateView(generics.ListCreateAPIView):
-    """GET /api/tradelog/trades/  POST /api/tradelog/trades/"""
+    """
+    GET /api/tradelog/trades/  POST /api/tradelog/trades/
+
+    `?pagination=cursor` switches the list to keyset pagination (no COUNT,
+    no OFFSET); add `?count=true` to get the total anyway.
+    `?fields=a,b,c` (or `?view=compact`) returns only those columns, read
+    with .values() instead of full model instances.
+    Filter parameters are listed in tradelog/filters.py.
+    """
     serializer_class = TradeManagementSerializer
     permission_classes = [permissions.IsAuthenticated]
     pagination_class = StandardResultsSetPagination
 
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            if self.request.query_params.get('pagination') == 'cursor':
+                self._paginator = TradeCursorPagination()
+            else:
+                self._paginator = self.pagination_class()
+        return self._paginator
+
     def get_queryset(self):
         qs = Trade.objects.filter(user=self.request.user, deleted_at__isnull=True)
-        trade_filter = self.request.query_params.get('filter')
-        if trade_filter == 'wins':
-            qs = qs.filter(total_pnl__gt=0)
-        elif trade_filter == 'losses':
-            qs = qs.filter(total_pnl__lt=0)
-        elif trade_filter == 'disciplined':
-            qs = qs.filter(is_disciplined=True)
-        elif trade_filter == 'violations':
-            qs = qs.filter(is_disciplined=False)
+        if self.request.method == 'GET':
+            qs = filter_trades(qs, self.request.query_params)
         return qs
 
+    def list(self, request, *args, **kwargs):
+        fields, error_response = _requested_trade_fields(request)
+        if error_response:
+            return error_response
+        if not fields:
+            return super().list(request, *args, **kwargs)
+
+        # The ordering/cursor columns are always read, even if not returned
+        columns = list(dict.fromkeys(fields + ['id', 'trade_date', 'trade_time']))
+        queryset = self.filter_queryset(self.get_queryset()).values(*columns)
+        page = self.paginate_queryset(queryset)
+        data = TradeValuesRepresentation(fields)(page if page is not None else queryset)
+        if page is not None:
+            return self.get_paginated_response(data)
+        return Response(data)
+
+    @idempotent
     def create(self, request, *args, **kwargs):
         # BUG FIX: Block manual trade entry when session is locked
         lock_response = _get_session_lock_response(request.user)
@@ -142,21 +423,9 @@ class TradeListCreateView(generics.ListCreateAPIView):
         return super().create(request, *args, **kwargs)
 
     def perform_create(self, serializer):
-        trade = serializer.save(user=self.request.user)
-        trade.calculate_pnl()
-
-        # Fix 5: Auto-mark tagging complete when all required fields are present
-        if trade.strategy and trade.emotional_state and trade.entry_confidence:
-            trade.is_tagged_complete = True
-
-        trade.save(update_fields=['total_pnl', 'is_tagged_complete'])
-
-        # Fix 2: Update strategy maturity based on latest trade count
-        if trade.strategy:
-            total = Trade.objects.filter(
-                strategy=trade.strategy, deleted_at__isnull=True
-            ).count()
-            trade.strategy.update_maturity(total)
+        # Built here rather than via serializer.save() so P&L, tagging
+        # (Fix 5) and the session go out in the one INSERT.
+        serializer.instance = _write_trade(Trade(**serializer.validated_data), self.request.user)
 
         # Rule evaluation is handled by the post_save signal in discipline/signals.py
         # which always fetches a fresh session from the DB. Do NOT call
@@ -165,120 +434,250 @@ class TradeListCreateView(generics.ListCreateAPIView):
         # has already correctly set it to RED.
 
 
+class _Echo:
+    """File-like object whose write() returns the line, for streaming csv.writer output."""
+
+    def write(self, value):
+        return value
+
+
+class TradeExportView(generics.GenericAPIView):
+    """
+    GET /api/tradelog/trades/export/?export_format=csv|ndjson
+
+    Streams every matching trade — same filter parameters and `fields` /
+    `view` as the trade list, same ordering — without paginating. Rows are
+    read through a server-side cursor in chunks of _EXPORT_CHUNK_SIZE, so
+    memory stays flat however many trades are exported.
+    (`format` is taken by DRF's renderer override, hence `export_format`.)
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def perform_content_negotiation(self, request, force=False):
+        # The stream is not rendered by DRF, so a CSV/NDJSON Accept header
+        # must not fail negotiation (errors still render as JSON)
+        return super().perform_content_negotiation(request, force=True)
+
+    def get(self, request, *args, **kwargs):
+        export_format = request.query_params.get('export_format', 'csv')
+        if export_format not in _EXPORT_FORMATS:
+            return Response(
+                {'error': f"Invalid export_format. Choose one of: {', '.join(_EXPORT_FORMATS)}."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        fields, error_response = _requested_trade_fields(request)
+        if error_response:
+            return error_response
+        fields = fields or list(TradeManagementSerializer().fields)
+
+        # Validated here so bad parameters are a 400, not a broken stream
+        qs = filter_trades(
+            Trade.objects.filter(user=request.user, deleted_at__isnull=True), request.query_params
+        )
+        rows = qs.order_by('-trade_date', '-trade_time', '-id').values(*fields).iterator(
+            chunk_size=_EXPORT_CHUNK_SIZE
+        )
+        representation = TradeValuesRepresentation(fields)
+        items = map(representation.represent, rows)
+
+        if export_format == 'ndjson':
+            content = (json.dumps(item, cls=JSONEncoder) + '\n' for item in items)
+            content_type = 'application/x-ndjson'
+        else:
+            content = self._csv_lines(fields, items)
+            content_type = 'text/csv'
+
+        response = StreamingHttpResponse(content, content_type=content_type)
+        filename = f"trades-{timezone.localdate():%Y%m%d}.{export_format}"
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+    @staticmethod
+    def _csv_lines(fields, items):
+        writer = csv.writer(_Echo())
+        yield writer.writerow(fields)
+        for item in items:
+            yield writer.writerow([
+                '' if value is None
+                else json.dumps(value, cls=JSONEncoder) if isinstance(value, (list, dict))
+                else value
+                for value in (item[name] for name in fields)
+            ])
+
+
+class SyncChangesView(generics.GenericAPIView):
+    """
+    GET /api/tradelog/sync/?cursor=<cursor>&collections=trades,journals,sessions&limit=200
+
+    Delta feed for offline clients: rows created/updated since the cursor
+    plus tombstones for deleted ones. Keep calling with the returned cursor
+    while has_more is true, then store it for the next sync. See sync.py.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        from .sync import SYNC_COLLECTIONS, SYNC_DEFAULT_LIMIT, SYNC_MAX_LIMIT, parse_since, sync_changes
+
+        collections = request.query_params.get('collections')
+        collections = [c.strip() for c in collections.split(',') if c.strip()] if collections else list(SYNC_COLLECTIONS)
+        unknown = set(collections) - set(SYNC_COLLECTIONS)
+        if unknown:
+            return Response(
+                {'error': f"Unknown collections: {', '.join(sorted(unknown))}. Choose from: {', '.join(SYNC_COLLECTIONS)}."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            limit = min(max(int(request.query_params.get('limit', SYNC_DEFAULT_LIMIT)), 1), SYNC_MAX_LIMIT)
+        except ValueError:
+            return Response({'error': 'limit must be an integer.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        positions, since = {}, None
+        try:
+            if request.query_params.get('cursor'):
+                positions = decode_cursor(request.query_params['cursor'])
+            elif request.query_params.get('since'):
+                since = parse_since(request.query_params['since'])
+            changes, positions, has_more = sync_changes(
+                request.user, positions=positions, since=since, collections=collections, limit=limit,
+            )
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({
+            'changes': changes,
+            'cursor': encode_cursor(positions),
+            'has_more': has_more,
+        })
+
+
+class TradeBatchView(generics.GenericAPIView):
+    """
+    POST /api/tradelog/trades/batch/
+
+    Body: {"operations": [{"op": "create", "data": {...}},
+                          {"op": "update", "id": "<uuid>", "data": {...}},
+                          {"op": "delete", "id": "<uuid>"}]}
+
+    All-or-nothing: if any item is invalid, nothing is saved and the response
+    (400) lists the errors per item. Rules are evaluated once per affected
+    session date rather than once per trade.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    @idempotent
+    def post(self, request, *args, **kwargs):
+        from .batch import apply_trade_batch, TradeBatchError
+
+        operations = request.data.get('operations') if isinstance(request.data, dict) else None
+
+        # Same gate as POST /trades/: no new trades while the session is locked
+        if isinstance(operations, list) and any(
+            isinstance(op, dict) and op.get('op') == 'create' for op in operations
+        ):
+            lock_response = _get_session_lock_response(request.user)
+            if lock_response:
+                return lock_response
+
+        try:
+            results = apply_trade_batch(request.user, operations, context={'request': request})
+        except TradeBatchError as e:
+            body = {'error': str(e)}
+            if e.results:
+                body['results'] = e.results
+            return Response(body, status=status.HTTP_400_BAD_REQUEST)
+
+        counts = {status_: sum(1 for r in results if r['status'] == status_)
+                  for status_ in ('created', 'updated', 'deleted')}
+        return Response({**counts, 'results': results}, status=status.HTTP_200_OK)
+
+
+class PreconditionFailed(exceptions.APIException):
+    status_code = status.HTTP_412_PRECONDITION_FAILED
+    default_detail = 'The trade was modified by another request. Reload it and retry.'
+    default_code = 'precondition_failed'
+
+
+def _trade_etag(trade):
+    return f'"{trade.version}"'
+
+
+def _parse_etags(header):
+    """If-Match / If-None-Match → set of versions (as strings), or None for '*'."""
+    tags = set()
+    for tag in header.split(','):
+        tag = tag.strip()
+        if tag == '*':
+            return None
+        if tag.startswith('W/'):
+            tag = tag[2:]
+        tags.add(tag.strip('"'))
+    return tags
+
+
 class TradeDetailView(generics.RetrieveUpdateDestroyAPIView):
-    """GET/PUT/PATCH/DELETE /api/tradelog/trades/<id>/"""
+    """
+    GET/PUT/PATCH/DELETE /api/tradelog/trades/<id>/
+
+    Responses carry `ETag: "<version>"`. Sending it back as `If-Match` on
+    PUT/PATCH/DELETE makes the write conditional: if the trade changed in
+    the meantime the request fails with 412 before anything is written or
+    re-evaluated. Without If-Match the last write wins, as before.
+    """
     serializer_class = TradeManagementSerializer
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
         return Trade.objects.filter(user=self.request.user, deleted_at__isnull=True)
 
-    def perform_update(self, serializer):
-        trade = serializer.save()
-        trade.calculate_pnl()
-
-        # Fix 5: Auto-mark tagging complete when all required fields are present
-        if trade.strategy and trade.emotional_state and trade.entry_confidence:
-            trade.is_tagged_complete = True
-
-        trade.save(update_fields=['total_pnl', 'is_tagged_complete'])
+    def get_object(self):
+        trade = super().get_object()
+        if_match = self.request.headers.get('If-Match')
+        if if_match and self.request.method in ('PUT', 'PATCH', 'DELETE'):
+            tags = _parse_etags(if_match)
+            if tags is not None:
+                if str(trade.version) not in tags:
+                    raise PreconditionFailed()
+                self.expected_version = trade.version
+        return trade
+
+    def retrieve(self, request, *args, **kwargs):
+        trade = self.get_object()
+        etag = _trade_etag(trade)
+        if_none_match = request.headers.get('If-None-Match')
+        if if_none_match:
+            tags = _parse_etags(if_none_match)
+            if tags is None or str(trade.version) in tags:
+                return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+        return Response(self.get_serializer(trade).data, headers={'ETag': etag})
+
+    def update(self, request, *args, **kwargs):
+        response = super().update(request, *args, **kwargs)
+        response['ETag'] = _trade_etag(self.trade)
+        return response
 
-        # Fix 2: Update strategy maturity based on latest trade count
-        if trade.strategy:
-            total = Trade.objects.filter(
-                strategy=trade.strategy, deleted_at__isnull=True
-            ).count()
-            trade.strategy.update_maturity(total)
+    def perform_update(self, serializer):
+        trade = serializer.instance
+        for attr, value in serializer.validated_data.items():
+            setattr(trade, attr, value)
+        try:
+            _write_trade(trade, self.request.user, expected_version=getattr(self, 'expected_version', None))
+        except TradeVersionConflict:
+            raise PreconditionFailed()
+        self.trade = trade
 
         # Rule evaluation handled by post_save signal — see perform_create comment.
 
     def destroy(self, request, *args, **kwargs):
         trade = self.get_object()
         trade.deleted_at = timezone.now()
-        trade.save()
+        expected_version = getattr(self, 'expected_version', None)
+        with transaction.atomic():
+            if expected_version is not None and not Trade.objects.filter(
+                pk=trade.pk, version=expected_version
+            ).update(version=expected_version + 1):
+                raise PreconditionFailed()
+            trade.version = expected_version + 1 if expected_version is not None else F('version') + 1
+            trade.save()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
-
-# ─────────────────────────────────────────────
-# TRADE CREATION HELPER
-# ─────────────────────────────────────────────
-
-def _create_trade_from_row(row, user, broker_name):
-    """Create and save a Trade instance from a normalized row dict."""
-    from datetime import datetime, date as ddate
-    from discipline.models import DisciplineSession
-
-    symbol = row.get('symbol') or row.get('scrip', '')
-    direction = (row.get('direction') or row.get('trade_type', 'long')).lower()
-    quantity = Decimal(str(row.get('quantity') or row.get('qty', 1)))
-    entry_price = Decimal(str(row.get('entry_price') or row.get('buy_price', 0)))
-    exit_price_raw = row.get('exit_price') or row.get('sell_price', '')
-    exit_price = Decimal(str(exit_price_raw)) if exit_price_raw else None
-    fees = Decimal(str(row.get('fees') or row.get('brokerage', 0)))
-
-    # Date parsing — strip any time component first (e.g. Upstox sends "2026-02-24 00:00:00")
-    date_raw = row.get('date') or row.get('trade_date', '')
-    if date_raw and ' ' in str(date_raw):
-        date_raw = str(date_raw).split(' ')[0]
-    trade_date = ddate.today()
-    for fmt in ('%Y-%m-%d', '%d-%m-%Y', '%d/%m/%Y', '%m/%d/%Y'):
-        try:
-            trade_date = datetime.strptime(date_raw, fmt).date()
-            break
-        except (ValueError, TypeError):
-            continue
-
-    # Time parsing
-    time_raw = row.get('time') or row.get('trade_time', '')
-    trade_time = None
-    if time_raw:
-        try:
-            from datetime import time as dtime
-            parts = time_raw.split(':')
-            trade_time = dtime(
-                int(parts[0]),
-                int(parts[1]),
-                int(parts[2]) if len(parts) > 2 else 0
-            )
-        except Exception:
-            pass
-
-    from rules.engine import is_session_locked
-    locked, lock_msg = is_session_locked(user, date=trade_date)
-    if locked:
-        raise ValueError(f"Trade blocked — session locked: {lock_msg}")
-
-    # Get or create a discipline session for this trade date
-    session, _ = DisciplineSession.objects.get_or_create(
-        user=user, session_date=trade_date, defaults={'session_state': 'green'}
-    )
-
-    trade = Trade(
-        user=user,
-        session=session,
-        trade_date=trade_date,
-        trade_time=trade_time,
-        symbol=symbol or 'UNKNOWN',
-        market_type=row.get('market_type', 'indian_stocks'),
-        direction='long' if direction in ('long', 'buy', 'b') else 'short',
-        quantity=quantity,
-        entry_price=entry_price,
-        exit_price=exit_price,
-        fees=fees,
-        import_source='csv_import',
-        broker_name=broker_name,
-        is_tagged_complete=False,
-    )
-    trade.calculate_pnl()
-    trade.save()
-
-    # Update strategy maturity after import
-    if trade.strategy:
-        total = Trade.objects.filter(
-            strategy=trade.strategy, deleted_at__isnull=True
-        ).count()
-        trade.strategy.update_maturity(total)
-
-    # Rule evaluation handled by post_save signal — see perform_create comment.
-
-    return trade
\ No newline at end of file